@@ -2,18 +2,16 @@ import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
 import csv
 import os
-import pandas as pd
-import cv2
+import importlib.util
 # --- FIX: Renamed the imported 'time' class to 'dt_time' to avoid conflict with the 'time' module ---
 from datetime import datetime, time as dt_time, timedelta
+from collections import OrderedDict, deque, namedtuple
 from PIL import Image, ImageTk
 import ttkbootstrap as bstrap
 from ttkbootstrap.toast import ToastNotification
 from ttkbootstrap.widgets import DateEntry
-import face_recognition
 import numpy as np
 import pickle
-from scipy.spatial import distance as dist
 import shutil
 import threading
 import configparser
@@ -22,12 +20,3741 @@ import sys
 # --- FIX: This is the standard 'time' module, which will no longer be overwritten ---
 import time
 import re
+import json
+import hashlib
+import hmac
+import contextlib
+import io
+import argparse
+import gzip
+import uuid
+import socket
+import urllib.request
+import struct
+import socketserver
+import queue
+import asyncio
+import inspect
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from email.utils import formatdate, parsedate_to_datetime
 
 try:
     import winsound
 except ImportError:
     winsound = None
 
+
+class LazyModule:
+    """
+    Stands in for a heavy module and imports it on first attribute access, so that
+    pandas, OpenCV, dlib models and pyarrow load off the startup path.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Imports the module (once) and returns it."""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def is_available(self):
+        """Returns True if the module can be imported, without importing it."""
+        return self._module is not None or importlib.util.find_spec(self._name.split('.')[0]) is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+pd = LazyModule('pandas')
+cv2 = LazyModule('cv2')
+face_recognition = LazyModule('face_recognition')
+pa = LazyModule('pyarrow')
+pq = LazyModule('pyarrow.parquet')
+
+# Reference point for startup timings.
+PROCESS_START = time.perf_counter()
+
+
+class StartupProfiler:
+    """Times startup phases and milestones such as time-to-first-recognition."""
+    def __init__(self, start=PROCESS_START):
+        self.start = start
+        self.phases = {}
+        self.milestones = {}
+        self.lock = threading.Lock()
+
+    def phase(self, name):
+        """Context manager that records how long a phase takes."""
+        profiler = self
+
+        class _Phase:
+            def __enter__(self):
+                self.began = time.perf_counter()
+            def __exit__(self, exc_type, exc, tb):
+                elapsed = time.perf_counter() - self.began
+                with profiler.lock:
+                    profiler.phases[name] = elapsed
+                print(f"[Startup] {name}: {elapsed:.2f}s" + (" (failed)" if exc_type else ""))
+                return False
+        return _Phase()
+
+    def mark(self, name):
+        """Records a milestone (seconds since process start) the first time it is reached."""
+        with self.lock:
+            if name in self.milestones:
+                return
+            self.milestones[name] = time.perf_counter() - self.start
+        print(f"[Startup] {name} reached after {self.milestones[name]:.2f}s")
+
+    def summary(self):
+        """Returns the recorded phases and milestones as display lines."""
+        with self.lock:
+            lines = [f"{name}: {secs:.2f}s" for name, secs in self.phases.items()]
+            lines += [f"{name}: +{secs:.2f}s" for name, secs in sorted(self.milestones.items(), key=lambda m: m[1])]
+        return lines
+
+
+def fsync_path(path):
+    """Flushes a file, or on POSIX a directory entry, to disk. Best effort."""
+    try:
+        fd = os.open(path, os.O_RDWR if os.path.isfile(path) else os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _read_checksums(path):
+    try:
+        with open(path + '.sha256', 'r') as f:
+            entries = json.load(f)
+        return entries if isinstance(entries, list) else []
+    except (OSError, ValueError):
+        return []
+
+
+def atomic_write(path, data, durable=True, checksum=True):
+    """
+    Replaces a file crash-safely: the bytes go to a temp file next to it, which is
+    fsynced (if durable) and renamed over the target with os.replace, so a crash
+    leaves the old or the new file, never a torn one. With checksum=True a
+    '<file>.sha256' sidecar is written first; it keeps the previous checksum
+    too, so a crash between the two renames still validates.
+    """
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    if checksum:
+        stat = os.stat(tmp_file)
+        entry = {'sha256': hashlib.sha256(data).hexdigest(), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        with open(path + '.sha256.tmp', 'w') as f:
+            json.dump([entry] + _read_checksums(path)[:1], f)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(path + '.sha256.tmp', path + '.sha256')
+    os.replace(tmp_file, path)
+    if durable:
+        fsync_path(os.path.dirname(os.path.abspath(path)))
+
+
+def verify_checksum(path, data):
+    """
+    Checks a file's content against its atomic_write sidecar. Only fails if the
+    file still has the modification time of a checksummed write but different
+    bytes; files without a sidecar, or changed since by appends or other
+    programs, pass.
+    """
+    entries = _read_checksums(path)
+    if not entries:
+        return True
+    digest = hashlib.sha256(data).hexdigest()
+    if any(entry.get('sha256') == digest for entry in entries):
+        return True
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return True
+    return not any(entry.get('mtime_ns') == mtime_ns for entry in entries)
+
+
+class ScanEventWAL:
+    """
+    Write-ahead log of scan events. log_attendance appends one JSON line per
+    scan and flushes it to the OS before it rewrites the attendance partition; a
+    background thread fsyncs the log at most every 'sync_interval' seconds, so
+    logging never waits for the disk. The same thread runs the 'flushers' (e.g.
+    fsyncing the partitions written meanwhile), keeping that off the Tk thread.
+    After an unclean shutdown the events are replayed on startup; the log is
+    truncated once its effects are on disk.
+    """
+    def __init__(self, path, sync_interval=0.5, flushers=()):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.flushers = list(flushers)
+        self.file = None
+        self.pending = False
+        self.appended = 0
+        self.syncs = 0
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Opens the log for appending and starts the background fsync thread."""
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self.thread.start()
+
+    def append(self, record):
+        """Appends one event; it reaches the OS immediately and the disk within sync_interval."""
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.pending = True
+            self.appended += 1
+
+    def _sync_loop(self):
+        while not self._stop.wait(self.sync_interval):
+            self.sync()
+            for flush in self.flushers:
+                try:
+                    flush()
+                except Exception as e:
+                    logging.error(f"Background flush failed: {e}")
+
+    def sync(self):
+        """fsyncs the log if anything was appended since the last sync."""
+        with self.lock:
+            if not self.pending or self.file is None:
+                return
+            self.pending = False
+            fd = self.file.fileno()
+        try:
+            os.fsync(fd)
+            self.syncs += 1
+        except OSError as e:
+            logging.error(f"Could not fsync {self.path}: {e}")
+
+    def read(self):
+        """Returns the logged events. A torn last line from a crash is skipped."""
+        records = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        logging.warning(f"Skipping a damaged line in {self.path}.")
+        except FileNotFoundError:
+            pass
+        return records
+
+    def truncate(self):
+        """Empties the log. Call only after the logged events are durably stored."""
+        with self.lock:
+            if self.file is None:
+                open(self.path, 'w').close()
+                return
+            self.file.seek(0)
+            self.file.truncate()
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = False
+
+    def close(self):
+        self._stop.set()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+        self.sync()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def stats(self):
+        """Returns the log counters as display lines."""
+        return [f"scan WAL: {self.appended} appended, {self.syncs} fsyncs, pending: {'yes' if self.pending else 'no'}"]
+
+
+class AttendanceSchema:
+    """
+    In-memory column types for the roster and the attendance and scan logs:
+    int64 ID, categorical Name, datetime64 Date and int32 seconds since midnight
+    for clock times (NO_TIME when empty). The CSV files keep their text format;
+    frames are converted once when loaded ('typed') and back when written
+    ('to_text'). Both conversions only touch columns not already converted.
+    Rows that cannot be converted are split off as text ('split') so writers can
+    put them back unchanged.
+    """
+    TIME_FORMAT = '%I:%M:%S %p'
+    # Also accepted when reading (hand-edited files); written back in TIME_FORMAT.
+    LENIENT_TIME_FORMATS = ('%I:%M %p', '%H:%M:%S', '%H:%M')
+    TIME_COLUMNS = ('TimeIn', 'TimeOut', 'Time')
+    NO_TIME = -1
+
+    @staticmethod
+    def seconds(when):
+        """Returns the seconds since midnight of a datetime."""
+        return when.hour * 3600 + when.minute * 60 + when.second
+
+    @classmethod
+    def _parse_clock(cls, values):
+        """Parses time strings (TIME_FORMAT first, then the lenient formats). Returns (seconds, invalid mask)."""
+        text = pd.Series(values).astype('string').str.strip()
+        parsed = pd.to_datetime(text, format=cls.TIME_FORMAT, errors='coerce')
+        for fmt in cls.LENIENT_TIME_FORMATS:
+            missing = parsed.isna() & text.fillna('').ne('')
+            if not missing.any():
+                break
+            parsed = parsed.where(~missing, pd.to_datetime(text.where(missing), format=fmt, errors='coerce'))
+        seconds = parsed.dt.hour * 3600 + parsed.dt.minute * 60 + parsed.dt.second
+        invalid = (parsed.isna() & text.fillna('').ne('')).to_numpy()
+        return seconds.fillna(cls.NO_TIME).astype('int32'), invalid
+
+    @classmethod
+    def parse_times(cls, values):
+        """Converts 'HH:MM:SS AM' strings to int32 seconds since midnight (NO_TIME when empty or invalid)."""
+        return cls._parse_clock(values)[0]
+
+    @classmethod
+    def format_time(cls, seconds):
+        """Formats seconds since midnight as 'HH:MM:SS AM', or '' for NO_TIME."""
+        if seconds is None or seconds < 0:
+            return ''
+        return (datetime.min + timedelta(seconds=int(seconds))).strftime(cls.TIME_FORMAT)
+
+    @classmethod
+    def format_times(cls, seconds):
+        """Vectorized format_time for a Series."""
+        seconds = pd.Series(seconds)
+        text = pd.to_datetime(seconds.clip(lower=0), unit='s').dt.strftime(cls.TIME_FORMAT)
+        return text.where(seconds >= 0, '')
+
+    @classmethod
+    def split(cls, df):
+        """
+        Converts a frame read from CSV to the typed schema. Returns (typed frame,
+        text frame of the rows that could not be converted): an ID that is not an
+        integer in the int64 range, a Date that is not YYYY-MM-DD, or a clock time
+        in no known format. The text rows are None when every row converted.
+        """
+        if df is None:
+            return None, None
+        original = df
+        df = df.copy()
+        valid = pd.Series(True, index=df.index)
+        if not pd.api.types.is_integer_dtype(df['ID']):
+            # Parsed as text, not float, so large IDs are neither rounded nor wrapped.
+            ids = df['ID'].astype('string').str.strip()
+            numeric = ids.str.fullmatch(r'[+-]?\d+').fillna(False)
+            in_range = ids.where(numeric).str.lstrip('+-').str.len().fillna(99) <= 18
+            valid &= numeric & in_range
+            df['ID'] = pd.to_numeric(ids.where(valid), errors='coerce')
+        if 'Date' in df and not pd.api.types.is_datetime64_any_dtype(df['Date']):
+            dates = pd.to_datetime(df['Date'], format='%Y-%m-%d', errors='coerce')
+            valid &= dates.notna()
+            df['Date'] = dates
+        for col in cls.TIME_COLUMNS:
+            if col in df and not pd.api.types.is_integer_dtype(df[col]):
+                seconds, invalid = cls._parse_clock(df[col])
+                valid &= ~invalid
+                df[col] = seconds.to_numpy(dtype='int32')
+        raw = None
+        if not valid.all():
+            raw = original[~valid.to_numpy()].reset_index(drop=True)
+            logging.warning(f"{len(raw)} rows could not be parsed and are kept as text: {raw.head(3).to_dict('records')}")
+            df = df[valid]
+        df['ID'] = df['ID'].astype('int64')
+        if 'Name' in df and not isinstance(df['Name'].dtype, pd.CategoricalDtype):
+            df['Name'] = df['Name'].fillna('').astype(str).astype('category')
+        for col in cls.TIME_COLUMNS:
+            if col in df:
+                df[col] = df[col].to_numpy(dtype='int32')
+        return df.reset_index(drop=True), raw
+
+    @classmethod
+    def typed(cls, df):
+        """
+        Converts a frame read from CSV to the typed schema, leaving out rows that
+        cannot be converted (see split). Use split when the frame is written back.
+        """
+        return cls.split(df)[0]
+
+    @classmethod
+    def to_text(cls, df, raw=None):
+        """Converts typed columns back to the CSV text format, appending the unconverted 'raw' rows."""
+        df = df.copy()
+        if pd.api.types.is_integer_dtype(df['ID']):
+            df['ID'] = df['ID'].astype(str)
+        if 'Name' in df and isinstance(df['Name'].dtype, pd.CategoricalDtype):
+            df['Name'] = df['Name'].astype(str)
+        if 'Date' in df and pd.api.types.is_datetime64_any_dtype(df['Date']):
+            df['Date'] = df['Date'].dt.strftime('%Y-%m-%d')
+        for col in cls.TIME_COLUMNS:
+            if col in df and pd.api.types.is_integer_dtype(df[col]):
+                df[col] = cls.format_times(df[col]).to_numpy()
+        if raw is not None and not raw.empty:
+            df = pd.concat([df, raw.astype(object)], ignore_index=True)
+        return df
+
+    @staticmethod
+    def set_name(df, rows, name):
+        """Sets Name on the selected rows, adding the name to the categories if needed."""
+        if isinstance(df['Name'].dtype, pd.CategoricalDtype) and name not in df['Name'].cat.categories:
+            df['Name'] = df['Name'].cat.add_categories([name])
+        df.loc[rows, 'Name'] = name
+
+
+class PartitionedCSVStore:
+    """
+    Stores a date-keyed CSV log (attendance or scan log) as one file per month or
+    per day, plus a small JSON manifest. Range queries only open the partitions
+    that overlap the requested dates instead of parsing the whole history.
+    """
+    def __init__(self, base_dir, name, columns, reader, writer, granularity='month', archive=None):
+        self.base_dir = base_dir
+        self.name = name
+        self.columns = columns
+        self.reader = reader
+        self.writer = writer
+        self.archive = archive
+        self.lock = threading.RLock()
+        # Partition files written since the last flush_to_disk().
+        self.unsynced = set()
+        # Rows of a partition that could not be typed on the last read; written back as they were.
+        self.raw_rows = {}
+        self.manifest_file = os.path.join(base_dir, f"{name}_manifest.json")
+        os.makedirs(base_dir, exist_ok=True)
+        self.manifest = self._load_manifest(granularity)
+        # The manifest's granularity wins over the configured one; changing it needs a re-partition.
+        self.key_format = '%Y-%m' if self.manifest['granularity'] == 'month' else '%Y-%m-%d'
+
+    def _load_manifest(self, granularity):
+        """Reads the manifest, or starts an empty one."""
+        if os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file, 'r') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Manifest {self.manifest_file} unreadable, rebuilding from partition files: {e}")
+                return self._rebuild_manifest(granularity)
+        return {'granularity': granularity, 'partitions': {}}
+
+    def _rebuild_manifest(self, granularity):
+        """Reconstructs the manifest by scanning the partition files on disk."""
+        manifest = {'granularity': granularity, 'partitions': {}}
+        pattern = re.compile(rf"^{re.escape(self.name)}_(\d{{4}}-\d{{2}}(?:-\d{{2}})?)\.(csv|parquet)$")
+        for filename in sorted(os.listdir(self.base_dir)):
+            match = pattern.match(filename)
+            if match:
+                key, extension = match.groups()
+                manifest['granularity'] = 'day' if len(key) == 10 else 'month'
+                manifest['partitions'][key] = {'file': filename, 'rows': None, 'version': 1, 'archived': extension == 'parquet'}
+        return manifest
+
+    def _save_manifest(self):
+        """Writes the manifest atomically so a crash never leaves it half-written."""
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    def partition_key(self, date):
+        """Returns the partition key for a 'YYYY-MM-DD' string or a datetime."""
+        if isinstance(date, str):
+            date = datetime.strptime(date[:10], '%Y-%m-%d')
+        return date.strftime(self.key_format)
+
+    def partition_path(self, key):
+        """Returns the file path of a partition."""
+        return os.path.join(self.base_dir, f"{self.name}_{key}.csv")
+
+    def last_modified(self, key):
+        """Returns the modification time of a partition's file (CSV or archive), or None."""
+        with self.lock:
+            info = self.manifest['partitions'].get(key)
+            if info is None:
+                return None
+            try:
+                return os.path.getmtime(os.path.join(self.base_dir, info['file']))
+            except OSError:
+                return None
+
+    def keys(self):
+        """Returns all partition keys in chronological order."""
+        with self.lock:
+            return sorted(self.manifest['partitions'])
+
+    def keys_in_range(self, start_date=None, end_date=None):
+        """Returns the partition keys overlapping the inclusive date range."""
+        start_key = self.partition_key(start_date) if start_date else None
+        end_key = self.partition_key(end_date) if end_date else None
+        return [k for k in self.keys()
+                if (start_key is None or k >= start_key) and (end_key is None or k <= end_key)]
+
+    def partition_versions(self):
+        """Returns {partition file: version}, used to detect changed partitions."""
+        with self.lock:
+            return {info['file']: info['version'] for info in self.manifest['partitions'].values()}
+
+    def key_versions(self):
+        """Returns {partition key: version}."""
+        with self.lock:
+            return {key: info['version'] for key, info in self.manifest['partitions'].items()}
+
+    def files(self):
+        """Returns the paths of the manifest and every partition file."""
+        with self.lock:
+            return [self.manifest_file] + [os.path.join(self.base_dir, info['file'])
+                                           for info in self.manifest['partitions'].values()]
+
+    def is_archived(self, key):
+        """Returns True if a partition has been rolled over into the columnar archive."""
+        with self.lock:
+            return bool(self.manifest['partitions'].get(key, {}).get('archived'))
+
+    def read_partition(self, key, start_date=None, end_date=None, columns=None, typed=False):
+        """
+        Reads one partition, returning an empty frame if it does not exist. With
+        typed=True the frame uses the AttendanceSchema types.
+        """
+        df = None
+        # The lock spans the check and the read, so rollover cannot archive and delete the CSV in between.
+        with self.lock:
+            if self.is_archived(key):
+                try:
+                    df = self.archive.read(key, start_date, end_date, columns, typed=typed)
+                except Exception as e:
+                    logging.error(f"Failed to read archived partition {key} of {self.name}: {e}")
+            elif key in self.manifest['partitions']:
+                df = self.reader(self.partition_path(key))
+                if df is not None and typed and not columns:
+                    df, raw = AttendanceSchema.split(df)
+                    if raw is None:
+                        self.raw_rows.pop(key, None)
+                    else:
+                        self.raw_rows[key] = raw
+            if df is not None and columns:
+                df = df[columns]
+            if df is not None and typed:
+                df = AttendanceSchema.typed(df)
+        if df is None:
+            df = pd.DataFrame(columns=columns or self.columns)
+            return AttendanceSchema.typed(df) if typed else df
+        return df
+
+    def read_range(self, start_date=None, end_date=None, columns=None, typed=False):
+        """
+        Concatenates the partitions overlapping the date range (all partitions if no
+        range is given). Rows still need the caller's exact Date mask, because a
+        monthly partition can extend beyond the range.
+        """
+        frames = [df for df in (self.read_partition(k, start_date, end_date, columns, typed)
+                                for k in self.keys_in_range(start_date, end_date)) if not df.empty]
+        if not frames:
+            return None
+        df = pd.concat(frames, ignore_index=True)
+        if typed and 'Name' in df:
+            # Partitions have their own categories; concat falls back to strings.
+            df['Name'] = df['Name'].astype('category')
+        return df
+
+    def write_partition(self, key, dataframe):
+        """
+        Replaces the content of one partition and bumps its version. Writing to an
+        archived partition brings it back to CSV; the next rollover re-archives it.
+        A typed frame gets back the rows its read could not type. Returns the new version.
+        """
+        with self.lock:
+            raw = self.raw_rows.get(key) if pd.api.types.is_integer_dtype(dataframe['ID']) else None
+            self.writer(AttendanceSchema.to_text(dataframe, raw), self.partition_path(key))
+            self.unsynced.add(self.partition_path(key))
+            if self.is_archived(key):
+                self._unarchive(key)
+            return self._touch(key, len(dataframe))
+
+    def _unarchive(self, key):
+        """Drops the archive copy of a partition after it was rewritten as CSV."""
+        info = self.manifest['partitions'][key]
+        info['archived'] = False
+        info['file'] = os.path.basename(self.partition_path(key))
+        try:
+            os.remove(self.archive.archive_path(key))
+        except OSError as e:
+            logging.error(f"Could not remove archived partition {key} of {self.name}: {e}")
+
+    def rollover(self, now=None):
+        """
+        Moves every closed partition (older than the current month) from CSV into
+        the columnar archive. Partitions that cannot be converted losslessly stay CSV.
+        """
+        if self.archive is None or not self.archive.is_available():
+            return 0
+        current_month = (now or datetime.now()).strftime('%Y-%m')
+        rolled = 0
+        with self.lock:
+            for key in self.keys():
+                if key[:7] >= current_month or self.is_archived(key):
+                    continue
+                try:
+                    df = self.reader(self.partition_path(key))
+                    if df is None or df.empty or not self.archive.write(key, df):
+                        logging.warning(f"Partition {key} of {self.name} was not archived.")
+                        continue
+                    info = self.manifest['partitions'][key]
+                    info['archived'] = True
+                    info['file'] = os.path.basename(self.archive.archive_path(key))
+                    info['version'] += 1
+                    self._save_manifest()
+                    os.remove(self.partition_path(key))
+                    rolled += 1
+                except Exception as e:
+                    logging.error(f"Failed to archive partition {key} of {self.name}: {e}")
+        return rolled
+
+    def append_row(self, row):
+        """Appends one row (a dict keyed by column) to the partition of its Date."""
+        key = self.partition_key(row['Date'])
+        path = self.partition_path(key)
+        with self.lock:
+            info = self.manifest['partitions'].get(key)
+            if info is not None and info.get('archived'):
+                # Late rows for a closed period: bring the partition back to CSV first.
+                late_row = pd.DataFrame([{col: row.get(col, '') for col in self.columns}])
+                self.write_partition(key, pd.concat([self.read_partition(key), late_row], ignore_index=True))
+                return
+            is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+            with open(path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if is_new:
+                    writer.writerow(self.columns)
+                writer.writerow([row.get(col, '') for col in self.columns])
+            self.unsynced.add(path)
+            if info is None or is_new:
+                rows = 1
+            else:
+                rows = info['rows'] + 1 if info['rows'] is not None else None
+            self._touch(key, rows)
+
+    def flush_to_disk(self):
+        """fsyncs the partition files written since the last call, their sidecars and directory entries."""
+        with self.lock:
+            paths, self.unsynced = self.unsynced, set()
+        for path in paths:
+            fsync_path(path)
+            fsync_path(path + '.sha256')
+        for directory in {os.path.dirname(os.path.abspath(path)) for path in paths}:
+            fsync_path(directory)
+
+    def _touch(self, key, rows):
+        """Records a write to a partition in the manifest. Returns the partition's new version."""
+        info = self.manifest['partitions'].setdefault(key, {'file': os.path.basename(self.partition_path(key)), 'rows': 0, 'version': 0})
+        info['rows'] = rows
+        info['version'] += 1
+        self._save_manifest()
+        return info['version']
+
+    def migrate_from(self, legacy_file):
+        """
+        Splits a legacy single-file log into partitions. The legacy file is renamed
+        to '<file>.migrated' afterwards so the migration only ever runs once.
+        """
+        if not os.path.exists(legacy_file) or os.path.getsize(legacy_file) == 0:
+            return
+        if self.manifest['partitions']:
+            logging.error(f"{legacy_file} exists next to partitioned data in {self.base_dir}; leaving it untouched.")
+            return
+        try:
+            df = pd.read_csv(legacy_file, dtype={'ID': str})
+            dates = pd.to_datetime(df['Date'], errors='coerce')
+            if dates.isna().any():
+                logging.error(f"Dropping {int(dates.isna().sum())} rows with invalid dates while migrating {legacy_file}.")
+            df, dates = df[dates.notna()], dates[dates.notna()]
+            with self.lock:
+                for key, part in df.groupby(dates.dt.strftime(self.key_format), sort=True):
+                    self.write_partition(key, part[self.columns])
+            os.replace(legacy_file, legacy_file + '.migrated')
+            print(f"Migrated {legacy_file} into {len(self.manifest['partitions'])} {self.manifest['granularity']} partitions.")
+        except Exception as e:
+            logging.error(f"Failed to migrate {legacy_file} to partitions: {e}")
+
+
+class ColumnarArchive:
+    """
+    Optional Parquet archive for closed date partitions. IDs are stored as int64,
+    dates as date32 and clock times as time32, so reads skip CSV and date parsing
+    and can use column projection and predicate pushdown on Date. Rows are
+    converted back to the CSV string format on read, so exports are unchanged.
+    """
+    TIME_FORMAT = '%I:%M:%S %p'
+
+    def __init__(self, base_dir, name, columns, time_columns):
+        self.base_dir = base_dir
+        self.name = name
+        self.columns = columns
+        self.time_columns = time_columns
+
+    @staticmethod
+    def is_available():
+        """Returns True if pyarrow is installed."""
+        return pa.is_available()
+
+    def archive_path(self, key):
+        """Returns the Parquet file path of an archived partition."""
+        return os.path.join(self.base_dir, f"{self.name}_{key}.parquet")
+
+    def to_table(self, df):
+        """
+        Converts a CSV-typed partition into a typed Arrow table. Returns None if any
+        value would not survive the round trip, in which case the CSV is kept.
+        """
+        ids = pd.to_numeric(df['ID'], errors='coerce')
+        dates = pd.to_datetime(df['Date'], format='%Y-%m-%d', errors='coerce')
+        if ids.isna().any() or dates.isna().any() or (ids.astype('int64').astype(str) != df['ID'].astype(str)).any():
+            return None
+        arrays = {
+            'ID': pa.array(ids.to_numpy(dtype='int64'), type=pa.int64()),
+            'Name': pa.array(df['Name'], type=pa.string(), from_pandas=True),
+            'Date': pa.array(dates.to_numpy(dtype='datetime64[D]'), type=pa.date32()),
+        }
+        for col in self.time_columns:
+            raw = df[col].where(df[col].notna() & (df[col].astype(str).str.strip() != ''))
+            parsed = pd.to_datetime(raw, format=self.TIME_FORMAT, errors='coerce')
+            if (parsed.isna() & raw.notna()).any():
+                return None
+            seconds = (parsed.dt.hour * 3600 + parsed.dt.minute * 60 + parsed.dt.second).fillna(0).to_numpy(dtype='int32')
+            arrays[col] = pa.array(seconds, type=pa.time32('s'), mask=parsed.isna().to_numpy())
+        return pa.table({col: arrays[col] for col in self.columns})
+
+    def write(self, key, df):
+        """Writes a partition to Parquet. Returns False if it could not be archived."""
+        table = self.to_table(df)
+        if table is None:
+            return False
+        path = self.archive_path(key)
+        pq.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return True
+
+    def read(self, key, start_date=None, end_date=None, columns=None, typed=False):
+        """
+        Reads an archived partition with optional column projection and a Date
+        filter pushed down to the Parquet reader, returning CSV-formatted strings
+        or, with typed=True, AttendanceSchema columns built straight from Arrow.
+        """
+        filters = []
+        if start_date is not None:
+            filters.append(('Date', '>=', start_date.date()))
+        if end_date is not None:
+            filters.append(('Date', '<=', end_date.date()))
+        table = pq.read_table(self.archive_path(key), columns=columns or self.columns, filters=filters or None)
+
+        df = pd.DataFrame()
+        for col in table.column_names:
+            values = table.column(col)
+            if col == 'ID':
+                # Archives written before IDs were widened store int32.
+                df[col] = values.to_pandas().astype('int64' if typed else str)
+            elif col == 'Date':
+                dates = pd.to_datetime(values.to_pandas())
+                df[col] = dates if typed else dates.dt.strftime('%Y-%m-%d')
+            elif col in self.time_columns:
+                seconds = values.cast(pa.time32('s'), safe=False).cast(pa.int32()).to_pandas()
+                if typed:
+                    df[col] = seconds.fillna(AttendanceSchema.NO_TIME).astype('int32')
+                else:
+                    df[col] = pd.to_datetime(seconds, unit='s').dt.strftime(self.TIME_FORMAT)
+            elif col == 'Name' and typed:
+                df[col] = values.dictionary_encode().to_pandas()
+            else:
+                df[col] = values.to_pandas()
+        return df
+
+
+class IncrementalBackup:
+    """
+    Content-addressed, deduplicated backups. Files are split into fixed-size chunks
+    stored once under 'objects/' by their SHA-256; each snapshot is a small JSON
+    manifest listing the chunks of every file. Append-only logs only add their new
+    tail chunk, and files whose size and mtime are unchanged are not even re-read.
+    """
+    def __init__(self, root_dir, chunk_size=1024 * 1024):
+        self.root_dir = root_dir
+        self.objects_dir = os.path.join(root_dir, 'objects')
+        self.snapshots_dir = os.path.join(root_dir, 'snapshots')
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+    def _object_path(self, digest):
+        """Returns the storage path of a chunk, fanned out by hash prefix."""
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _store_chunk(self, data):
+        """Stores a chunk unless an identical one already exists, returning its hash."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+        return digest
+
+    def list_snapshots(self):
+        """Returns snapshot names, newest first."""
+        return sorted((f[:-5] for f in os.listdir(self.snapshots_dir) if f.endswith('.json')), reverse=True)
+
+    def load_snapshot(self, name):
+        """Reads a snapshot manifest."""
+        with open(os.path.join(self.snapshots_dir, f"{name}.json"), 'r') as f:
+            return json.load(f)
+
+    def create_snapshot(self, files, file_locks=None):
+        """
+        Backs up the given files, reusing unchanged chunks. Returns the snapshot name.
+        'file_locks' maps a path to the lock its writer holds, so a file is never
+        read while it is being rewritten, renamed or deleted; files that vanish
+        before they are read are skipped.
+        """
+        file_locks = file_locks or {}
+        with self.lock:
+            snapshots = self.list_snapshots()
+            previous = self.load_snapshot(snapshots[0])['files'] if snapshots else {}
+            entries, new_bytes = {}, 0
+            for path in files:
+                key = os.path.normpath(path)
+                try:
+                    with file_locks.get(key, contextlib.nullcontext()):
+                        if not os.path.exists(path):
+                            continue
+                        stat = os.stat(path)
+                        old = previous.get(key)
+                        if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                            entries[key] = old
+                            continue
+                        chunks, file_hash = [], hashlib.sha256()
+                        with open(path, 'rb') as f:
+                            while True:
+                                data = f.read(self.chunk_size)
+                                if not data:
+                                    break
+                                file_hash.update(data)
+                                if not os.path.exists(self._object_path(hashlib.sha256(data).hexdigest())):
+                                    new_bytes += len(data)
+                                chunks.append(self._store_chunk(data))
+                except FileNotFoundError:
+                    logging.warning(f"{path} disappeared during the backup snapshot; skipped.")
+                    continue
+                entries[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                'sha256': file_hash.hexdigest(), 'chunks': chunks}
+
+            name = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            snapshot_path = os.path.join(self.snapshots_dir, f"{name}.json")
+            with open(snapshot_path + '.tmp', 'w') as f:
+                json.dump({'created': datetime.now().isoformat(), 'files': entries}, f)
+            os.replace(snapshot_path + '.tmp', snapshot_path)
+            print(f"Backup snapshot {name}: {len(entries)} files, {new_bytes / 1024:.1f} KB new data.")
+            return name
+
+    def restore(self, file_path, snapshot=None):
+        """
+        Reconstructs a file from the newest snapshot containing it (or from the given
+        snapshot), verifying its checksum before atomically replacing the target.
+        """
+        key = os.path.normpath(file_path)
+        with self.lock:
+            for name in ([snapshot] if snapshot else self.list_snapshots()):
+                entry = self.load_snapshot(name)['files'].get(key)
+                if not entry:
+                    continue
+                try:
+                    file_hash = hashlib.sha256()
+                    with open(file_path + '.restore', 'wb') as out:
+                        for digest in entry['chunks']:
+                            with open(self._object_path(digest), 'rb') as f:
+                                data = f.read()
+                            file_hash.update(data)
+                            out.write(data)
+                    if file_hash.hexdigest() != entry['sha256']:
+                        raise ValueError("checksum mismatch")
+                    os.replace(file_path + '.restore', file_path)
+                    logging.warning(f"Restored {key} from backup snapshot {name}.")
+                    return True
+                except (OSError, ValueError) as e:
+                    logging.error(f"Snapshot {name} cannot restore {key}: {e}")
+        return False
+
+    def prune(self, keep_last, keep_days):
+        """
+        Applies the retention policy: the newest 'keep_last' snapshots and any
+        snapshot younger than 'keep_days' are kept. Unreferenced chunks are deleted.
+        """
+        with self.lock:
+            cutoff = datetime.now() - timedelta(days=keep_days)
+            removed = 0
+            for index, name in enumerate(self.list_snapshots()):
+                created = datetime.strptime(name[:15], "%Y%m%d_%H%M%S")
+                if index >= keep_last and created < cutoff:
+                    os.remove(os.path.join(self.snapshots_dir, f"{name}.json"))
+                    removed += 1
+            if not removed:
+                return 0
+
+            referenced = set()
+            for name in self.list_snapshots():
+                for entry in self.load_snapshot(name)['files'].values():
+                    referenced.update(entry['chunks'])
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                for digest in os.listdir(prefix_dir):
+                    if digest not in referenced:
+                        os.remove(os.path.join(prefix_dir, digest))
+            return removed
+
+
+class CameraDiscovery:
+    """
+    Finds cameras by probing indices concurrently with a per-scan timeout, caches
+    the last known devices and their capabilities on disk, and rescans in the
+    background so hot-plugged or unplugged cameras show up without a restart.
+    """
+    def __init__(self, cache_file, max_index=10, probe_timeout=3.0, rescan_interval=15.0, busy_indices=None):
+        self.cache_file = cache_file
+        self.max_index = max_index
+        self.probe_timeout = probe_timeout
+        self.rescan_interval = rescan_interval
+        self.busy_indices = busy_indices or (lambda: set())
+        self.devices = self._load_cache()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.last_scan_seconds = None
+        # Indices whose probe thread has not returned yet; a hung driver call may still hold the device.
+        self.in_flight = set()
+
+    def _load_cache(self):
+        """Returns the device list from the last successful scan, if any."""
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f).get('devices', [])
+        except (OSError, ValueError):
+            return []
+
+    def _save_cache(self, devices):
+        """Writes the device list to the cache file."""
+        try:
+            with open(self.cache_file + '.tmp', 'w') as f:
+                json.dump({'updated': datetime.now().isoformat(), 'devices': devices}, f, indent=2)
+            os.replace(self.cache_file + '.tmp', self.cache_file)
+        except OSError as e:
+            logging.error(f"Could not write camera cache: {e}")
+
+    def cached_indices(self):
+        """Returns the camera indices known from the last scan (possibly a previous run)."""
+        with self.lock:
+            return [d['index'] for d in self.devices]
+
+    def probe(self, index):
+        """Opens one camera index and returns its capabilities, or None if unavailable."""
+        cap = cv2.VideoCapture(index + cv2.CAP_DSHOW)
+        try:
+            if not cap.isOpened():
+                return None
+            return {
+                'index': index,
+                'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                'fps': round(cap.get(cv2.CAP_PROP_FPS), 1),
+            }
+        finally:
+            cap.release()
+
+    def scan(self):
+        """
+        Probes all indices in parallel. Indices that do not answer within the timeout
+        count as missing; cameras currently in use, and indices whose probe from an
+        earlier scan is still hanging, are carried over unprobed.
+        """
+        started = time.perf_counter()
+        in_use = set(self.busy_indices())
+        with self.lock:
+            hung = set(self.in_flight)
+            busy = in_use | hung
+            self.in_flight |= set(range(self.max_index)) - busy
+        results = {}
+
+        def worker(index):
+            try:
+                results[index] = self.probe(index)
+            except Exception as e:
+                logging.error(f"Camera probe for index {index} failed: {e}")
+            finally:
+                with self.lock:
+                    self.in_flight.discard(index)
+
+        threads = []
+        for index in range(self.max_index):
+            if index in busy:
+                continue
+            thread = threading.Thread(target=worker, args=(index,), daemon=True)
+            thread.start()
+            threads.append(thread)
+        deadline = started + self.probe_timeout
+        for thread in threads:
+            thread.join(timeout=max(0.0, deadline - time.perf_counter()))
+
+        with self.lock:
+            previous = {d['index']: d for d in self.devices}
+            devices = [previous.get(i, {'index': i}) if i in in_use else previous.get(i) if i in hung else results.get(i)
+                       for i in range(self.max_index)]
+            self.devices = [d for d in devices if d]
+            self.last_scan_seconds = time.perf_counter() - started
+            self._save_cache(self.devices)
+            return list(self.devices)
+
+    def start(self, on_change):
+        """Rescans in a background thread, calling on_change(devices) when the device set changes."""
+        def loop():
+            known = set(self.cached_indices())
+            while not self.stop_event.wait(self.rescan_interval):
+                devices = self.scan()
+                indices = {d['index'] for d in devices}
+                if indices != known:
+                    known = indices
+                    on_change(devices)
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stop(self):
+        """Stops background rescanning."""
+        self.stop_event.set()
+
+
+class PreviewRenderer:
+    """
+    Draws camera frames into a Tk label cheaply: frames are downsized to the
+    label's size before overlays and colour conversion, a single PhotoImage is
+    reused via paste(), unchanged frames are not redrawn, and the preview rate is
+    capped independently of the capture rate.
+    """
+    def __init__(self, label, max_fps=15, default_width=640):
+        self.label = label
+        self.interval_ms = max(1, int(1000 / max(1, max_fps)))
+        self.default_width = default_width
+        self.photo = None
+        self.photo_size = None
+        self.last_key = None
+        self.frames_drawn = 0
+        self.frames_skipped = 0
+
+    def reset(self):
+        """Forgets the current image, e.g. after the label was cleared."""
+        self.photo = None
+        self.photo_size = None
+        self.last_key = None
+
+    def _target_size(self, frame_w, frame_h):
+        """Fits the frame into the label's current size, keeping the aspect ratio and never upscaling."""
+        border = 2 * int(str(self.label.cget('borderwidth')) or 0)
+        avail_w = self.label.winfo_width() - border
+        avail_h = self.label.winfo_height() - border
+        if avail_w < 50 or avail_h < 50:
+            avail_w, avail_h = self.default_width, frame_h * self.default_width // max(1, frame_w)
+        scale = min(1.0, avail_w / frame_w, avail_h / frame_h)
+        return max(1, int(frame_w * scale)), max(1, int(frame_h * scale)), scale
+
+    def render(self, frame, key, draw_overlays=None):
+        """
+        Renders a BGR frame. 'key' identifies the frame and overlay state; the
+        redraw is skipped if it has not changed since the last call.
+        """
+        if frame is None or key == self.last_key:
+            self.frames_skipped += 1
+            return False
+        self.last_key = key
+
+        frame_h, frame_w = frame.shape[:2]
+        target_w, target_h, scale = self._target_size(frame_w, frame_h)
+        if scale < 1.0:
+            display = cv2.resize(frame, (target_w, target_h), interpolation=cv2.INTER_AREA)
+        else:
+            display = frame.copy()
+        if draw_overlays:
+            draw_overlays(display, scale)
+
+        img = Image.fromarray(cv2.cvtColor(display, cv2.COLOR_BGR2RGB))
+        if self.photo is not None and self.photo_size == img.size:
+            self.photo.paste(img)
+        else:
+            self.photo = ImageTk.PhotoImage(image=img)
+            self.photo_size = img.size
+            self.label.imgtk = self.photo
+            self.label.config(image=self.photo)
+        self.frames_drawn += 1
+        return True
+
+
+class Liveness:
+    """
+    Vectorized liveness measures. The landmarks of every face in a frame are
+    packed into one (F x 68 x 2) array in the standard iBUG 68-point order, and
+    eye aspect ratio, head tilt and eyes-closed state are computed in one pass.
+    """
+    # Where each face_recognition landmark feature goes in the 68-point layout.
+    FEATURE_POINTS = [
+        ('chin', list(range(0, 17))),
+        ('left_eyebrow', list(range(17, 22))),
+        ('right_eyebrow', list(range(22, 27))),
+        ('nose_bridge', list(range(27, 31))),
+        ('nose_tip', list(range(31, 36))),
+        ('left_eye', list(range(36, 42))),
+        ('right_eye', list(range(42, 48))),
+        ('top_lip', [48, 49, 50, 51, 52, 53, 54, 64, 63, 62, 61, 60]),
+        ('bottom_lip', [54, 55, 56, 57, 58, 59, 48, 60, 67, 66, 65, 64]),
+    ]
+    POINT_INDEX = np.array([i for _, points in FEATURE_POINTS for i in points])
+    LEFT_EYE = np.arange(36, 42)
+    RIGHT_EYE = np.arange(42, 48)
+    NOSE_BRIDGE_TOP = 27
+    CHIN_BOTTOM = 8
+
+    @classmethod
+    def to_tensor(cls, landmarks_list):
+        """Packs face_recognition landmark dicts into an (F x 68 x 2) float array."""
+        tensor = np.zeros((len(landmarks_list), 68, 2), dtype=np.float32)
+        if landmarks_list:
+            flat = np.array([[pt for feature, _ in cls.FEATURE_POINTS for pt in landmarks[feature]]
+                             for landmarks in landmarks_list], dtype=np.float32)
+            tensor[:, cls.POINT_INDEX] = flat
+        return tensor
+
+    @classmethod
+    def eye_aspect_ratios(cls, tensor):
+        """Returns the mean EAR of both eyes for every face, shape (F,)."""
+        eyes = np.stack([tensor[:, cls.LEFT_EYE], tensor[:, cls.RIGHT_EYE]], axis=1)  # F x 2 x 6 x 2
+        a = np.linalg.norm(eyes[:, :, 1] - eyes[:, :, 5], axis=-1)
+        b = np.linalg.norm(eyes[:, :, 2] - eyes[:, :, 4], axis=-1)
+        c = np.linalg.norm(eyes[:, :, 0] - eyes[:, :, 3], axis=-1)
+        ear = np.divide(a + b, 2.0 * c, out=np.zeros_like(a), where=c > 0)
+        return ear.mean(axis=1)
+
+    @classmethod
+    def head_tilt_angles(cls, tensor):
+        """Returns the head tilt in degrees (nose bridge to chin) for every face, shape (F,)."""
+        delta = tensor[:, cls.CHIN_BOTTOM] - tensor[:, cls.NOSE_BRIDGE_TOP]
+        return np.degrees(np.arctan2(delta[:, 0], delta[:, 1]))
+
+    @classmethod
+    def analyze(cls, landmarks_list, ear_threshold):
+        """Computes EAR, tilt and eyes-closed flags for all faces of a frame at once."""
+        tensor = cls.to_tensor(landmarks_list)
+        ear = cls.eye_aspect_ratios(tensor)
+        return {'ear': ear, 'tilt': cls.head_tilt_angles(tensor), 'eyes_closed': ear < ear_threshold}
+
+
+class LivenessTracker:
+    """
+    Time-based blink detection per tracked face. Faces are followed spatially
+    (same place and size from one processed frame to the next), not by the name
+    they were matched to, so a blink only counts for the face that made it and a
+    track that is matched to someone else starts over. A blink is a run of
+    eyes-closed observations followed by an eyes-open one. The eyes must have been
+    seen closed for at least 'min_closed' seconds (first to last closed sample, so
+    a single noisy closed frame never counts) and for no longer than 'max_closed'
+    (first closed to the open sample), measured from timestamps rather than
+    counted frames, so it works at any processing rate. Tracks expire when a face is not seen for 'track_ttl'
+    seconds and the number of tracks is bounded (least recently seen is evicted).
+    """
+    def __init__(self, min_closed=0.1, max_closed=1.0, track_ttl=3.0, max_tracks=64, history=500,
+                 max_shift=0.5, max_scale=1.5):
+        self.min_closed = min_closed
+        self.max_closed = max_closed
+        self.track_ttl = track_ttl
+        self.max_tracks = max_tracks
+        self.max_shift = max_shift
+        self.max_scale = max_scale
+        self.tracks = OrderedDict()
+        self.next_track_id = 0
+        self.time_to_verify = deque(maxlen=history)
+        self.verified_count = 0
+        self.expired_unverified = 0
+        self.lock = threading.Lock()
+
+    def _shift(self, track_box, box):
+        """Centre shift relative to the face size, or None if the boxes are too different to be the same face."""
+        top, right, bottom, left = box
+        t_top, t_right, t_bottom, t_left = track_box
+        size, t_size = max(1, right - left), max(1, t_right - t_left)
+        if not 1 / self.max_scale <= size / t_size <= self.max_scale:
+            return None
+        shift = np.hypot((left + right - t_left - t_right) / 2, (top + bottom - t_top - t_bottom) / 2) / t_size
+        return shift if shift <= self.max_shift else None
+
+    def assign(self, boxes, now=None):
+        """
+        Returns a track id per face box, continuing the nearest track seen at about
+        the same place and size or starting a new one. Each track claims at most one
+        box per frame.
+        """
+        now = time.monotonic() if now is None else now
+        track_ids = []
+        with self.lock:
+            claimed = set()
+            for box in boxes:
+                best = None
+                for track_id, track in self.tracks.items():
+                    if track_id in claimed or now - track['last_seen'] > self.track_ttl:
+                        continue
+                    shift = self._shift(track['box'], box)
+                    if shift is not None and (best is None or shift < best[0]):
+                        best = (shift, track_id)
+                if best is None:
+                    track_id = self.next_track_id
+                    self.next_track_id += 1
+                    self.tracks[track_id] = {'identity': None, 'first_seen': now, 'closed_since': None, 'closed_last': None,
+                                             'verified_at': None}
+                else:
+                    track_id = best[1]
+                    self.tracks.move_to_end(track_id)
+                claimed.add(track_id)
+                self.tracks[track_id].update(box=tuple(box), last_seen=now)
+                track_ids.append(track_id)
+            while len(self.tracks) > self.max_tracks:
+                self._drop(*self.tracks.popitem(last=False))
+        return track_ids
+
+    def update(self, track_id, identity, eyes_closed, now=None):
+        """Feeds one observation of a track matched to 'identity'. Returns True when it completes a blink."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            track = self.tracks.get(track_id)
+            if track is None:
+                return False
+            if track['identity'] != identity:
+                # Somebody else is standing here now; their blink has to be seen from the start.
+                self._drop(track_id, track)
+                track.update(identity=identity, first_seen=now, closed_since=None, closed_last=None, verified_at=None)
+            track['last_seen'] = now
+
+            if eyes_closed:
+                if track['closed_since'] is None:
+                    track['closed_since'] = now
+                track['closed_last'] = now
+                return False
+            if track['closed_since'] is None:
+                return False
+
+            # Seen closed for at least (last - first closed sample), at most until this open sample.
+            seen_closed = track['closed_last'] - track['closed_since']
+            closed_for = now - track['closed_since']
+            track['closed_since'] = track['closed_last'] = None
+            if seen_closed < self.min_closed or closed_for > self.max_closed:
+                return False
+            if track['verified_at'] is None:
+                self.time_to_verify.append(now - track['first_seen'])
+                self.verified_count += 1
+            track['verified_at'] = now
+            return True
+
+    def _drop(self, track_id, track):
+        """Accounts for a recognised track leaving, counting it as a liveness failure if it never blinked."""
+        if track['identity'] is not None and track['verified_at'] is None:
+            self.expired_unverified += 1
+
+    def expire(self, now=None):
+        """
+        Removes tracks that have not been seen for track_ttl seconds. Returns the
+        identities of the recognised ones that left without blinking.
+        """
+        now = time.monotonic() if now is None else now
+        failed = []
+        with self.lock:
+            for track_id in [t for t, track in self.tracks.items() if now - track['last_seen'] > self.track_ttl]:
+                track = self.tracks.pop(track_id)
+                self._drop(track_id, track)
+                if track['identity'] is not None and track['verified_at'] is None:
+                    failed.append(track['identity'])
+        return failed
+
+    def is_highlighted(self, identity, hold=1.0, now=None):
+        """True while a track of this person has its eyes closed or shortly after its verified blink (used for the green box)."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return any(track['closed_since'] is not None or (track['verified_at'] is not None and now - track['verified_at'] < hold)
+                       for track in self.tracks.values() if track['identity'] == identity)
+
+    def stats(self):
+        """Returns time-to-verify statistics and track counters as display lines."""
+        with self.lock:
+            samples = np.array(self.time_to_verify)
+            lines = [f"active tracks: {len(self.tracks)}",
+                     f"verified: {self.verified_count}, left without blinking: {self.expired_unverified}"]
+        if samples.size:
+            lines.append(f"time to verify: mean {samples.mean():.2f}s, p50 {np.percentile(samples, 50):.2f}s, "
+                         f"p95 {np.percentile(samples, 95):.2f}s (n={samples.size})")
+        return lines
+
+
+class FaceGallery:
+    """
+    The set of enrolled face templates. A person can own several templates
+    (their mean encoding, a few medoids and optional live captures); matching
+    scores every face of a frame against all templates in one batch and takes the
+    minimum distance per person. Galleries are never modified in place: the
+    'with_*'/'without_*' methods return a new gallery.
+    """
+    ENCODING_SIZE = 128
+
+    def __init__(self, encodings=None, ids=None, sources=None):
+        ids = [str(i) for i in (ids or [])]
+        encodings = np.asarray(encodings if encodings is not None and len(encodings) else np.zeros((0, self.ENCODING_SIZE)), dtype=np.float64)
+        sources = list(sources) if sources is not None else ['enrol'] * len(ids)
+
+        # Group templates by person (in first-seen order) so per-person minima are a single reduceat.
+        self.person_ids = list(dict.fromkeys(ids))
+        person_index = {pid: n for n, pid in enumerate(self.person_ids)}
+        order = np.argsort([person_index[i] for i in ids], kind='stable').astype(int) if ids else np.array([], dtype=int)
+        self.encodings = encodings[order].reshape(-1, self.ENCODING_SIZE)
+        self.ids = [ids[i] for i in order]
+        self.sources = [sources[i] for i in order]
+        counts = np.bincount([person_index[i] for i in self.ids], minlength=len(self.person_ids))
+        self.starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(int)
+        self.squared_norms = np.einsum('ij,ij->i', self.encodings, self.encodings)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, face_encodings):
+        """
+        Returns the (faces x persons) matrix of minimum template distances. Uses
+        |a-b|^2 = |a|^2 + |b|^2 - 2a.b, so memory stays at faces x templates
+        instead of faces x templates x 128.
+        """
+        faces = np.asarray(face_encodings, dtype=np.float64).reshape(-1, self.ENCODING_SIZE)
+        if not self.ids or not len(faces):
+            return np.zeros((len(faces), len(self.person_ids)))
+        squared = np.einsum('ij,ij->i', faces, faces)[:, None] + self.squared_norms[None, :] - 2.0 * (faces @ self.encodings.T)
+        template_distances = np.sqrt(np.maximum(squared, 0.0))
+        return np.minimum.reduceat(template_distances, self.starts, axis=1)
+
+    def rank(self, face_encodings):
+        """
+        Returns (nearest person_id, best distance, runner-up person_id, second-best
+        distance) per face, without applying a tolerance. Missing values are None.
+        """
+        results = []
+        for row in self.distances(face_encodings):
+            if not row.size:
+                results.append((None, None, None, None))
+                continue
+            ranked = np.argsort(row)[:2]
+            runner_up = self.person_ids[ranked[1]] if len(ranked) > 1 else None
+            results.append((self.person_ids[ranked[0]], float(row[ranked[0]]),
+                            runner_up, float(row[ranked[1]]) if runner_up is not None else None))
+        return results
+
+    @staticmethod
+    def accept(ranked, tolerance, tolerances=None):
+        """
+        Applies the tolerance to rank() results: the person's own entry in
+        'tolerances' if there is one, else the global tolerance. Returns
+        (person_id or None, best distance, second-best distance) per face.
+        """
+        tolerances = tolerances or {}
+        return [(candidate if best is not None and best <= tolerances.get(candidate, tolerance) else None, best, second)
+                for candidate, best, _, second in ranked]
+
+    def match(self, face_encodings, tolerance, tolerances=None):
+        """
+        Matches every face at once. Returns (person_id or None, best distance,
+        second-best distance) per face; distances are None when the gallery is empty.
+        """
+        return self.accept(self.rank(face_encodings), tolerance, tolerances)
+
+    def templates_of(self, person_id):
+        """Returns the templates of one person."""
+        return self.encodings[[i for i, pid in enumerate(self.ids) if pid == str(person_id)]]
+
+    def with_person(self, person_id, templates, source='enrol'):
+        """
+        Returns a gallery where the person's templates are replaced by the given ones.
+        'source' is one source for all templates or a list with one per template.
+        """
+        base = self.without_person(person_id)
+        templates = np.asarray(templates, dtype=np.float64).reshape(-1, self.ENCODING_SIZE)
+        sources = list(source) if isinstance(source, (list, tuple)) else [source] * len(templates)
+        return FaceGallery(np.vstack([base.encodings, templates]), base.ids + [str(person_id)] * len(templates),
+                           base.sources + sources)
+
+    def with_live_template(self, person_id, encoding, max_templates):
+        """
+        Returns a gallery with a live capture added to the person's templates. When
+        over max_templates, the oldest live capture is dropped; enrolment templates are kept.
+        """
+        person_id = str(person_id)
+        keep = list(range(len(self.ids)))
+        own = [i for i in keep if self.ids[i] == person_id]
+        live = [i for i in own if self.sources[i] == 'live']
+        if len(own) >= max_templates:
+            if not live:
+                return self
+            keep.remove(live[0])
+        return FaceGallery(np.vstack([self.encodings[keep], np.asarray(encoding, dtype=np.float64)[None, :]]),
+                           [self.ids[i] for i in keep] + [person_id],
+                           [self.sources[i] for i in keep] + ['live'])
+
+    def with_photo_template(self, person_id, encoding):
+        """
+        Returns a gallery where the person's photo-derived template is replaced by
+        'encoding'. A lone enrolment template (galleries from before templates were
+        tagged) counts as photo-derived; multi-template enrolments and live
+        captures are kept as they are.
+        """
+        person_id = str(person_id)
+        own = [i for i, pid in enumerate(self.ids) if pid == person_id]
+        enrol = [i for i in own if self.sources[i] == 'enrol']
+        if len(enrol) > 1:
+            return self
+        replaced = set(enrol) | {i for i in own if self.sources[i] == 'photo'}
+        keep = [i for i in range(len(self.ids)) if i not in replaced]
+        return FaceGallery(np.vstack([self.encodings[keep], np.asarray(encoding, dtype=np.float64)[None, :]]),
+                           [self.ids[i] for i in keep] + [person_id],
+                           [self.sources[i] for i in keep] + ['photo'])
+
+    def without_person(self, person_id):
+        """Returns a gallery without the person's templates."""
+        keep = [i for i, pid in enumerate(self.ids) if pid != str(person_id)]
+        return FaceGallery(self.encodings[keep], [self.ids[i] for i in keep], [self.sources[i] for i in keep])
+
+    @staticmethod
+    def build_templates(samples, n_medoids=3):
+        """
+        Builds a compact template set from enrolment samples: the mean (rescaled to
+        the samples' typical norm) plus up to n_medoids medoids chosen greedily.
+        """
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, FaceGallery.ENCODING_SIZE)
+        if len(samples) <= 1:
+            return samples
+        mean = samples.mean(axis=0)
+        mean *= np.linalg.norm(samples, axis=1).mean() / max(np.linalg.norm(mean), 1e-9)
+
+        pairwise = np.linalg.norm(samples[:, None, :] - samples[None, :, :], axis=2)
+        medoids = []
+        nearest = np.full(len(samples), np.inf)
+        for _ in range(min(n_medoids, len(samples))):
+            # Pick the sample that most reduces the total distance to the nearest chosen medoid.
+            cost = np.minimum(pairwise, nearest[None, :]).sum(axis=1)
+            cost[medoids] = np.inf
+            best = int(np.argmin(cost))
+            medoids.append(best)
+            nearest = np.minimum(nearest, pairwise[best])
+        return np.vstack([mean[None, :], samples[medoids]])
+
+
+class MatchTelemetry:
+    """
+    Rolling record of the last 'capacity' match decisions in fixed-size numpy
+    arrays: the nearest person (-1 if none), the best distance, the runner-up
+    person and distance, whether the match was accepted, and the face track it
+    came from (-1 if unknown). Tracks that led to a liveness-confirmed scan are
+    remembered with the person logged. Feeds the per-user distance report and
+    tolerance calibration.
+    """
+    def __init__(self, capacity=20000):
+        self.capacity = capacity
+        self.candidate = np.full(capacity, -1, dtype=np.int64)
+        self.best = np.full(capacity, np.nan, dtype=np.float32)
+        self.runner_up = np.full(capacity, -1, dtype=np.int64)
+        self.second = np.full(capacity, np.nan, dtype=np.float32)
+        self.accepted = np.zeros(capacity, dtype=bool)
+        self.track = np.full(capacity, -1, dtype=np.int64)
+        # Track ids restart every session; they are offset past the ones already stored.
+        self.track_base = 0
+        self.confirmed = {}
+        self.size = 0
+        self.position = 0
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def record(self, ranked, matches, tracks=None):
+        """Records rank() results, the matches accepted from them and the track of each face."""
+        tracks = tracks if tracks is not None else [None] * len(ranked)
+        with self.lock:
+            for (candidate, best, runner_up, second), (face_id, _, _), track in zip(ranked, matches, tracks):
+                if best is None:
+                    continue
+                i = self.position
+                self.candidate[i] = int(candidate) if candidate is not None else -1
+                self.best[i] = best
+                self.runner_up[i] = int(runner_up) if runner_up is not None else -1
+                self.second[i] = second if second is not None else np.nan
+                self.accepted[i] = face_id is not None
+                self.track[i] = self.track_base + track if track is not None else -1
+                self.position = (i + 1) % self.capacity
+                self.size = min(self.size + 1, self.capacity)
+                self.total += 1
+
+    def confirm(self, track, person_id):
+        """Marks a track as a confirmed visit of person_id (a liveness-verified scan)."""
+        with self.lock:
+            self.confirmed[self.track_base + track] = int(person_id)
+
+    def _snapshot(self):
+        """Returns copies of the recorded arrays, oldest first."""
+        with self.lock:
+            order = np.roll(np.arange(self.size), -self.position) if self.size == self.capacity else np.arange(self.size)
+            return (self.candidate[order], self.best[order], self.runner_up[order],
+                    self.second[order], self.accepted[order])
+
+    def _visits(self):
+        """
+        Returns one (person, distance, runner-up, runner-up distance) row per
+        confirmed visit, as four arrays. The distance is the median over the whole
+        track, including frames rejected as near misses, so it is not censored at
+        the tolerance in force; one visit counts once however many frames it had.
+        Tracks mostly nearest to somebody else are skipped as likely false accepts.
+        """
+        with self.lock:
+            order = np.roll(np.arange(self.size), -self.position) if self.size == self.capacity else np.arange(self.size)
+            candidate, best, runner_up, second, track = (self.candidate[order], self.best[order], self.runner_up[order],
+                                                         self.second[order], self.track[order])
+            confirmed = dict(self.confirmed)
+        rows = []
+        for t, person in confirmed.items():
+            own = track == t
+            same = own & (candidate == person)
+            if not same.any() or 2 * same.sum() < own.sum():
+                continue
+            rivals = np.flatnonzero(same & np.isfinite(second))
+            nearest_rival = rivals[np.argmin(second[rivals])] if len(rivals) else None
+            rows.append((person, float(np.median(best[same])),
+                         runner_up[nearest_rival] if nearest_rival is not None else -1,
+                         second[nearest_rival] if nearest_rival is not None else np.nan))
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0)
+        person, distance, rival, rival_distance = zip(*rows)
+        return np.array(person), np.array(distance), np.array(rival), np.array(rival_distance, dtype=np.float64)
+
+    def report(self, names=None, bin_width=0.05):
+        """
+        Returns a DataFrame with one row per person: match counts, distance and
+        margin percentiles, and a histogram of best distances in 'bin_width' bins.
+        """
+        names = names or {}
+        candidate, best, _, second, accepted = self._snapshot()
+        edges = np.round(np.arange(0.0, 1.0 + bin_width, bin_width), 2)
+        rows = []
+        for person in np.unique(candidate[candidate >= 0]):
+            own = candidate == person
+            distances, margins = best[own], (second - best)[own]
+            counts, _ = np.histogram(np.clip(distances, 0.0, edges[-1] - 1e-6), bins=edges)
+            row = {'ID': int(person), 'Name': names.get(str(person), ''), 'Matches': int(own.sum()),
+                   'Accepted': int(accepted[own].sum()),
+                   'MedianDistance': round(float(np.median(distances)), 3),
+                   'P95Distance': round(float(np.percentile(distances, 95)), 3),
+                   'MedianMargin': round(float(np.nanmedian(margins)), 3) if np.isfinite(margins).any() else None}
+            row.update({f"{lo:.2f}-{hi:.2f}": int(c) for lo, hi, c in zip(edges[:-1], edges[1:], counts)})
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    @staticmethod
+    def _threshold(genuine, impostor, fallback, min_samples, floor, ceiling):
+        """
+        Places a tolerance between the 99th percentile of genuine distances and
+        the 1st percentile of impostor distances (or just below the impostors when
+        they overlap). Without enough data the fallback is kept.
+        """
+        if len(genuine) < min_samples:
+            return fallback
+        high = float(np.percentile(genuine, 99))
+        if len(impostor) >= max(1, min_samples // 3):
+            low = float(np.percentile(impostor, 1))
+            threshold = (high + low) / 2 if low > high else low - 0.01
+        else:
+            threshold = high + 0.02
+        return round(min(max(threshold, floor), ceiling), 3)
+
+    def calibrate(self, default, min_samples=30, floor=0.35, ceiling=0.65):
+        """
+        Calibrates a global tolerance and per-user tolerances from confirmed visits
+        (see _visits). Genuine distances are a visit's median distance to the
+        person logged; impostor distances are its closest distance to somebody else.
+        'min_samples' counts visits, not frames.
+        """
+        person, distance, rival, rival_distance = self._visits()
+        rivals = np.isfinite(rival_distance)
+        global_tolerance = self._threshold(distance, rival_distance[rivals], default, min_samples, floor, ceiling)
+        users = {}
+        for p in np.unique(person):
+            tolerance = self._threshold(distance[person == p], rival_distance[rivals & (rival == p)],
+                                        None, min_samples, floor, ceiling)
+            if tolerance is not None:
+                users[str(p)] = tolerance
+        return {'global': global_tolerance, 'users': users, 'samples': int(len(distance)),
+                'calibrated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+    def save(self, path):
+        """Writes the recorded decisions to an .npz file with atomic_write."""
+        candidate, best, runner_up, second, accepted = self._snapshot()
+        with self.lock:
+            order = np.roll(np.arange(self.size), -self.position) if self.size == self.capacity else np.arange(self.size)
+            track = self.track[order]
+            # Confirmations of tracks that have left the buffer are not needed any more.
+            live = set(np.unique(track).tolist())
+            confirmed = {t: p for t, p in self.confirmed.items() if t in live}
+        try:
+            buffer = io.BytesIO()
+            np.savez_compressed(buffer, candidate=candidate, best=best, runner_up=runner_up, second=second, accepted=accepted,
+                                track=track, confirmed_track=np.array(list(confirmed), dtype=np.int64),
+                                confirmed_person=np.array(list(confirmed.values()), dtype=np.int64))
+            atomic_write(path, buffer.getvalue(), checksum=False)
+        except Exception as e:
+            logging.error(f"Could not save match telemetry: {e}")
+
+    def load(self, path):
+        try:
+            with np.load(path) as data:
+                n = min(len(data['best']), self.capacity)
+                with self.lock:
+                    for name in ('candidate', 'best', 'runner_up', 'second', 'accepted'):
+                        getattr(self, name)[:n] = data[name][-n:]
+                    # Files from before track recording have no visits to calibrate from.
+                    if 'track' in data:
+                        self.track[:n] = data['track'][-n:]
+                        self.confirmed = dict(zip(data['confirmed_track'].tolist(), data['confirmed_person'].tolist()))
+                    self.track_base = int(self.track[:n].max()) + 1 if n else 0
+                    self.size, self.position = n, n % self.capacity
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Could not load match telemetry from {path}: {e}")
+
+    def stats(self):
+        """Returns the telemetry counters as display lines."""
+        _, best, _, second, accepted = self._snapshot()
+        if not len(best):
+            return []
+        lines = [f"recorded: {self.total} this session, kept: {len(best)}, accepted: {100 * accepted.mean():.1f}%"]
+        if accepted.any():
+            margins = (second - best)[accepted]
+            lines.append(f"accepted distance: p50 {np.median(best[accepted]):.3f}, p95 {np.percentile(best[accepted], 95):.3f}"
+                         + (f", median margin {np.nanmedian(margins):.3f}" if np.isfinite(margins).any() else ""))
+        return lines
+
+
+def load_match_tolerances(path, mode, default):
+    """
+    Resolves the match tolerances for a ToleranceMode: 'fixed' uses 'default'
+    for everyone, 'global' the calibrated global tolerance and 'per_user' also
+    the calibrated per-user ones. Returns (tolerance, {person_id: tolerance}).
+    """
+    if mode not in ('global', 'per_user'):
+        return default, {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            calibration = json.load(f)
+    except FileNotFoundError:
+        return default, {}
+    except Exception as e:
+        logging.error(f"Could not read match tolerances from {path}: {e}")
+        return default, {}
+    tolerance = float(calibration.get('global', default))
+    users = {str(k): float(v) for k, v in calibration.get('users', {}).items()} if mode == 'per_user' else {}
+    return tolerance, users
+
+
+def format_schedule_time(time_str):
+    """Validates time is in HH:MM AM/PM format and standardizes it. Returns None if invalid."""
+    if not time_str:
+        return ""
+    match = re.match(r'^(0?[1-9]|1[0-2]):([0-5]\d)\s*(AM|PM)$', time_str, re.IGNORECASE)
+    if match:
+        hour, minute, period = match.groups()
+        return f"{int(hour):02d}:{minute} {period.upper()}"
+    return None
+
+
+class ScheduleEngine:
+    """
+    The roster's schedules compiled once: ScheduleDays becomes a weekday bitmask
+    (Mon = bit 0) and ScheduleTimeIn/ScheduleTimeOut become minutes after midnight
+    (-1 when not set), stored in numpy arrays aligned with an ID -> row index.
+    Questions about one student are O(1); questions about the whole roster are
+    vectorized over the arrays.
+    """
+    DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    NO_TIME = -1
+
+    def __init__(self, students_df=None):
+        if students_df is None or students_df.empty:
+            students_df = pd.DataFrame(columns=['ID', 'Name', 'ScheduleDays', 'ScheduleTimeIn', 'ScheduleTimeOut'])
+        ids = pd.to_numeric(students_df['ID'], errors='coerce')
+        valid = ids.notna().to_numpy()
+        rows = students_df[valid]
+        self.ids = ids[valid].astype(np.int64).to_numpy()
+        self.names = rows['Name'].astype(str).to_numpy()
+        self.day_masks = np.array([self.parse_days(d) for d in rows.get('ScheduleDays', [])], dtype=np.int8)
+        self.time_in = np.array([self.parse_minutes(t) for t in rows.get('ScheduleTimeIn', [])], dtype=np.int16)
+        self.time_out = np.array([self.parse_minutes(t) for t in rows.get('ScheduleTimeOut', [])], dtype=np.int16)
+        self.raw_times = rows.reindex(columns=['ScheduleTimeIn', 'ScheduleTimeOut']).fillna('').reset_index(drop=True)
+        self.index = {int(user_id): i for i, user_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def parse_days(cls, days):
+        """'Mon,Wed,Fri' -> bitmask. Unknown or missing values give 0 (never scheduled)."""
+        if not isinstance(days, str):
+            return 0
+        mask = 0
+        for day in days.split(','):
+            day = day.strip().title()[:3]
+            if day in cls.DAYS:
+                mask |= 1 << cls.DAYS.index(day)
+        return mask
+
+    @classmethod
+    def parse_minutes(cls, time_str):
+        """'08:30 AM' -> 510. Returns NO_TIME for empty or invalid times."""
+        formatted = format_schedule_time(time_str.strip()) if isinstance(time_str, str) else None
+        if not formatted:
+            return cls.NO_TIME
+        parsed = datetime.strptime(formatted, '%I:%M %p')
+        return parsed.hour * 60 + parsed.minute
+
+    def _row(self, user_id):
+        try:
+            return self.index.get(int(user_id))
+        except (TypeError, ValueError):
+            return None
+
+    def name_of(self, user_id):
+        """The student's name, or None if the ID is not on the roster."""
+        row = self._row(user_id)
+        return None if row is None else self.names[row]
+
+    def is_scheduled(self, user_id, when):
+        """True if the student has class on when's weekday."""
+        row = self._row(user_id)
+        return row is not None and bool(self.day_masks[row] >> when.weekday() & 1)
+
+    def is_late(self, user_id, when):
+        """True if a first scan at 'when' is after the scheduled time in on a scheduled day."""
+        row = self._row(user_id)
+        if row is None or not self.day_masks[row] >> when.weekday() & 1 or self.time_in[row] == self.NO_TIME:
+            return False
+        return when.hour * 3600 + when.minute * 60 + when.second > self.time_in[row] * 60
+
+    def is_expected_now(self, user_id, when):
+        """True if 'when' falls between the student's scheduled time in and time out today."""
+        row = self._row(user_id)
+        return row is not None and bool(self.expected_mask(when)[row])
+
+    def is_absent(self, user_id, when, present_ids):
+        """True if the student was due by 'when' today and is not in present_ids."""
+        row = self._row(user_id)
+        return row is not None and int(user_id) not in present_ids and bool(self.due_mask(when)[row])
+
+    def scheduled_mask(self, when):
+        return (self.day_masks >> when.weekday() & 1).astype(bool)
+
+    def due_mask(self, when):
+        """Students scheduled on when's weekday whose time in has passed (any time if none is set)."""
+        return self.scheduled_mask(when) & (self.time_in <= when.hour * 60 + when.minute)
+
+    def expected_mask(self, when):
+        minute = when.hour * 60 + when.minute
+        after_in = (self.time_in == self.NO_TIME) | (self.time_in <= minute)
+        before_out = (self.time_out == self.NO_TIME) | (minute < self.time_out)
+        return self.scheduled_mask(when) & after_in & before_out
+
+    def late_mask(self, when, first_scan_minutes):
+        """Vectorized lateness for first scans given as minutes after midnight per roster row (-1 for none)."""
+        first_scan_minutes = np.asarray(first_scan_minutes)
+        return self.scheduled_mask(when) & (self.time_in != self.NO_TIME) & (first_scan_minutes > self.time_in)
+
+    def absentees(self, when, present_ids):
+        """Roster rows that were due by 'when' and did not scan, as an ID/Name/schedule DataFrame."""
+        present = np.isin(self.ids, np.fromiter((int(i) for i in present_ids), dtype=np.int64))
+        mask = self.due_mask(when) & ~present
+        return pd.DataFrame({'Date': when.strftime('%Y-%m-%d'), 'ID': self.ids[mask], 'Name': self.names[mask],
+                             'ScheduleTimeIn': self.raw_times['ScheduleTimeIn'].to_numpy()[mask],
+                             'ScheduleTimeOut': self.raw_times['ScheduleTimeOut'].to_numpy()[mask]})
+
+
+class AttendanceAnalytics:
+    """
+    Per-person, per-day rollups of the attendance summary with typed columns:
+    arrival and departure as seconds after midnight, hours present and a late
+    flag. log_attendance records a rollup row for every scan: it is appended to
+    the file and kept in a dict keyed by (date, ID) until the next report or
+    sync folds the pending rows into the frame, so a scan costs O(1). Partitions
+    that changed any other way (edits, deletes, restores) are recomputed by
+    sync() using the store's partition versions. Reports are vectorized groupbys
+    over the rollups, so they never parse time strings.
+    """
+    COLUMNS = ['Date', 'ID', 'Name', 'ArrivalSeconds', 'DepartureSeconds', 'HoursPresent', 'Late']
+    TIME_FORMAT = '%I:%M:%S %p'
+
+    def __init__(self, rollup_file, store):
+        self.rollup_file = rollup_file
+        self.state_file = os.path.splitext(rollup_file)[0] + '_state.json'
+        self.store = store
+        self.lock = threading.RLock()
+        self.rollups = None
+        self.versions = {}
+        # (date, ID) -> rollup row recorded since the frame was last materialized.
+        self.pending = {}
+        # (date, ID) -> Late flag of the rows in self.rollups.
+        self.late_flags = {}
+
+    @classmethod
+    def time_seconds(cls, text):
+        """One time string -> float seconds after midnight (NaN when missing or invalid)."""
+        try:
+            return float(AttendanceSchema.seconds(datetime.strptime(str(text).strip(), cls.TIME_FORMAT)))
+        except ValueError:
+            return np.nan
+
+    @staticmethod
+    def format_seconds(seconds):
+        """Seconds after midnight -> 'HH:MM AM' strings ('' for NaN)."""
+        seconds = pd.Series(seconds, dtype='float64')
+        return pd.to_datetime(seconds.round(), unit='s').dt.strftime('%I:%M %p').fillna('')
+
+    @classmethod
+    def compute(cls, attendance_df, schedules):
+        """
+        Builds rollup rows from typed attendance summary rows (AttendanceSchema),
+        judging lateness with the ScheduleEngine.
+        """
+        df = attendance_df.reset_index(drop=True)
+        ids = df['ID'].astype(np.int64)
+        arrival = df['TimeIn'].astype('float64').where(df['TimeIn'] != AttendanceSchema.NO_TIME)
+        departure = df['TimeOut'].astype('float64').where(df['TimeOut'] != AttendanceSchema.NO_TIME)
+        hours = ((departure - arrival).clip(lower=0) / 3600).fillna(0.0)
+
+        late = np.zeros(len(df), dtype=bool)
+        rows = ids.map(schedules.index)
+        if len(schedules) and rows.notna().any():
+            known = rows.notna().to_numpy()
+            r = rows[known].astype(int).to_numpy()
+            weekday = df['Date'][known].dt.weekday.to_numpy()
+            time_in = schedules.time_in[r]
+            on_day = (schedules.day_masks[r].astype(np.int64) >> weekday & 1).astype(bool)
+            late[known] = on_day & (time_in != ScheduleEngine.NO_TIME) & (arrival[known].to_numpy() > time_in * 60)
+        return pd.DataFrame({'Date': df['Date'].dt.strftime('%Y-%m-%d'), 'ID': ids, 'Name': df['Name'].astype(str),
+                             'ArrivalSeconds': arrival, 'DepartureSeconds': departure,
+                             'HoursPresent': hours.round(4), 'Late': late})
+
+    def _load(self):
+        """Reads the rollups and the partition versions they were built from."""
+        if self.rollups is not None:
+            return
+        rollups = None
+        if os.path.exists(self.rollup_file) and os.path.getsize(self.rollup_file) > 0:
+            try:
+                rollups = pd.read_csv(self.rollup_file, dtype={'Date': str, 'Name': str})
+                rollups = rollups.drop_duplicates(subset=['Date', 'ID'], keep='last').reset_index(drop=True)
+            except (OSError, ValueError) as e:
+                logging.error(f"Daily rollups unreadable, rebuilding: {e}")
+        try:
+            with open(self.state_file, 'r') as f:
+                self.versions = json.load(f) if rollups is not None else {}
+        except (OSError, ValueError):
+            self.versions = {}
+        self.rollups = rollups if rollups is not None else pd.DataFrame(columns=self.COLUMNS)
+        self.pending = {}
+        self._index_late_flags()
+
+    def _index_late_flags(self):
+        """Rebuilds the (date, ID) -> Late lookup used by record()."""
+        ids = pd.to_numeric(self.rollups['ID'], errors='coerce')
+        late = self.rollups['Late'].astype(str).str.lower().isin(['true', '1'])
+        self.late_flags = {(date, int(i)): flag for date, i, flag in zip(self.rollups['Date'].astype(str), ids, late)
+                           if not pd.isna(i)}
+
+    def _materialize(self):
+        """Folds the rows recorded since the last report into the rollup frame."""
+        if not self.pending:
+            return
+        pending = pd.DataFrame(list(self.pending.values()), columns=self.COLUMNS)
+        keys = pd.MultiIndex.from_tuples(list(self.pending), names=['Date', 'ID'])
+        existing = pd.MultiIndex.from_arrays([self.rollups['Date'].astype(str),
+                                              pd.to_numeric(self.rollups['ID'], errors='coerce')])
+        kept = self.rollups[~existing.isin(keys)]
+        self.rollups = pd.concat([kept, pending], ignore_index=True) if not kept.empty else pending
+        self.pending = {}
+
+    def _save(self):
+        """Rewrites the compacted rollups and their state atomically."""
+        tmp_file = self.rollup_file + '.tmp'
+        self.rollups.to_csv(tmp_file, index=False)
+        os.replace(tmp_file, self.rollup_file)
+        self._save_state()
+
+    def _save_state(self):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.versions, f)
+        os.replace(tmp_file, self.state_file)
+
+    def sync(self, schedules):
+        """Recomputes the rollups of every partition whose version changed. Returns the keys recomputed."""
+        with self.lock:
+            self._load()
+            self._materialize()
+            current = self.store.key_versions()
+            stale = [k for k, v in current.items() if self.versions.get(k) != v]
+            removed = [k for k in self.versions if k not in current]
+            if not stale and not removed:
+                return []
+            # Partition keys are prefixes of the ISO date ('YYYY-MM' or 'YYYY-MM-DD').
+            key_length = 7 if self.store.key_format == '%Y-%m' else 10
+            keep = ~self.rollups['Date'].astype(str).str[:key_length].isin(stale + removed)
+            frames = [self.rollups[keep.to_numpy()]]
+            for key in stale:
+                partition = self.store.read_partition(key, typed=True)
+                if not partition.empty:
+                    frames.append(self.compute(partition, schedules))
+            frames = [f for f in frames if not f.empty]
+            self.rollups = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=self.COLUMNS)
+            self._index_late_flags()
+            self.versions = current
+            self._save()
+            return stale
+
+    def record(self, date, user_id, name, time_in, time_out, late=None, version=None):
+        """
+        Upserts the rollup of one person and day after log_attendance rewrote it.
+        'late' of None keeps the flag recorded at time in. 'version' is the
+        partition version that write produced: the partition only counts as up
+        to date if that write was its only change since the last sync or record,
+        otherwise sync() recomputes it.
+        """
+        with self.lock:
+            self._load()
+            arrival, departure = self.time_seconds(time_in), self.time_seconds(time_out)
+            hours = round(max(0.0, departure - arrival) / 3600, 4) if not np.isnan(departure) and not np.isnan(arrival) else 0.0
+            key = (date, int(user_id))
+            if late is None:
+                late = self.pending[key]['Late'] if key in self.pending else self.late_flags.get(key, False)
+            row = {'Date': date, 'ID': int(user_id), 'Name': name, 'ArrivalSeconds': arrival,
+                   'DepartureSeconds': departure, 'HoursPresent': hours, 'Late': bool(late)}
+            self.pending[key] = row
+            self.late_flags[key] = bool(late)
+
+            # The file is append-only between syncs; _load() keeps the last row per person and day.
+            write_header = not os.path.exists(self.rollup_file) or os.path.getsize(self.rollup_file) == 0
+            with open(self.rollup_file, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if write_header:
+                    writer.writerow(self.COLUMNS)
+                writer.writerow(['' if isinstance(row[c], float) and np.isnan(row[c]) else row[c] for c in self.COLUMNS])
+            partition = self.store.partition_key(date)
+            if version is not None and self.versions.get(partition, 0) == version - 1:
+                self.versions[partition] = version
+                self._save_state()
+
+    def _rollups_in(self, start_date, end_date):
+        with self.lock:
+            self._load()
+            self._materialize()
+            rollups = self.rollups.copy()
+        dates = rollups['Date'].astype(str)
+        mask = (dates >= start_date.strftime('%Y-%m-%d')) & (dates <= end_date.strftime('%Y-%m-%d'))
+        rollups = rollups[mask.to_numpy()].reset_index(drop=True)
+        rollups['ID'] = pd.to_numeric(rollups['ID'], errors='coerce').astype('Int64')
+        rollups['Late'] = rollups['Late'].astype(str).str.lower().isin(['true', '1'])
+        for column in ['ArrivalSeconds', 'DepartureSeconds', 'HoursPresent']:
+            rollups[column] = pd.to_numeric(rollups[column], errors='coerce')
+        return rollups
+
+    @staticmethod
+    def _on_schedule(rollups, schedules):
+        """True for rollup rows that fall on one of the person's scheduled weekdays."""
+        on_schedule = np.zeros(len(rollups), dtype=bool)
+        rows = rollups['ID'].map(schedules.index)
+        known = rows.notna().to_numpy()
+        if known.any():
+            weekday = pd.to_datetime(rollups['Date'][known]).dt.weekday.to_numpy()
+            on_schedule[known] = (schedules.day_masks[rows[known].astype(int).to_numpy()].astype(np.int64) >> weekday & 1).astype(bool)
+        return on_schedule
+
+    @staticmethod
+    def _weekday_bits(schedules):
+        """(students x 7) 0/1 matrix of scheduled weekdays."""
+        return (schedules.day_masks[:, None].astype(np.int64) >> np.arange(7)) & 1
+
+    def student_report(self, start_date, end_date, schedules):
+        """Per person: days present/scheduled, attendance rate, late count, average arrival and hours."""
+        rollups = self._rollups_in(start_date, end_date)
+        rollups['OnSchedule'] = self._on_schedule(rollups, schedules)
+        per_person = rollups.groupby('ID').agg(
+            LoggedName=('Name', 'last'), DaysPresent=('Date', 'nunique'), ScheduledPresent=('OnSchedule', 'sum'),
+            LateCount=('Late', 'sum'), AvgArrival=('ArrivalSeconds', 'mean'), TotalHours=('HoursPresent', 'sum'))
+
+        weekday_counts = np.bincount(pd.date_range(start_date.date(), end_date.date()).weekday, minlength=7)
+        roster = pd.DataFrame({'ID': pd.array(schedules.ids, dtype='Int64'), 'Name': schedules.names,
+                               'DaysScheduled': self._weekday_bits(schedules) @ weekday_counts})
+        report = roster.merge(per_person.reset_index(), on='ID', how='outer')
+        report['Name'] = report['Name'].fillna(report['LoggedName'])
+        for column in ['DaysScheduled', 'DaysPresent', 'ScheduledPresent', 'LateCount', 'TotalHours']:
+            report[column] = report[column].fillna(0)
+        scheduled = report['DaysScheduled'].where(report['DaysScheduled'] > 0)
+        report['AttendanceRate'] = (100 * report['ScheduledPresent'] / scheduled).round(1)
+        report['AvgHours'] = (report['TotalHours'] / report['DaysPresent'].where(report['DaysPresent'] > 0)).round(2)
+        report['AvgArrival'] = self.format_seconds(report['AvgArrival']).to_numpy()
+        report['TotalHours'] = report['TotalHours'].round(2)
+        report = report.astype({'DaysScheduled': int, 'DaysPresent': int, 'LateCount': int}).sort_values('ID')
+        return report[['ID', 'Name', 'DaysScheduled', 'DaysPresent', 'AttendanceRate', 'LateCount',
+                       'AvgArrival', 'TotalHours', 'AvgHours']].reset_index(drop=True)
+
+    def daily_report(self, start_date, end_date, schedules):
+        """Per day: people expected/present, attendance rate, late count, average arrival and total hours."""
+        rollups = self._rollups_in(start_date, end_date)
+        rollups['OnSchedule'] = self._on_schedule(rollups, schedules)
+        per_day = rollups.groupby('Date').agg(
+            Present=('ID', 'nunique'), ScheduledPresent=('OnSchedule', 'sum'), LateCount=('Late', 'sum'),
+            AvgArrival=('ArrivalSeconds', 'mean'), TotalHours=('HoursPresent', 'sum'))
+
+        days = pd.date_range(start_date.date(), end_date.date())
+        expected_by_weekday = self._weekday_bits(schedules).sum(axis=0) if len(schedules) else np.zeros(7, dtype=int)
+        report = pd.DataFrame({'Date': days.strftime('%Y-%m-%d'), 'Expected': expected_by_weekday[days.weekday]})
+        report = report.merge(per_day.reset_index(), on='Date', how='left')
+        report = report[(report['Expected'] > 0) | report['Present'].notna()].reset_index(drop=True)
+        for column in ['Present', 'ScheduledPresent', 'LateCount', 'TotalHours']:
+            report[column] = report[column].fillna(0)
+        report['AttendanceRate'] = (100 * report['ScheduledPresent'] / report['Expected'].where(report['Expected'] > 0)).round(1)
+        report['AvgArrival'] = self.format_seconds(report['AvgArrival']).to_numpy()
+        report['TotalHours'] = report['TotalHours'].round(2)
+        report = report.astype({'Expected': int, 'Present': int, 'LateCount': int})
+        return report[['Date', 'Expected', 'Present', 'AttendanceRate', 'LateCount', 'AvgArrival', 'TotalHours']]
+
+
+class AttendanceAPI:
+    """
+    Read-only JSON API over the attendance stores for other systems (LMS,
+    payroll). Partitions are served from an LRU cache (at most 'cache_partitions'
+    entries) keyed by partition version, so polling never touches the disk
+    unless the data changed, and responses carry
+    an ETag and Last-Modified for conditional requests. handle_request() does
+    not depend on the HTTP server and can be called directly. The server only
+    binds to localhost.
+
+        GET /attendance?start=YYYY-MM-DD&end=YYYY-MM-DD&id=N
+        GET /today
+        GET /events?since=N[&wait=seconds]
+        GET /events/stream            (server-sent events)
+    """
+    MAX_WAIT_SECONDS = 30
+
+    def __init__(self, attendance_store, scan_log_store, schedules=None, max_events=1000, cache_partitions=24):
+        self.stores = {'attendance': attendance_store, 'scan_log': scan_log_store}
+        self.schedules = schedules
+        self.cache = OrderedDict()
+        self.cache_partitions = cache_partitions
+        self.cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.requests_served = 0
+        self.events = deque(maxlen=max_events)
+        self.event_seq = 0
+        self.events_changed = threading.Condition()
+        self.server = None
+        self.stopping = False
+
+    # --- Data access ---
+    def _records(self, store_name, key):
+        """Returns (records, last modified) of one partition, re-reading it only when its version changed."""
+        store = self.stores[store_name]
+        version = store.key_versions().get(key)
+        with self.cache_lock:
+            cached = self.cache.get((store_name, key))
+            if cached is not None and cached[0] == version:
+                self.cache.move_to_end((store_name, key))
+                self.cache_hits += 1
+                return cached[1], cached[2]
+            self.cache_misses += 1
+        typed = store.read_partition(key, typed=True)
+        df = AttendanceSchema.to_text(typed).astype(object)
+        df['ID'] = typed['ID'].astype(int).to_numpy(dtype=object)
+        records = df.where(df != '', None).to_dict('records')
+        modified = store.last_modified(key) or 0.0
+        with self.cache_lock:
+            self.cache[(store_name, key)] = (version, records, modified)
+            self.cache.move_to_end((store_name, key))
+            while len(self.cache) > self.cache_partitions:
+                self.cache.popitem(last=False)
+        return records, modified
+
+    def _etag(self, *parts):
+        return '"' + hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20] + '"'
+
+    def publish(self, event_type, **data):
+        """Adds a scan event to the stream and wakes up waiting clients."""
+        with self.events_changed:
+            self.event_seq += 1
+            self.events.append({'seq': self.event_seq, 'type': event_type, 'timestamp': datetime.now().isoformat(timespec='seconds'), **data})
+            self.events_changed.notify_all()
+
+    def events_since(self, since, wait=0.0):
+        """Returns the events after sequence number 'since', waiting up to 'wait' seconds for one."""
+        deadline = time.monotonic() + min(max(wait, 0.0), self.MAX_WAIT_SECONDS)
+        with self.events_changed:
+            while self.event_seq <= since and not self.stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.events_changed.wait(remaining)
+            return [event for event in self.events if event['seq'] > since]
+
+    # --- Request handling ---
+    def handle_request(self, method, target, headers=None):
+        """Serves one request. Returns (status, headers, body bytes)."""
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        self.requests_served += 1
+        if method not in ('GET', 'HEAD'):
+            return self._error(405, "Only GET is supported.")
+        url = urlparse(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        routes = {'/attendance': self._get_attendance, '/today': self._get_today, '/events': self._get_events}
+        route = routes.get(url.path.rstrip('/') or '/')
+        if route is None:
+            return self._error(404, f"Unknown endpoint {url.path}.")
+        try:
+            payload, etag, modified = route(query)
+        except ValueError as e:
+            return self._error(400, str(e))
+        except Exception as e:
+            logging.error(f"API request {target} failed: {e}")
+            return self._error(500, "Internal error.")
+        return self._respond(payload, etag, modified, headers)
+
+    def _respond(self, payload, etag, modified, headers):
+        response_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if modified:
+            response_headers['Last-Modified'] = formatdate(modified, usegmt=True)
+        if 'if-none-match' in headers:
+            if etag in [t.strip() for t in headers['if-none-match'].split(',')] or headers['if-none-match'].strip() == '*':
+                return 304, response_headers, b''
+        elif modified and 'if-modified-since' in headers:
+            try:
+                if int(modified) <= parsedate_to_datetime(headers['if-modified-since']).timestamp():
+                    return 304, response_headers, b''
+            except (TypeError, ValueError):
+                pass
+        response_headers['Content-Type'] = 'application/json; charset=utf-8'
+        return 200, response_headers, json.dumps(payload, default=str).encode('utf-8')
+
+    def _error(self, status, message):
+        return status, {'Content-Type': 'application/json; charset=utf-8'}, json.dumps({'error': message}).encode('utf-8')
+
+    @staticmethod
+    def _parse_date(value, name):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            raise ValueError(f"'{name}' must be a date in YYYY-MM-DD format.")
+
+    def _get_attendance(self, query):
+        start = self._parse_date(query['start'], 'start') if 'start' in query else None
+        end = self._parse_date(query['end'], 'end') if 'end' in query else None
+        if start and end and start > end:
+            raise ValueError("'start' cannot be after 'end'.")
+        user_id = None
+        if 'id' in query:
+            try:
+                user_id = int(query['id'])
+            except ValueError:
+                raise ValueError("'id' must be a number.")
+        store = self.stores['attendance']
+        keys = store.keys_in_range(start, end)
+        versions = store.key_versions()
+        start_str, end_str = start.strftime('%Y-%m-%d') if start else '', end.strftime('%Y-%m-%d') if end else '9999'
+        records, modified = [], 0.0
+        for key in keys:
+            partition, partition_modified = self._records('attendance', key)
+            modified = max(modified, partition_modified)
+            records.extend(r for r in partition if start_str <= str(r.get('Date')) <= end_str
+                           and (user_id is None or r.get('ID') == user_id))
+        etag = self._etag('attendance', start_str, end_str, user_id, [(k, versions.get(k)) for k in keys])
+        return {'count': len(records), 'records': records}, etag, modified
+
+    def _get_today(self, query):
+        now = datetime.now()
+        today = now.strftime('%Y-%m-%d')
+        key = self.stores['attendance'].partition_key(today)
+        partition, modified = self._records('attendance', key)
+        records = [r for r in partition if r.get('Date') == today]
+        payload = {'date': today, 'present': len(records),
+                   'clocked_out': sum(1 for r in records if r.get('TimeOut')), 'records': records}
+        etag_parts = ['today', today, self.stores['attendance'].key_versions().get(key)]
+        if self.schedules is not None:
+            schedules = self.schedules()
+            absent = schedules.absentees(now, [r['ID'] for r in records if isinstance(r.get('ID'), int)])
+            payload['expected'] = int(schedules.scheduled_mask(now).sum())
+            payload['absent'] = absent[['ID', 'Name', 'ScheduleTimeIn']].astype(object).to_dict('records')
+            # Absences depend on the clock as well as on the data.
+            etag_parts += [id(schedules), now.strftime('%H:%M')]
+        return payload, self._etag(*etag_parts), modified
+
+    def _get_events(self, query):
+        try:
+            since = int(query.get('since', 0))
+            wait = float(query.get('wait', 0))
+        except ValueError:
+            raise ValueError("'since' and 'wait' must be numbers.")
+        events = self.events_since(since, wait)
+        last = events[-1]['seq'] if events else since
+        return {'last_seq': last, 'events': events}, self._etag('events', since, last), 0.0
+
+    # --- HTTP server ---
+    def start(self, port, host='127.0.0.1'):
+        """Starts serving on a daemon thread."""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if urlparse(self.path).path.rstrip('/') == '/events/stream':
+                    return self._stream()
+                self._send('GET')
+
+            def do_HEAD(self):
+                self._send('HEAD')
+
+            def _send(self, method):
+                """Writes the response; HEAD gets the same headers as GET but no body."""
+                status, headers, body = api.handle_request(method, self.path, dict(self.headers))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if method != 'HEAD':
+                    self.wfile.write(body)
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                since = int(self.headers.get('Last-Event-ID') or 0)
+                try:
+                    while not api.stopping:
+                        for event in api.events_since(since, wait=api.MAX_WAIT_SECONDS):
+                            self.wfile.write(f"id: {event['seq']}\ndata: {json.dumps(event, default=str)}\n\n".encode('utf-8'))
+                            since = event['seq']
+                        self.wfile.write(b": keep-alive\n\n")
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.stopping = False
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address
+
+    def stop(self):
+        """Stops the server and releases streaming clients."""
+        if self.server is None:
+            return
+        self.stopping = True
+        with self.events_changed:
+            self.events_changed.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+
+    def stats(self):
+        """Returns API counters as display lines."""
+        if self.server is None:
+            return ["disabled (set ApiEnabled = true in config.ini)"]
+        host, port = self.server.server_address[:2]
+        return [f"listening on http://{host}:{port}", f"requests: {self.requests_served}",
+                f"partition cache: {len(self.cache)}/{self.cache_partitions} entries, "
+                f"hits: {self.cache_hits}, misses: {self.cache_misses}"]
+
+
+class AggregationService:
+    """
+    Central store that merges the scan events of all kiosks. Events carry a
+    unique event_id, so a batch retried after a lost response is acknowledged
+    again without being applied twice. Per person and day, TimeIn is the
+    earliest scan and TimeOut the latest later scan across all kiosks; both are
+    order-independent, so kiosks can sync in any order. Gallery changes pushed by
+    kiosks get a global version number that kiosks pull deltas against.
+
+    Attendance is partitioned by day: each day file holds that day's merged
+    records and the IDs of its scan events, and only the days touched by a batch
+    are loaded (at most 'cached_days' stay in memory) and rewritten. The IDs of
+    gallery events are kept for the last 'max_gallery_seen' events.
+
+    Runs in-process (LocalSyncTransport) or behind serve() for a real fleet.
+    With a 'secret', HTTP requests must carry it in the X-Sync-Secret header.
+    """
+    TIME_FORMAT = '%I:%M:%S %p'
+    SECRET_HEADER = 'X-Sync-Secret'
+
+    def __init__(self, data_dir, secret=None, cached_days=31, max_gallery_seen=10000):
+        self.data_dir = data_dir
+        self.secret = secret or None
+        self.state_file = os.path.join(data_dir, 'aggregate_state.json')
+        self.scan_log_file = os.path.join(data_dir, 'aggregate_scan_log.csv')
+        self.days_dir = os.path.join(data_dir, 'days')
+        self.cached_days = cached_days
+        self.lock = threading.Lock()
+        os.makedirs(self.days_dir, exist_ok=True)
+        self.state = {'gallery_version': 0, 'gallery': {}, 'gallery_seen': []}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as f:
+                self.state.update(json.load(f))
+        self.gallery_seen = deque(self.state['gallery_seen'], maxlen=max_gallery_seen)
+        self.days = OrderedDict()
+        self._migrate()
+        self.server = None
+
+    def _migrate(self):
+        """Splits the attendance of the single-file state used before day partitions."""
+        legacy = self.state.pop('attendance', None)
+        self.state.pop('seen', None)
+        if not legacy:
+            return
+        for key, record in legacy.items():
+            date, user_id = key.split('|')
+            self._day(date)['attendance'][user_id] = record
+        for date in list(self.days):
+            self._save_day(date)
+        self._save()
+        logging.warning(f"Moved {len(legacy)} aggregated attendance records into day files.")
+
+    def _day_file(self, date):
+        return os.path.join(self.days_dir, f"{date}.json")
+
+    def _day(self, date):
+        """Returns the state of one day ({'seen': set, 'attendance': {ID: record}}), loading it if needed."""
+        day = self.days.get(date)
+        if day is None:
+            day = {'seen': set(), 'attendance': {}}
+            if os.path.exists(self._day_file(date)):
+                with open(self._day_file(date), 'r') as f:
+                    stored = json.load(f)
+                day = {'seen': set(stored.get('seen', [])), 'attendance': stored.get('attendance', {})}
+            self.days[date] = day
+        self.days.move_to_end(date)
+        return day
+
+    def _save_day(self, date):
+        day = self.days[date]
+        tmp_file = self._day_file(date) + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'seen': sorted(day['seen']), 'attendance': day['attendance']}, f)
+        os.replace(tmp_file, self._day_file(date))
+
+    def _save(self):
+        self.state['gallery_seen'] = list(self.gallery_seen)
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def authorized(self, headers):
+        """True if the request carries the shared secret (or no secret is configured)."""
+        if self.secret is None:
+            return True
+        return hmac.compare_digest(str(headers.get(self.SECRET_HEADER) or '').encode('utf-8'), self.secret.encode('utf-8'))
+
+    @classmethod
+    def _seconds(cls, time_str):
+        parsed = datetime.strptime(time_str, cls.TIME_FORMAT)
+        return parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+
+    def _merge_scan(self, day, event):
+        key = str(int(event['id']))
+        record = day['attendance'].get(key)
+        seconds = self._seconds(event['time'])
+        if record is None:
+            day['attendance'][key] = {'Name': event.get('name', ''), 'first': seconds, 'last': seconds,
+                                      'TimeIn': event['time'], 'TimeOut': ''}
+            return
+        if seconds < record['first']:
+            record['first'], record['TimeIn'] = seconds, event['time']
+        if seconds > record['last']:
+            record['last'] = seconds
+        if record['last'] > record['first']:
+            last = datetime(1900, 1, 1) + timedelta(seconds=record['last'])
+            record['TimeOut'] = last.strftime(self.TIME_FORMAT)
+
+    def _merge_gallery(self, event):
+        self.state['gallery_version'] += 1
+        self.state['gallery'][str(event['person_id'])] = {
+            'version': self.state['gallery_version'], 'templates': event.get('templates'),
+            'sources': event.get('sources'), 'student': event.get('student'), 'kiosk': event.get('kiosk')}
+
+    def ingest(self, payload):
+        """
+        Applies a gzip-compressed JSON batch of events. Returns the IDs to
+        acknowledge, the counts of accepted and duplicate events, and the IDs of
+        malformed events: these are acknowledged too (a retry cannot fix them)
+        but reported as rejected, not accepted.
+        """
+        events = json.loads(gzip.decompress(payload).decode('utf-8'))
+        accepted, duplicates, acked, rejected, scan_rows = 0, 0, [], [], []
+        touched_days, gallery_changed = set(), False
+        with self.lock:
+            for event in events:
+                event_id = event.get('event_id')
+                if not event_id:
+                    continue
+                acked.append(event_id)
+                try:
+                    if event.get('type') == 'scan':
+                        date = datetime.strptime(event['date'], '%Y-%m-%d').strftime('%Y-%m-%d')
+                        day = self._day(date)
+                        if event_id in day['seen']:
+                            duplicates += 1
+                            continue
+                        self._merge_scan(day, event)
+                        day['seen'].add(event_id)
+                        touched_days.add(date)
+                        scan_rows.append([event['id'], event.get('name', ''), event['date'], event['time'], event.get('kiosk', '')])
+                    elif event.get('type') == 'gallery':
+                        if event_id in self.gallery_seen:
+                            duplicates += 1
+                            continue
+                        self._merge_gallery(event)
+                        self.gallery_seen.append(event_id)
+                        gallery_changed = True
+                    else:
+                        raise ValueError(f"unknown event type {event.get('type')!r}")
+                except (KeyError, TypeError, ValueError) as e:
+                    logging.error(f"Rejected sync event {event_id}: {e}")
+                    rejected.append(event_id)
+                    continue
+                accepted += 1
+            for date in touched_days:
+                self._save_day(date)
+            while len(self.days) > self.cached_days:
+                self.days.popitem(last=False)
+            if gallery_changed:
+                self._save()
+            if scan_rows:
+                write_header = not os.path.exists(self.scan_log_file)
+                with open(self.scan_log_file, 'a', newline='') as f:
+                    writer = csv.writer(f)
+                    if write_header:
+                        writer.writerow(['ID', 'Name', 'Date', 'Time', 'Kiosk'])
+                    writer.writerows(scan_rows)
+        return {'acked': acked, 'accepted': accepted, 'duplicates': duplicates, 'rejected': rejected}
+
+    def gallery_delta(self, since):
+        """Returns the gallery changes with a version above 'since' and the current version."""
+        with self.lock:
+            changes = {pid: entry for pid, entry in self.state['gallery'].items() if entry['version'] > since}
+            return {'version': self.state['gallery_version'], 'changes': changes}
+
+    def attendance_rows(self):
+        """The merged attendance summary in the kiosks' attendance.csv layout."""
+        rows = []
+        with self.lock:
+            for filename in sorted(os.listdir(self.days_dir)):
+                if not filename.endswith('.json'):
+                    continue
+                date = filename[:-5]
+                if date in self.days:
+                    attendance = self.days[date]['attendance']
+                else:
+                    with open(self._day_file(date), 'r') as f:
+                        attendance = json.load(f).get('attendance', {})
+                rows.extend({'ID': int(user_id), 'Name': record['Name'], 'Date': date,
+                             'TimeIn': record['TimeIn'], 'TimeOut': record['TimeOut']}
+                            for user_id, record in attendance.items())
+        return sorted(rows, key=lambda r: (r['Date'], r['ID']))
+
+    def export_attendance(self, file_path):
+        with open(file_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['ID', 'Name', 'Date', 'TimeIn', 'TimeOut'])
+            writer.writeheader()
+            writer.writerows(self.attendance_rows())
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serves POST /sync/events and GET /sync/gallery?since=N until interrupted."""
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, payload):
+                body = gzip.compress(json.dumps(payload).encode('utf-8'))
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Encoding', 'gzip')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                if not service.authorized(self.headers):
+                    return self._reply(401, {'error': 'missing or wrong sync secret'})
+                if urlparse(self.path).path != '/sync/events':
+                    return self._reply(404, {'error': 'unknown endpoint'})
+                try:
+                    payload = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                    self._reply(200, service.ingest(payload))
+                except (OSError, ValueError) as e:
+                    self._reply(400, {'error': str(e)})
+
+            def do_GET(self):
+                if not service.authorized(self.headers):
+                    return self._reply(401, {'error': 'missing or wrong sync secret'})
+                url = urlparse(self.path)
+                if url.path == '/sync/gallery':
+                    since = int(parse_qs(url.query).get('since', ['0'])[-1])
+                    return self._reply(200, service.gallery_delta(since))
+                if url.path == '/sync/attendance':
+                    return self._reply(200, service.attendance_rows())
+                self._reply(404, {'error': 'unknown endpoint'})
+
+            def log_message(self, format, *args):
+                pass
+
+        if self.secret is None:
+            logging.warning("Aggregation service running without SyncSecret; any client can push gallery changes.")
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        print(f"Aggregation service listening on http://{host}:{self.server.server_address[1]}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+
+
+class LocalSyncTransport:
+    """Talks to an AggregationService in the same process (for testing and single-machine setups)."""
+    def __init__(self, service):
+        self.service = service
+
+    def push(self, payload):
+        return self.service.ingest(payload)
+
+    def pull_gallery(self, since):
+        return json.loads(json.dumps(self.service.gallery_delta(since)))
+
+
+class HTTPSyncTransport:
+    """Talks to an AggregationService over HTTP, sending the shared secret if one is set."""
+    def __init__(self, base_url, timeout=10, secret=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.auth_headers = {AggregationService.SECRET_HEADER: secret} if secret else {}
+
+    def _read(self, response):
+        body = response.read()
+        if response.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return json.loads(body.decode('utf-8'))
+
+    def push(self, payload):
+        request = urllib.request.Request(f"{self.base_url}/sync/events", data=payload, method='POST',
+                                         headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip', **self.auth_headers})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return self._read(response)
+
+    def pull_gallery(self, since):
+        request = urllib.request.Request(f"{self.base_url}/sync/gallery?since={int(since)}",
+                                         headers={'Accept-Encoding': 'gzip', **self.auth_headers})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return self._read(response)
+
+
+class SyncClient:
+    """
+    Kiosk side of the sync. Events are appended to an on-disk queue first, so
+    scans made while the server is unreachable are kept and sent later; batches
+    are gzip-compressed and only removed from the queue once acknowledged.
+    Gallery changes are pulled as deltas against the last version applied.
+    """
+    def __init__(self, kiosk_id, queue_file, state_file, transport, batch_size=200):
+        self.kiosk_id = kiosk_id
+        self.queue_file = queue_file
+        self.state_file = state_file
+        self.transport = transport
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.state = {'gallery_version': 0}
+        if os.path.exists(state_file):
+            try:
+                with open(state_file, 'r') as f:
+                    self.state.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logging.error(f"Sync state unreadable, pulling the full gallery again: {e}")
+        self.pushed = 0
+        self.rejected = 0
+        self.last_sync = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enqueue(self, event_type, **data):
+        """Queues an event for the aggregation service. Returns its event_id."""
+        event = {'event_id': f"{self.kiosk_id}-{uuid.uuid4().hex}", 'kiosk': self.kiosk_id, 'type': event_type, **data}
+        with self.lock:
+            with open(self.queue_file, 'a') as f:
+                f.write(json.dumps(event) + '\n')
+                f.flush()
+        return event['event_id']
+
+    def pending(self):
+        """Returns the queued events, skipping lines damaged by a crash mid-write."""
+        events = []
+        with self.lock:
+            if not os.path.exists(self.queue_file):
+                return events
+            with open(self.queue_file, 'r') as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        continue
+        return events
+
+    def _acknowledge(self, event_ids):
+        """Removes acknowledged events from the queue (events queued meanwhile are kept)."""
+        with self.lock:
+            with open(self.queue_file, 'r') as f:
+                lines = f.readlines()
+            keep = []
+            for line in lines:
+                try:
+                    if json.loads(line)['event_id'] in event_ids:
+                        continue
+                except (ValueError, KeyError):
+                    continue
+                keep.append(line)
+            tmp_file = self.queue_file + '.tmp'
+            with open(tmp_file, 'w') as f:
+                f.writelines(keep)
+            os.replace(tmp_file, self.queue_file)
+
+    def push(self):
+        """Sends the queue in batches. Returns the number of events acknowledged; stops at the first failure."""
+        events, sent = self.pending(), 0
+        for i in range(0, len(events), self.batch_size):
+            batch = events[i:i + self.batch_size]
+            result = self.transport.push(gzip.compress(json.dumps(batch).encode('utf-8')))
+            acked = set(result.get('acked', []))
+            if result.get('rejected'):
+                self.rejected += len(result['rejected'])
+                logging.error(f"The aggregation service rejected {len(result['rejected'])} malformed events: "
+                              + json.dumps([event for event in batch if event.get('event_id') in set(result['rejected'])]))
+            self._acknowledge(acked)
+            sent += len(acked)
+        self.pushed += sent
+        return sent
+
+    def pull_gallery(self, apply):
+        """Fetches gallery changes since the last pull and hands them to apply(changes)."""
+        delta = self.transport.pull_gallery(self.state['gallery_version'])
+        if delta.get('changes'):
+            apply(delta['changes'])
+        self.state['gallery_version'] = delta.get('version', self.state['gallery_version'])
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def sync_once(self, apply):
+        """Pushes before pulling, so local changes are never overwritten by older server state."""
+        try:
+            self.push()
+            self.pull_gallery(apply)
+            self.last_sync, self.last_error = datetime.now(), None
+        except (OSError, ValueError) as e:
+            # Offline or server error: events stay queued for the next attempt.
+            self.last_error = str(e)
+
+    def start(self, interval, apply):
+        def run():
+            while not self._stop.is_set():
+                self.sync_once(apply)
+                self._stop.wait(interval)
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        """Returns queue and sync status as display lines."""
+        lines = [f"kiosk: {self.kiosk_id}, queued events: {len(self.pending())}, pushed: {self.pushed}, rejected: {self.rejected}",
+                 f"gallery version: {self.state['gallery_version']}",
+                 f"last sync: {self.last_sync.strftime('%H:%M:%S') if self.last_sync else 'never'}"]
+        if self.last_error:
+            lines.append(f"last error: {self.last_error}")
+        return lines
+
+
+def crop_face(frame, location, margin=0.25):
+    """
+    Cuts a face out of a frame with a margin around it. Returns the crop and the
+    face location (top, right, bottom, left) relative to the crop.
+    """
+    h, w = frame.shape[:2]
+    top, right, bottom, left = location
+    pad_y, pad_x = int((bottom - top) * margin), int((right - left) * margin)
+    y0, y1 = max(0, top - pad_y), min(h, bottom + pad_y)
+    x0, x1 = max(0, left - pad_x), min(w, right + pad_x)
+    return frame[y0:y1, x0:x1], (max(0, top) - y0, min(right, w) - x0, min(bottom, h) - y0, max(0, left) - x0)
+
+
+def send_frame(sock, payload):
+    """Sends one length-prefixed message (4-byte big-endian length, then the payload)."""
+    sock.sendall(struct.pack('>I', len(payload)) + payload)
+
+
+def recv_frame(sock, max_size=16 * 1024 * 1024):
+    """Receives one length-prefixed message. Returns None if the peer closed the connection."""
+    chunks, header = [], b''
+    while len(header) < 4:
+        chunk = sock.recv(4 - len(header))
+        if not chunk:
+            return None
+        header += chunk
+    (needed,) = struct.unpack('>I', header)
+    if needed > max_size:
+        raise ValueError(f"Message of {needed} bytes exceeds the {max_size} byte limit.")
+    while needed:
+        chunk = sock.recv(min(needed, 65536))
+        if not chunk:
+            raise ConnectionError("Connection closed mid-message.")
+        chunks.append(chunk)
+        needed -= len(chunk)
+    return b''.join(chunks)
+
+
+class RecognitionWorker:
+    """
+    Encoding and gallery matching for thin kiosks. A kiosk sends one request
+    per processed frame: a JSON header listing the face location inside each
+    crop, followed by one JPEG message per crop. Crops from all connected kiosks
+    are gathered into micro-batches (up to max_batch crops or max_wait seconds)
+    and each batch is matched against the gallery in a single call. Every crop
+    gets back the matched ID, best and second-best distances and whether the
+    eyes were closed. The gallery is reloaded when encodings.pkl changes.
+    """
+    def __init__(self, encodings_file, tolerance=0.5, ear_thresh=0.25, max_batch=32, max_wait=0.01, tolerance_mode='fixed'):
+        self.encodings_file = encodings_file
+        self.default_tolerance = tolerance
+        self.tolerance_mode = tolerance_mode
+        self.tolerances_file = os.path.join(os.path.dirname(encodings_file), 'tolerances.json')
+        self.tolerances_mtime = None
+        self.tolerance, self.user_tolerances = tolerance, {}
+        self.ear_thresh = ear_thresh
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.jobs = queue.Queue()
+        self.gallery = FaceGallery()
+        self.gallery_mtime = None
+        self.batches = 0
+        self.crops_done = 0
+        self.server = None
+        self._stop = threading.Event()
+
+    def _load_gallery(self):
+        """Reloads the gallery (and calibrated tolerances) if their files changed since the last batch."""
+        try:
+            tolerances_mtime = os.path.getmtime(self.tolerances_file)
+        except OSError:
+            tolerances_mtime = None
+        if tolerances_mtime != self.tolerances_mtime:
+            self.tolerance, self.user_tolerances = load_match_tolerances(self.tolerances_file, self.tolerance_mode, self.default_tolerance)
+            self.tolerances_mtime = tolerances_mtime
+        try:
+            mtime = os.path.getmtime(self.encodings_file)
+        except OSError:
+            return self.gallery
+        if mtime != self.gallery_mtime:
+            try:
+                with open(self.encodings_file, 'rb') as f:
+                    self.gallery = FaceGallery(*pickle.load(f))
+                self.gallery_mtime = mtime
+                print(f"Recognition worker loaded {len(self.gallery.person_ids)} users.")
+            except Exception as e:
+                logging.error(f"Recognition worker could not load {self.encodings_file}: {e}")
+        return self.gallery
+
+    def recognize(self, crops):
+        """Encodes and matches a list of (RGB crop, face location) in one batch."""
+        encodings, landmarks, valid = [], [], []
+        for i, (rgb, location) in enumerate(crops):
+            if rgb is None:
+                continue
+            encoding = face_recognition.face_encodings(rgb, [location])
+            if encoding:
+                encodings.append(encoding[0])
+                landmarks.extend(face_recognition.face_landmarks(rgb, [location])[:1])
+                valid.append(i)
+        results = [{'id': None, 'distance': None, 'second': None, 'candidate': None, 'runner_up': None, 'eyes_closed': False} for _ in crops]
+        if valid:
+            eyes_closed = Liveness.analyze(landmarks, self.ear_thresh)['eyes_closed'] if len(landmarks) == len(valid) else [False] * len(valid)
+            gallery = self._load_gallery()
+            ranked = gallery.rank(encodings)
+            matches = gallery.accept(ranked, self.tolerance, self.user_tolerances)
+            for i, closed, (face_id, best, second), (candidate, _, runner_up, _) in zip(valid, eyes_closed, matches, ranked):
+                results[i] = {'id': face_id, 'distance': best, 'second': second, 'candidate': candidate,
+                              'runner_up': runner_up, 'eyes_closed': bool(closed)}
+        self.crops_done += len(crops)
+        return results
+
+    def submit(self, crops, timeout=10.0):
+        """Queues crops for the next micro-batch and waits for their results."""
+        job = {'crops': crops, 'done': threading.Event(), 'results': None}
+        self.jobs.put(job)
+        if not job['done'].wait(timeout):
+            raise TimeoutError("Recognition batch timed out.")
+        return job['results']
+
+    def _batch_loop(self):
+        while not self._stop.is_set():
+            try:
+                batch = [self.jobs.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            count, deadline = len(batch[0]['crops']), time.monotonic() + self.max_wait
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self.jobs.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(job)
+                count += len(job['crops'])
+            try:
+                results = self.recognize([crop for job in batch for crop in job['crops']])
+            except Exception as e:
+                logging.error(f"Recognition batch failed: {e}")
+                results = [{'id': None, 'distance': None, 'second': None, 'eyes_closed': False}] * count
+            self.batches += 1
+            offset = 0
+            for job in batch:
+                job['results'] = results[offset:offset + len(job['crops'])]
+                offset += len(job['crops'])
+                job['done'].set()
+
+    def start(self, port, host='127.0.0.1'):
+        """Starts the batcher and the TCP server on daemon threads. Returns the bound address."""
+        worker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                while True:
+                    header = recv_frame(self.request)
+                    if header is None:
+                        return
+                    locations = json.loads(header.decode('utf-8'))['locations']
+                    crops = []
+                    for location in locations:
+                        image = cv2.imdecode(np.frombuffer(recv_frame(self.request) or b'', np.uint8), cv2.IMREAD_COLOR)
+                        crops.append((None if image is None else cv2.cvtColor(image, cv2.COLOR_BGR2RGB), tuple(location)))
+                    send_frame(self.request, json.dumps({'results': worker.submit(crops)}).encode('utf-8'))
+
+        self._stop.clear()
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address
+
+    def stop(self):
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class RemoteRecognizer:
+    """Kiosk-side client of a RecognitionWorker; keeps one connection open and reconnects on failure."""
+    def __init__(self, address, timeout=5.0, jpeg_quality=90):
+        host, _, port = address.rpartition(':')
+        self.address = (host or '127.0.0.1', int(port))
+        self.timeout = timeout
+        self.jpeg_quality = jpeg_quality
+        self.sock = None
+        self.requests = 0
+        self.bytes_sent = 0
+        self.last_error = None
+
+    def recognize(self, crops):
+        """Sends (BGR crop, location in crop) pairs and returns one result dict per crop. Raises OSError."""
+        try:
+            if self.sock is None:
+                self.sock = socket.create_connection(self.address, timeout=self.timeout)
+            send_frame(self.sock, json.dumps({'locations': [list(map(int, loc)) for _, loc in crops]}).encode('utf-8'))
+            for crop, _ in crops:
+                ok, jpeg = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                payload = jpeg.tobytes() if ok else b''
+                send_frame(self.sock, payload)
+                self.bytes_sent += len(payload)
+            response = recv_frame(self.sock)
+            if response is None:
+                raise ConnectionError("Recognition worker closed the connection.")
+            self.requests += 1
+            self.last_error = None
+            return json.loads(response.decode('utf-8'))['results']
+        except (OSError, ValueError) as e:
+            self.close()
+            self.last_error = str(e)
+            raise OSError(e)
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def stats(self):
+        lines = [f"worker: {self.address[0]}:{self.address[1]}, requests: {self.requests}",
+                 f"sent: {self.bytes_sent / 1024:.0f} KiB"]
+        if self.last_error:
+            lines.append(f"last error: {self.last_error}")
+        return lines
+
+
+class MotionGate:
+    """
+    Lets a frame through only if it differs noticeably from the last frame let
+    through, unless faces are in view (blinks must not be missed) or max_idle
+    seconds have passed. Frames are compared as tiny grayscale thumbnails.
+    """
+    def __init__(self, threshold=4.0, size=(64, 48), max_idle=2.0):
+        self.threshold = threshold
+        self.size = size
+        self.max_idle = max_idle
+        self.reference = None
+        self.last_pass = 0.0
+        self.passed = 0
+        self.skipped = 0
+
+    def should_process(self, frame, faces_in_view, now):
+        thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), self.size, interpolation=cv2.INTER_AREA).astype(np.int16)
+        if (faces_in_view or self.reference is None or now - self.last_pass > self.max_idle
+                or np.abs(thumbnail - self.reference).mean() > self.threshold):
+            self.reference, self.last_pass = thumbnail, now
+            self.passed += 1
+            return True
+        self.skipped += 1
+        return False
+
+
+class EventBus:
+    """
+    Publish/subscribe bus for recognition events, driven by an asyncio loop on a
+    background thread. Every subscriber has its own bounded queue and consumer
+    task: a slow sink only fills its own queue, and once that is full further
+    events are dropped for that sink (and counted), so publishing never blocks.
+    Durable sinks (lossless=True) get an unbounded queue instead: their events
+    are never dropped, stop() waits until all of them were handled, and a
+    failure is logged with the whole event. Blocking sinks (disk, sound,
+    network) run on their own single worker thread, which also keeps their
+    events in order.
+    """
+    EVENTS = ('time_in', 'time_out', 'late', 'unknown_face', 'liveness_failure')
+
+    class Subscriber:
+        def __init__(self, name, handler, event_types, queue_size, blocking, lossless):
+            self.name = name
+            self.handler = handler
+            self.event_types = set(event_types) if event_types else None
+            self.lossless = lossless
+            self.queue_size = 0 if lossless else queue_size
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sink-{name}") if blocking else None
+            self.queue = None
+            self.task = None
+            self.handled = 0
+            self.dropped = 0
+            self.failed = 0
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscribers = []
+        self.loop = None
+        self.thread = None
+        self.published = 0
+
+    def subscribe(self, name, handler, event_types=None, queue_size=None, blocking=False, lossless=False):
+        """
+        Registers a sink. 'handler' receives the event dict; it may be a coroutine
+        function. Set blocking=True for handlers that do I/O, and lossless=True for
+        sinks that write records which must not be dropped. Subscribe before start().
+        """
+        self.subscribers.append(self.Subscriber(name, handler, event_types, queue_size or self.queue_size, blocking, lossless))
+
+    def subscriber(self, name):
+        """Returns the subscriber registered under 'name', or None."""
+        return next((s for s in self.subscribers if s.name == name), None)
+
+    def start(self):
+        """Starts the event loop thread and one consumer task per subscriber."""
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            for subscriber in self.subscribers:
+                subscriber.queue = asyncio.Queue(maxsize=subscriber.queue_size)
+                subscriber.task = self.loop.create_task(self._consume(subscriber))
+            self.loop.call_soon(ready.set)
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True, name="event-bus")
+        self.thread.start()
+        ready.wait(5)
+
+    def publish(self, event_type, **data):
+        """Posts an event from any thread. Returns immediately."""
+        event = {'type': event_type, 'timestamp': datetime.now().isoformat(timespec='seconds'), **data}
+        self.published += 1
+        if self.loop is None or not self.loop.is_running():
+            # Without the loop, durable sinks are handled on the caller's thread; the rest are skipped.
+            for subscriber in self.subscribers:
+                if subscriber.lossless and (subscriber.event_types is None or event_type in subscriber.event_types):
+                    self._handle_now(subscriber, event)
+            return
+        self.loop.call_soon_threadsafe(self._dispatch, event)
+
+    def _handle_now(self, subscriber, event):
+        try:
+            subscriber.handler(event)
+            subscriber.handled += 1
+        except Exception as e:
+            self._failed(subscriber, event, e)
+
+    def _failed(self, subscriber, event, error):
+        subscriber.failed += 1
+        if subscriber.lossless:
+            logging.error(f"Event sink '{subscriber.name}' failed on {json.dumps(event, default=str)}: {error}")
+        else:
+            logging.error(f"Event sink '{subscriber.name}' failed on {event['type']}: {error}")
+
+    def _dispatch(self, event):
+        for subscriber in self.subscribers:
+            if subscriber.event_types is not None and event['type'] not in subscriber.event_types:
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber.dropped += 1
+
+    async def _consume(self, subscriber):
+        while True:
+            event = await subscriber.queue.get()
+            try:
+                if inspect.iscoroutinefunction(subscriber.handler):
+                    await subscriber.handler(event)
+                elif subscriber.executor is not None:
+                    await self.loop.run_in_executor(subscriber.executor, subscriber.handler, event)
+                else:
+                    subscriber.handler(event)
+                subscriber.handled += 1
+            except Exception as e:
+                self._failed(subscriber, event, e)
+            finally:
+                subscriber.queue.task_done()
+
+    async def _shutdown(self, timeout):
+        lossy = [s for s in self.subscribers if not s.lossless]
+        try:
+            await asyncio.wait_for(asyncio.gather(*(s.queue.join() for s in lossy)), timeout)
+        except asyncio.TimeoutError:
+            logging.error("Event bus stopped with undelivered events for: " + ", ".join(s.name for s in lossy if s.queue.qsize()))
+        # Durable sinks are drained completely, however long that takes.
+        await asyncio.gather(*(s.queue.join() for s in self.subscribers if s.lossless))
+        for subscriber in self.subscribers:
+            subscriber.task.cancel()
+
+    def stop(self, timeout=2.0):
+        """
+        Delivers what is queued and stops the loop. Lossy sinks get up to 'timeout'
+        seconds; durable sinks are always drained.
+        """
+        if self.loop is None or not self.loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(timeout), self.loop).result()
+        except Exception as e:
+            logging.error(f"Error stopping event bus: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=1.0)
+        for subscriber in self.subscribers:
+            if subscriber.executor is not None:
+                subscriber.executor.shutdown(wait=False)
+
+    def stats(self):
+        """Returns per-sink counters as display lines."""
+        lines = [f"published: {self.published}"]
+        for s in self.subscribers:
+            depth = s.queue.qsize() if s.queue is not None else 0
+            capacity = 'unbounded' if s.lossless else s.queue_size
+            lines.append(f"{s.name}: handled {s.handled}, queued {depth}/{capacity}, dropped {s.dropped}, failed {s.failed}")
+        return lines
+
+
+# Detector/encoder settings used for photos; part of the encoding cache key.
+PHOTO_ENCODER_SETTINGS = {'model': 'hog', 'num_jitters': 1}
+
+
+def encode_face_photo(path):
+    """
+    Process-pool worker: encodes the single face in a photo. Returns
+    (path, status, encoding) with status 'ok', 'no_face', 'multiple_faces' or 'error: ...'.
+    """
+    try:
+        image = face_recognition.load_image_file(path)
+        locations = face_recognition.face_locations(image, model=PHOTO_ENCODER_SETTINGS['model'])
+        if not locations:
+            return path, 'no_face', None
+        if len(locations) > 1:
+            return path, 'multiple_faces', None
+        return path, 'ok', face_recognition.face_encodings(image, locations, num_jitters=PHOTO_ENCODER_SETTINGS['num_jitters'])[0]
+    except Exception as e:
+        return path, f"error: {e}", None
+
+
+class EncodingCache:
+    """
+    Persistent cache of photo encodings keyed by the SHA-256 of the image bytes and
+    the encoder model version, so unchanged photos are never re-encoded. Changing
+    the encoder settings or library version invalidates the entries naturally.
+    """
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.hits = self.misses = 0
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as f:
+                    self.entries = pickle.load(f)
+            except Exception as e:
+                logging.error(f"Encoding cache unreadable, starting empty: {e}")
+
+    @staticmethod
+    def model_version():
+        """Identifies the encoder: library version plus detector/encoder settings."""
+        version = getattr(face_recognition.load(), '__version__', 'unknown')
+        return f"face_recognition-{version}/" + ",".join(f"{k}={v}" for k, v in sorted(PHOTO_ENCODER_SETTINGS.items()))
+
+    @staticmethod
+    def file_hash(path):
+        """Returns the SHA-256 of a file's content."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def encode_many(self, paths, workers=None, progress=None):
+        """
+        Returns {path: (status, encoding)} for the given photos. Cached photos are
+        answered immediately; the rest are encoded in a process pool and cached.
+        """
+        model = self.model_version()
+        results, pending = {}, {}
+        for path in paths:
+            key = f"{self.file_hash(path)}:{model}"
+            if key in self.entries:
+                results[path] = self.entries[key]
+                self.hits += 1
+            else:
+                pending[path] = key
+        if progress:
+            progress(len(results), len(paths))
+
+        if pending:
+            self.misses += len(pending)
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+                for path, status, encoding in pool.map(encode_face_photo, list(pending), chunksize=4):
+                    results[path] = (status, encoding)
+                    # Failures caused by the photo itself are cached too; unexpected errors are retried next time.
+                    if not status.startswith('error'):
+                        self.entries[pending[path]] = (status, encoding)
+                    if progress:
+                        progress(len(results), len(paths))
+            self.save()
+        return results
+
+    def save(self):
+        """Writes the cache atomically."""
+        try:
+            with open(self.cache_file + '.tmp', 'wb') as f:
+                pickle.dump(self.entries, f)
+            os.replace(self.cache_file + '.tmp', self.cache_file)
+        except OSError as e:
+            logging.error(f"Could not save encoding cache: {e}")
+
+
+def rebuild_gallery_from_photos(faces_dir, encodings_file, cache, workers=None, progress=None):
+    """
+    Regenerates the photo-derived templates of the encodings store from
+    registered_faces/<ID>.jpg, using the encoding cache. The existing store is the
+    starting point: multi-template enrolments and live captures are kept, and a
+    person whose photo has no usable face keeps their current templates (an
+    unreadable store starts empty). Returns {'persons', 'rebuilt' (the IDs whose
+    templates changed), 'failures', 'hits', 'misses', 'seconds'}. The previous store is replaced atomically.
+    """
+    started = time.perf_counter()
+    hits, misses = cache.hits, cache.misses
+    photos = sorted(os.path.join(faces_dir, f) for f in os.listdir(faces_dir)
+                    if f.lower().endswith('.jpg') and os.path.splitext(f)[0].isdigit())
+    results = cache.encode_many(photos, workers, progress)
+
+    gallery = FaceGallery()
+    if os.path.exists(encodings_file):
+        try:
+            with open(encodings_file, 'rb') as f:
+                data = f.read()
+            if not verify_checksum(encodings_file, data):
+                raise ValueError("checksum mismatch")
+            gallery = FaceGallery(*pickle.loads(data))
+        except Exception as e:
+            logging.error(f"Existing encodings unreadable, rebuilding from photos only: {e}")
+
+    rebuilt, failures = [], []
+    for path in photos:
+        status, encoding = results[path]
+        user_id = os.path.splitext(os.path.basename(path))[0]
+        if status == 'ok':
+            updated = gallery.with_photo_template(user_id, encoding)
+            if updated is not gallery:
+                rebuilt.append(user_id)
+            gallery = updated
+        else:
+            failures.append((user_id, status))
+
+    atomic_write(encodings_file, pickle.dumps((list(gallery.encodings), gallery.ids, gallery.sources)))
+    return {'persons': len(gallery.person_ids), 'rebuilt': rebuilt, 'failures': failures, 'hits': cache.hits - hits,
+            'misses': cache.misses - misses, 'seconds': time.perf_counter() - started}
+
+
+class BulkEnrolmentImporter:
+    """
+    Enrols a whole cohort from a roster CSV (ID, Name, ScheduleDays, ScheduleTimeIn,
+    ScheduleTimeOut) and a folder of photos named by ID. Photos are encoded in a
+    process pool without touching any data ('prepare'); the result is then merged
+    into the roster and gallery as they are at commit time, so nothing registered
+    or edited during the encoding is lost, and written in one step.
+    """
+    PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+    DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+    def __init__(self, students_file, encodings_file, faces_dir='registered_faces', workers=None, cache=None):
+        self.students_file = students_file
+        self.encodings_file = encodings_file
+        self.faces_dir = faces_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache or EncodingCache(os.path.join(os.path.dirname(encodings_file), 'encoding_cache.pkl'))
+
+    def _find_photo(self, photo_dir, user_id, photos):
+        """Returns the photo for an ID (any supported extension, case-insensitive), or None."""
+        for ext in self.PHOTO_EXTENSIONS:
+            name = photos.get(f"{user_id}{ext}".lower())
+            if name:
+                return os.path.join(photo_dir, name)
+        return None
+
+    def _validate_roster(self, roster, existing_ids):
+        """Splits roster rows into valid ones and failures (ID, Name, reason)."""
+        valid, failures, seen = [], [], set(existing_ids)
+        for _, row in roster.iterrows():
+            user_id = str(row.get('ID', '')).strip()
+            name = str(row.get('Name', '')).strip()
+            days = [d.strip().title()[:3] for d in str(row.get('ScheduleDays', '') or '').split(',') if d.strip()]
+            time_in = format_schedule_time(str(row.get('ScheduleTimeIn', '') or '').strip())
+            time_out = format_schedule_time(str(row.get('ScheduleTimeOut', '') or '').strip())
+            if not user_id.isdigit():
+                failures.append((user_id, name, 'invalid_id'))
+            elif user_id in seen:
+                failures.append((user_id, name, 'duplicate_id'))
+            elif not name:
+                failures.append((user_id, name, 'missing_name'))
+            elif any(d not in self.DAYS for d in days) or time_in is None or time_out is None:
+                failures.append((user_id, name, 'invalid_schedule'))
+            else:
+                seen.add(user_id)
+                valid.append({'ID': user_id, 'Name': name, 'ScheduleDays': ",".join(d for d in self.DAYS if d in days),
+                              'ScheduleTimeIn': time_in, 'ScheduleTimeOut': time_out})
+        return valid, failures
+
+    def prepare(self, roster_path, photo_dir, progress=None):
+        """
+        Validates the roster and encodes the photos; nothing is written. Returns
+        {'accepted': [(row, photo path, encoding)], 'failures': [(ID, Name, reason)],
+        'started': perf_counter}. 'progress(done, total)' is called as photos are encoded.
+        """
+        started = time.perf_counter()
+        roster = pd.read_csv(roster_path, dtype=str, keep_default_na=False)
+        students = pd.read_csv(self.students_file, dtype=str, keep_default_na=False) if os.path.exists(self.students_file) else None
+        existing_ids = set(students['ID'].str.strip()) if students is not None else set()
+        valid, failures = self._validate_roster(roster, existing_ids)
+
+        photos = {f.lower(): f for f in os.listdir(photo_dir)}
+        jobs = {}
+        for row in valid:
+            photo = self._find_photo(photo_dir, row['ID'], photos)
+            if photo:
+                jobs[photo] = row
+            else:
+                failures.append((row['ID'], row['Name'], 'no_photo'))
+
+        accepted = []
+        for path, (status, encoding) in self.cache.encode_many(list(jobs), self.workers, progress).items():
+            row = jobs[path]
+            if status == 'ok':
+                accepted.append((row, path, encoding))
+            else:
+                failures.append((row['ID'], row['Name'], status))
+        return {'accepted': accepted, 'failures': failures, 'started': started}
+
+    def stage_photos(self, accepted):
+        """
+        Copies the accepted photos next to their targets in faces_dir as temporary
+        files. Returns {ID: (temporary file, target)}; see install_photos.
+        """
+        staged = {}
+        try:
+            for row, path, _ in accepted:
+                target = os.path.join(self.faces_dir, f"{row['ID']}.jpg")
+                if path.lower().endswith(('.jpg', '.jpeg')):
+                    # Byte-identical copy keeps the encoding cache valid for later gallery rebuilds.
+                    shutil.copyfile(path, target + '.tmp.jpg')
+                elif not cv2.imwrite(target + '.tmp.jpg', cv2.imread(path)):
+                    raise OSError(f"could not write {target}")
+                staged[row['ID']] = (target + '.tmp.jpg', target)
+        except Exception:
+            self.install_photos(staged, ())
+            raise
+        return staged
+
+    @staticmethod
+    def install_photos(staged, ids):
+        """Moves the staged photos of 'ids' into place and deletes the other staged files."""
+        ids = set(ids)
+        for user_id, (tmp, target) in staged.items():
+            if user_id in ids:
+                os.replace(tmp, target)
+            elif os.path.exists(tmp):
+                os.remove(tmp)
+
+    @staticmethod
+    def merge(accepted, existing_ids, gallery):
+        """
+        Adds the accepted rows to a gallery read at commit time. Rows whose ID was
+        registered since the import started are refused. Returns (new gallery,
+        roster rows to append, refused (ID, Name, reason)).
+        """
+        existing_ids = {str(i) for i in existing_ids} | set(gallery.person_ids)
+        rows, refused = [], []
+        for row, _, _ in accepted:
+            if row['ID'] in existing_ids:
+                refused.append((row['ID'], row['Name'], 'duplicate_id'))
+            else:
+                rows.append(row)
+        added = {row['ID'] for row in rows}
+        encodings = [encoding[None, :] for row, _, encoding in accepted if row['ID'] in added]
+        if not encodings:
+            return gallery, rows, refused
+        ids = [row['ID'] for row in rows]
+        return (FaceGallery(np.vstack([gallery.encodings] + encodings), gallery.ids + ids, gallery.sources + ['photo'] * len(ids)),
+                rows, refused)
+
+    def run(self, roster_path, photo_dir, progress=None):
+        """
+        Imports the roster straight into the files (command line; the app commits
+        through commit_bulk_import instead). Returns {'imported': [ids], 'failures':
+        [(ID, Name, reason)], 'seconds': float}.
+        """
+        prepared = self.prepare(roster_path, photo_dir, progress)
+        imported = self._commit(prepared['accepted'], prepared['failures']) if prepared['accepted'] else []
+        return {'imported': imported, 'failures': prepared['failures'], 'seconds': time.perf_counter() - prepared['started']}
+
+    def _commit(self, accepted, failures):
+        """
+        Writes photos, the encodings store and students.csv, re-reading both files
+        first so rows registered meanwhile are kept. All writes go through
+        atomic_write; if students.csv cannot be written the previous encodings are
+        put back. Returns the imported IDs; refused rows are added to 'failures'.
+        """
+        students = pd.read_csv(self.students_file, dtype=str, keep_default_na=False) if os.path.exists(self.students_file) else \
+            pd.DataFrame(columns=['ID', 'Name', 'ScheduleDays', 'ScheduleTimeIn', 'ScheduleTimeOut'])
+        old_data = None
+        gallery = FaceGallery()
+        if os.path.exists(self.encodings_file):
+            with open(self.encodings_file, 'rb') as f:
+                old_data = f.read()
+            gallery = FaceGallery(*pickle.loads(old_data))
+        gallery, rows, refused = self.merge(accepted, students['ID'].str.strip(), gallery)
+        failures.extend(refused)
+        if not rows:
+            return []
+
+        ids = [row['ID'] for row in rows]
+        staged = self.stage_photos([item for item in accepted if item[0]['ID'] in ids])
+        try:
+            atomic_write(self.encodings_file, pickle.dumps((list(gallery.encodings), gallery.ids, gallery.sources)))
+            try:
+                students = pd.concat([students, pd.DataFrame(rows)], ignore_index=True)
+                atomic_write(self.students_file, students.to_csv(index=False).encode('utf-8'))
+            except Exception:
+                if old_data is not None:
+                    atomic_write(self.encodings_file, old_data)
+                raise
+        except Exception:
+            self.install_photos(staged, ())
+            raise
+        self.install_photos(staged, ids)
+        return ids
+
+    @staticmethod
+    def write_failure_report(failures, report_path):
+        """Writes the list of rejected roster rows to a CSV file."""
+        with open(report_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['ID', 'Name', 'Reason'])
+            writer.writerows(failures)
+
+class RecognitionResult(namedtuple('RecognitionResult', ['seq', 'frame_time', 'faces'])):
+    """
+    Everything recognised in one processed frame. 'faces' is a tuple of
+    (location, name, face_id), so a box can never be paired with another face's
+    name. The processing thread publishes a new result by replacing the
+    reference; readers take the reference once and need no lock.
+    """
+    __slots__ = ()
+
+
+RecognitionResult.EMPTY = RecognitionResult(0, 0.0, ())
+
+
+class FileWatcher:
+    """
+    Detects changes to a file by polling its (mtime, size) at most every
+    'interval' seconds. Writers in this process call mark_seen() after writing,
+    so only changes made elsewhere (another app instance, the CLI, a text
+    editor) are reported.
+    """
+    def __init__(self, path, interval=2.0):
+        self.path = path
+        self.interval = interval
+        self.signature = self._signature()
+        self.last_check = 0.0
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def mark_seen(self):
+        self.signature = self._signature()
+
+    def changed(self, now=None):
+        """True once for each change made since the last mark_seen()."""
+        now = time.monotonic() if now is None else now
+        if now - self.last_check < self.interval:
+            return False
+        self.last_check = now
+        signature = self._signature()
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        return True
+
+
+class IdentityCache:
+    """
+    Short-lived memory of who is standing where. Once a person has been logged,
+    their face box is remembered until their cooldown ends, and faces found at
+    about the same place and size in later frames reuse that identity without
+    being encoded or matched. An entry is dropped as soon as a processed frame
+    has no face at its place, so somebody else stepping into the same spot is
+    recognised normally. Entries are also dropped after 'verify_hits' hits or
+    'verify_age' seconds, which sends the face through matching again; the
+    caller re-remembers it if it is still the same person. At most
+    'max_entries' are kept (least recently seen is evicted).
+    """
+    def __init__(self, idle_ttl=1.5, max_entries=32, max_shift=0.5, max_scale=1.5, verify_hits=10, verify_age=2.0):
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        self.max_shift = max_shift
+        self.max_scale = max_scale
+        self.verify_hits = verify_hits
+        self.verify_age = verify_age
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.verifications = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.idle_ttl > 0
+
+    def _distance(self, entry_box, box):
+        """Centre shift relative to the face size, or None if the boxes are too different to be the same face."""
+        top, right, bottom, left = box
+        e_top, e_right, e_bottom, e_left = entry_box
+        size, e_size = max(1, right - left), max(1, e_right - e_left)
+        if not 1 / self.max_scale <= size / e_size <= self.max_scale:
+            return None
+        shift = np.hypot((left + right - e_left - e_right) / 2, (top + bottom - e_top - e_bottom) / 2) / e_size
+        return shift if shift <= self.max_shift else None
+
+    def _expire(self, now):
+        for face_id in [f for f, entry in self.entries.items()
+                        if now >= entry['expires_at'] or now - entry['last_seen'] > self.idle_ttl]:
+            del self.entries[face_id]
+            self.evictions += 1
+
+    def lookup(self, boxes, now=None):
+        """
+        Returns one (face_id, name) or None per box of a processed frame. Each entry
+        can claim at most one box per frame; entries that claim none are dropped,
+        and so are entries due for re-verification (their box is returned as None).
+        """
+        now = time.monotonic() if now is None else now
+        results = [None] * len(boxes)
+        if not self.enabled:
+            return results
+        with self.lock:
+            self._expire(now)
+            claimed = set()
+            for i, box in enumerate(boxes):
+                best = None
+                for face_id, entry in self.entries.items():
+                    if face_id in claimed:
+                        continue
+                    shift = self._distance(entry['box'], box)
+                    if shift is not None and (best is None or shift < best[0]):
+                        best = (shift, face_id)
+                if best is None:
+                    self.misses += 1
+                    continue
+                face_id = best[1]
+                claimed.add(face_id)
+                entry = self.entries.pop(face_id)
+                if entry['hits'] >= self.verify_hits or now - entry['verified_at'] >= self.verify_age:
+                    self.verifications += 1
+                    self.misses += 1
+                    continue
+                entry['box'], entry['last_seen'] = tuple(box), now
+                entry['hits'] += 1
+                self.entries[face_id] = entry
+                results[i] = (face_id, entry['name'])
+                self.hits += 1
+            for face_id in [f for f in self.entries if f not in claimed]:
+                del self.entries[face_id]
+                self.evictions += 1
+        return results
+
+    def remember(self, box, face_id, name, expires_at, now=None):
+        """Caches an identity at a face box until expires_at (same clock as 'now')."""
+        now = time.monotonic() if now is None else now
+        if not self.enabled or expires_at <= now:
+            return
+        with self.lock:
+            self.entries.pop(face_id, None)
+            self.entries[face_id] = {'box': tuple(box), 'name': name, 'expires_at': expires_at, 'last_seen': now,
+                                     'verified_at': now, 'hits': 0}
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def forget(self, face_id):
+        """Drops the cached identity of one person (e.g. after a rename)."""
+        with self.lock:
+            self.entries.pop(str(face_id), None)
+
+    def stats(self):
+        """Returns the cache counters as display lines."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            rate = f"{100 * self.hits / lookups:.1f}%" if lookups else "n/a"
+            return [f"cached faces: {len(self.entries)}, evicted: {self.evictions}, re-verified: {self.verifications}",
+                    f"hits: {self.hits}, misses: {self.misses}, hit rate: {rate}"]
+
+class UnknownFaceClusters:
+    """
+    Groups faces that matched nobody, so a repeat visitor shows up as one entry
+    instead of one per frame. Each encoding joins the nearest cluster whose
+    centroid (a running mean) is within 'threshold', or starts a new cluster.
+    A cluster keeps its last 'max_samples' encodings for enrolment and one
+    representative crop on disk, rewritten at most every 'crop_interval'
+    seconds. Sightings more than 'visit_gap' seconds apart count as separate
+    visits. Beyond 'max_clusters' the least recently seen cluster is dropped.
+    """
+    def __init__(self, state_file, crops_dir='unknown_faces', threshold=0.5, max_clusters=100,
+                 max_samples=20, crop_interval=30.0, visit_gap=60.0):
+        self.state_file = state_file
+        self.crops_dir = crops_dir
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self.max_samples = max_samples
+        self.crop_interval = crop_interval
+        self.visit_gap = visit_gap
+        self.clusters = OrderedDict()
+        self.next_id = 1
+        self.sightings = 0
+        self.crops_saved = 0
+        self.evictions = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+        # Serializes save() between the processing and Tk threads, so snapshots are written in order.
+        self.write_lock = threading.Lock()
+        os.makedirs(crops_dir, exist_ok=True)
+        self.load()
+
+    def crop_path(self, cluster_id):
+        return os.path.join(self.crops_dir, f"cluster_{cluster_id}.jpg")
+
+    def _nearest(self, encoding):
+        """Returns (cluster id, distance) of the closest centroid, or (None, None) when there are no clusters."""
+        if not self.clusters:
+            return None, None
+        cluster_ids = list(self.clusters)
+        distances = np.linalg.norm(np.array([c['centroid'] for c in self.clusters.values()]) - encoding, axis=1)
+        best = int(np.argmin(distances))
+        return cluster_ids[best], float(distances[best])
+
+    def add(self, encoding, crop=None, now=None):
+        """Adds one unknown face (and optionally its image crop). Returns the cluster id."""
+        encoding = np.asarray(encoding, dtype=np.float64)
+        now = datetime.now() if now is None else now
+        evicted = []
+        with self.lock:
+            cluster_id, distance = self._nearest(encoding)
+            if cluster_id is None or distance > self.threshold:
+                cluster_id = self.next_id
+                self.next_id += 1
+                self.clusters[cluster_id] = {'centroid': np.zeros_like(encoding), 'count': 0, 'visits': 0, 'samples': [],
+                                             'first_seen': now, 'last_seen': None, 'crop_time': 0.0}
+                while len(self.clusters) > self.max_clusters:
+                    evicted.append(self.clusters.popitem(last=False)[0])
+                    self.evictions += 1
+            cluster = self.clusters[cluster_id]
+            self.clusters.move_to_end(cluster_id)
+            cluster['count'] += 1
+            cluster['centroid'] = cluster['centroid'] + (encoding - cluster['centroid']) / cluster['count']
+            if cluster['last_seen'] is None or (now - cluster['last_seen']).total_seconds() > self.visit_gap:
+                cluster['visits'] += 1
+            cluster['last_seen'] = now
+            cluster['samples'].append(encoding)
+            del cluster['samples'][:-self.max_samples]
+            save_crop = crop is not None and crop.size and time.time() - cluster['crop_time'] >= self.crop_interval
+            if save_crop:
+                cluster['crop_time'] = time.time()
+            self.sightings += 1
+            self.dirty = True
+
+        if save_crop and cv2.imwrite(self.crop_path(cluster_id), crop):
+            self.crops_saved += 1
+        for old_id in evicted:
+            self._delete_crop(old_id)
+        return cluster_id
+
+    def _delete_crop(self, cluster_id):
+        try:
+            os.remove(self.crop_path(cluster_id))
+        except OSError:
+            pass
+
+    def summaries(self):
+        """Returns one dict per cluster (most recently seen first) without the samples."""
+        with self.lock:
+            return [{'id': cluster_id, 'count': c['count'], 'visits': c['visits'], 'first_seen': c['first_seen'],
+                     'last_seen': c['last_seen'], 'centroid': c['centroid'],
+                     'crop': self.crop_path(cluster_id) if c['crop_time'] else None}
+                    for cluster_id, c in reversed(self.clusters.items())]
+
+    def samples(self, cluster_id):
+        """Returns the stored encodings of a cluster."""
+        with self.lock:
+            return np.array(self.clusters[cluster_id]['samples'])
+
+    def remove(self, cluster_id, keep_crop=False):
+        """Forgets a cluster (after it was enrolled, merged or discarded)."""
+        with self.lock:
+            self.clusters.pop(cluster_id, None)
+            self.dirty = True
+        if not keep_crop:
+            self._delete_crop(cluster_id)
+
+    def load(self):
+        try:
+            with open(self.state_file, 'rb') as f:
+                state = pickle.load(f)
+            self.clusters, self.next_id = state['clusters'], state['next_id']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Could not load unknown face clusters from {self.state_file}: {e}")
+
+    def save(self):
+        """Writes the clusters to disk (with atomic_write) if they changed since the last save."""
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                state = {'clusters': OrderedDict((cluster_id, dict(c, samples=list(c['samples'])))
+                                                 for cluster_id, c in self.clusters.items()),
+                         'next_id': self.next_id}
+                self.dirty = False
+            try:
+                atomic_write(self.state_file, pickle.dumps(state), checksum=False)
+            except Exception as e:
+                with self.lock:
+                    self.dirty = True
+                logging.error(f"Could not save unknown face clusters: {e}")
+
+    def stats(self):
+        """Returns the clustering counters as display lines."""
+        with self.lock:
+            visits = sum(c['visits'] for c in self.clusters.values())
+            return [f"clusters: {len(self.clusters)}, visits: {visits}, sightings: {self.sightings}",
+                    f"crops saved: {self.crops_saved}, evicted: {self.evictions}"]
+
+
 class FacialRecognitionAttendanceSystem:
     """
     An advanced facial recognition attendance system with a graphical user interface
@@ -45,8 +3772,11 @@ class FacialRecognitionAttendanceSystem:
             print("Warning: 'app_icon.ico' not found for the window. Using default icon.")
 
         self.root.geometry("1250x800")
+
+        # --- NEW: Startup is timed per phase; slow work runs on background threads ---
+        self.startup = StartupProfiler()
         
-        for folder in ['data', 'icons', 'registered_faces', 'data_backups', 'sounds']:
+        for folder in ['data', 'icons', 'registered_faces', 'data_backups', 'sounds', 'unknown_faces']:
             os.makedirs(folder, exist_ok=True)
 
         self.setup_logging()
@@ -60,33 +3790,98 @@ class FacialRecognitionAttendanceSystem:
         self.setup_sound()
 
         self.students_file = 'data/students.csv'
+        # Roster rows read_students could not type; save_students writes them back.
+        self.student_raw_rows = None
         self.attendance_file = 'data/attendance.csv'
         self.scan_log_file = 'data/scan_log.csv'
         self.encodings_file = 'data/encodings.pkl'
 
+        # --- NEW: Attendance and scan log are stored as date partitions with a manifest ---
+        attendance_columns = ['ID', 'Name', 'Date', 'TimeIn', 'TimeOut']
+        scan_log_columns = ['ID', 'Name', 'Date', 'Time']
+        self.partition_write_failures = 0
+        self.attendance_store = PartitionedCSVStore(
+            'data/attendance', 'attendance', attendance_columns,
+            self.safe_read_csv, self._save_partition_csv, self.PARTITION_GRANULARITY,
+            ColumnarArchive('data/attendance', 'attendance', attendance_columns, ['TimeIn', 'TimeOut']))
+        self.scan_log_store = PartitionedCSVStore(
+            'data/scan_log', 'scan_log', scan_log_columns,
+            self.safe_read_csv, self._save_partition_csv, self.PARTITION_GRANULARITY,
+            ColumnarArchive('data/scan_log', 'scan_log', scan_log_columns, ['Time']))
+        self.backups = IncrementalBackup('data_backups')
+        self.analytics = AttendanceAnalytics(os.path.join('data', 'daily_rollups.csv'), self.attendance_store)
+        self.api = AttendanceAPI(self.attendance_store, self.scan_log_store, self.get_schedule_engine)
+        self.sync = None
+        if self.SYNC_SERVER_URL:
+            self.sync = SyncClient(self.KIOSK_ID, os.path.join('data', 'sync_queue.jsonl'), os.path.join('data', 'sync_state.json'),
+                                   HTTPSyncTransport(self.SYNC_SERVER_URL, secret=self.SYNC_SECRET))
+        self.events = self.create_event_bus()
+        self.camera_discovery = CameraDiscovery(
+            'data/camera_cache.json', probe_timeout=self.CAMERA_PROBE_TIMEOUT,
+            rescan_interval=self.CAMERA_RESCAN_SECONDS, busy_indices=self._busy_camera_indices)
+
+        # Legacy logs are migrated before the backup snapshot starts, so it never sees a half-renamed file.
+        with self.startup.phase('initialize_files'):
+            self.initialize_files()
+
+        # --- NEW: Scans are written ahead to a log; events lost in a crash are replayed before the backup ---
+        self.scan_wal = ScanEventWAL(os.path.join('data', 'scan_events.wal'),
+                                     flushers=(self.attendance_store.flush_to_disk, self.scan_log_store.flush_to_disk))
+        with self.startup.phase('replay_wal'):
+            self.replay_scan_wal()
+        self.scan_wal.start()
+
         self.backup_data_files()
-        self.initialize_files()
 
-        self.known_face_encodings, self.known_face_ids = [], []
+        self.gallery = FaceGallery()
         self.cap, self.scanning = None, False
+        # Camera indices in use, read by the discovery thread instead of the Tk variable.
+        self.active_camera_index = None
+        self.registration_camera_index = None
         self.last_recognition_times = {}
-        self.last_known_locations, self.last_known_names = [], []
-        self.live_blink_counters = {}
+        self.gallery_lock = threading.Lock()
+        self.gallery_version = 0
+        # ID -> name used by the processing thread; updated in place by roster deltas.
+        self.student_names = {}
+        self.roster_version = 0
+        self.roster_watcher = FileWatcher(self.students_file)
+        self.gallery_watcher = FileWatcher(self.encodings_file)
+        self.recognition_result = RecognitionResult.EMPTY
+        self.liveness_tracker = LivenessTracker(
+            min_closed=self.BLINK_MIN_CLOSED_SECONDS, max_closed=self.BLINK_MAX_CLOSED_SECONDS,
+            track_ttl=self.LIVENESS_TRACK_TTL_SECONDS)
+        self.identity_cache = IdentityCache(idle_ttl=self.IDENTITY_CACHE_IDLE_SECONDS)
+        self.unknown_clusters = UnknownFaceClusters(os.path.join('data', 'unknown_clusters.pkl'))
+        self.tolerances_file = os.path.join('data', 'tolerances.json')
+        self.match_tolerance, self.user_tolerances = load_match_tolerances(self.tolerances_file, self.TOLERANCE_MODE, self.MATCH_TOLERANCE)
+        self.telemetry_file = os.path.join('data', 'match_telemetry.npz')
+        self.match_telemetry = MatchTelemetry()
+        self.match_telemetry.load(self.telemetry_file)
+        self.schedule_engine, self.schedule_signature = None, None
+        self.remote_recognizer = RemoteRecognizer(self.RECOGNITION_WORKER) if self.RECOGNITION_MODE == 'remote' else None
+        self.event_counts = {event_type: 0 for event_type in EventBus.EVENTS}
+        self.last_unknown_event = 0.0
+        self.motion_gate = MotionGate(self.MOTION_THRESHOLD)
+        self.face_cascade = None
         self.editing_user_id = None
         
         self.processing_thread = None
         self.camera_thread = None
         self.current_frame = None
         self.frame_lock = threading.Lock()
+        # Bumped by the camera and processing threads so the preview only redraws on change.
+        self.frame_seq = 0
         
         self.PROCESS_EVERY_N_FRAMES = 5
         self.frame_counter = 0
+        self.startup_pending = {'load_encodings', 'probe_cameras'}
 
-        self.create_widgets()
-        self.update_scan_status(False)
+        with self.startup.phase('create_widgets'):
+            self.create_widgets()
+            self.update_scan_status(False)
 
         self.show_loading_screen()
-        self.root.after(100, self.load_initial_data)
+        self.root.after(0, self.start_background_initialization)
 
     def setup_logging(self):
         """Configures logging to save errors to a file."""
@@ -114,7 +3909,42 @@ class FacialRecognitionAttendanceSystem:
             self.config['Settings'] = {
                 'RecognitionCooldownSeconds': '60',
                 'EyeAspectRatioThreshold': '0.25',
-                'HeadTiltThreshold': '15'
+                'HeadTiltThreshold': '15',
+                'PartitionGranularity': 'month',
+                'ColumnarArchive': 'true',
+                'BackupKeepLast': '20',
+                'BackupKeepDays': '14',
+                'CameraProbeTimeoutSeconds': '3',
+                'CameraRescanSeconds': '15',
+                'CaptureWidth': '0',
+                'CaptureHeight': '0',
+                'CaptureFPS': '0',
+                'CaptureFormat': '',
+                'CaptureBufferSize': '1',
+                'ProcessingScale': '0.25',
+                'HighResEncoding': 'true',
+                'PreviewFPS': '15',
+                'BlinkMinClosedSeconds': '0.1',
+                'BlinkMaxClosedSeconds': '1.0',
+                'LivenessTrackTTLSeconds': '3',
+                'EnrolmentSamples': '8',
+                'EnrolmentMedoids': '3',
+                'AdaptiveTemplates': 'false',
+                'AdaptiveTemplateDistance': '0.35',
+                'MaxTemplatesPerPerson': '8',
+                'IdentityCacheIdleSeconds': '1.5',
+                'ApiEnabled': 'false',
+                'ApiPort': '8765',
+                'SyncServerURL': '',
+                'SyncSecret': '',
+                'KioskID': '',
+                'SyncIntervalSeconds': '30',
+                'RecognitionMode': 'local',
+                'RecognitionWorker': '127.0.0.1:8766',
+                'MotionThreshold': '4.0',
+                'WebhookURL': '',
+                'MatchTolerance': '0.5',
+                'ToleranceMode': 'fixed'
             }
             with open(self.config_file, 'w') as configfile:
                 self.config.write(configfile)
@@ -124,8 +3954,50 @@ class FacialRecognitionAttendanceSystem:
         self.RECOGNITION_COOLDOWN_SECONDS = settings.getint('RecognitionCooldownSeconds', 60)
         self.EYE_AR_THRESH = settings.getfloat('EyeAspectRatioThreshold', 0.25)
         self.HEAD_TILT_THRESH = settings.getint('HeadTiltThreshold', 15)
+        self.PARTITION_GRANULARITY = settings.get('PartitionGranularity', 'month')
+        self.COLUMNAR_ARCHIVE = settings.getboolean('ColumnarArchive', True)
+        self.BACKUP_KEEP_LAST = settings.getint('BackupKeepLast', 20)
+        self.BACKUP_KEEP_DAYS = settings.getint('BackupKeepDays', 14)
+        self.CAMERA_PROBE_TIMEOUT = settings.getfloat('CameraProbeTimeoutSeconds', 3.0)
+        self.CAMERA_RESCAN_SECONDS = settings.getfloat('CameraRescanSeconds', 15.0)
+        # Capture properties; 0 or empty keeps the camera's default.
+        self.CAPTURE_WIDTH = settings.getint('CaptureWidth', 0)
+        self.CAPTURE_HEIGHT = settings.getint('CaptureHeight', 0)
+        self.CAPTURE_FPS = settings.getint('CaptureFPS', 0)
+        self.CAPTURE_FORMAT = settings.get('CaptureFormat', '').strip().upper()
+        self.CAPTURE_BUFFER_SIZE = settings.getint('CaptureBufferSize', 1)
+        self.PROCESSING_SCALE = min(1.0, max(0.1, settings.getfloat('ProcessingScale', 0.25)))
+        self.HIGH_RES_ENCODING = settings.getboolean('HighResEncoding', True)
+        self.PREVIEW_FPS = settings.getint('PreviewFPS', 15)
         self.EYE_AR_CONSEC_FRAMES_REGISTER = 3
-        self.EYE_AR_CONSEC_FRAMES_ATTENDANCE = 2
+        self.BLINK_MIN_CLOSED_SECONDS = settings.getfloat('BlinkMinClosedSeconds', 0.1)
+        self.BLINK_MAX_CLOSED_SECONDS = settings.getfloat('BlinkMaxClosedSeconds', 1.0)
+        self.LIVENESS_TRACK_TTL_SECONDS = settings.getfloat('LivenessTrackTTLSeconds', 3.0)
+        self.ENROLMENT_SAMPLES = settings.getint('EnrolmentSamples', 8)
+        self.ENROLMENT_MEDOIDS = settings.getint('EnrolmentMedoids', 3)
+        self.ADAPTIVE_TEMPLATES = settings.getboolean('AdaptiveTemplates', False)
+        self.ADAPTIVE_TEMPLATE_DISTANCE = settings.getfloat('AdaptiveTemplateDistance', 0.35)
+        self.MAX_TEMPLATES_PER_PERSON = settings.getint('MaxTemplatesPerPerson', 8)
+        # How long a logged face may go unseen before its cached identity is dropped; 0 disables the cache.
+        self.IDENTITY_CACHE_IDLE_SECONDS = settings.getfloat('IdentityCacheIdleSeconds', 1.5)
+        # Local JSON API for other systems; always bound to 127.0.0.1.
+        self.API_ENABLED = settings.getboolean('ApiEnabled', False)
+        self.API_PORT = settings.getint('ApiPort', 8765)
+        # Fleet sync with an aggregation service; an empty URL keeps the kiosk standalone.
+        self.SYNC_SERVER_URL = settings.get('SyncServerURL', '').strip()
+        # Shared with the aggregation service, which rejects requests without it.
+        self.SYNC_SECRET = settings.get('SyncSecret', '').strip()
+        self.KIOSK_ID = settings.get('KioskID', '').strip() or socket.gethostname()
+        self.SYNC_INTERVAL_SECONDS = settings.getfloat('SyncIntervalSeconds', 30.0)
+        # 'remote' sends face crops to a recognition worker (--recognition-worker) instead of encoding locally.
+        self.RECOGNITION_MODE = settings.get('RecognitionMode', 'local').strip().lower()
+        self.RECOGNITION_WORKER = settings.get('RecognitionWorker', '127.0.0.1:8766').strip()
+        self.MOTION_THRESHOLD = settings.getfloat('MotionThreshold', 4.0)
+        # Recognition events are POSTed here as JSON when set.
+        self.WEBHOOK_URL = settings.get('WebhookURL', '').strip()
+        # Maximum face distance for a match; ToleranceMode 'global' or 'per_user' uses the calibrated data/tolerances.json instead.
+        self.MATCH_TOLERANCE = settings.getfloat('MatchTolerance', 0.5)
+        self.TOLERANCE_MODE = settings.get('ToleranceMode', 'fixed').strip().lower()
 
     def save_config(self):
         """Saves the current settings to the config.ini file."""
@@ -166,25 +4038,19 @@ class FacialRecognitionAttendanceSystem:
 
 
     def play_sound(self, sound_type):
-        """Plays a specific sound based on the event type in a separate thread."""
+        """Plays a specific sound to completion. Called from the event bus' single sound worker."""
         if not self.sound_enabled:
             return
 
         sound_path = self.sound_files.get(sound_type)
         if sound_path and os.path.exists(sound_path):
             try:
-                threading.Thread(
-                    target=lambda: winsound.PlaySound(sound_path, winsound.SND_FILENAME | winsound.SND_ASYNC),
-                    daemon=True
-                ).start()
+                winsound.PlaySound(sound_path, winsound.SND_FILENAME)
             except Exception as e:
                 logging.error(f"Failed to play sound {sound_path}: {e}")
         else:
             try:
-                threading.Thread(
-                    target=lambda: winsound.PlaySound("SystemAsterisk", winsound.SND_ALIAS | winsound.SND_ASYNC),
-                    daemon=True
-                ).start()
+                winsound.PlaySound("SystemAsterisk", winsound.SND_ALIAS)
             except Exception as e:
                 logging.error(f"Failed to play fallback sound: {e}")
 
@@ -238,19 +4104,135 @@ class FacialRecognitionAttendanceSystem:
         self.progress_bar.stop()
         self.loading_frame.destroy()
 
+    def start_background_initialization(self):
+        """
+        Starts the slow startup work on background threads once the window is up.
+        Model loading, encoding loading, camera probing and archive rollover run in
+        parallel; the UI is filled in as each phase completes.
+        """
+        self.startup.mark('window_shown')
+        if self.camera_discovery.cached_indices():
+            # Show the last known cameras right away; the probe below confirms them.
+            self.update_camera_selector(self.camera_discovery.cached_indices())
+        self._run_startup_phase('import_pandas', pd.load, lambda _: self.load_initial_data())
+        self._run_startup_phase('load_models', self._preload_models)
+        self._run_startup_phase('load_encodings', self.load_known_faces, lambda _: self._startup_phase_done('load_encodings'))
+        self._run_startup_phase('probe_cameras', self.get_available_cameras, self._on_cameras_found)
+        self._run_startup_phase('archive_rollover', self.rollover_archives)
+        self._run_startup_phase('analytics_rollups', lambda: self.analytics.sync(self.get_schedule_engine()))
+        if self.API_ENABLED:
+            self._run_startup_phase('start_api', self.start_api)
+        if self.sync:
+            self.sync.start(self.SYNC_INTERVAL_SECONDS, lambda changes: self.root.after(0, self.apply_gallery_changes, changes))
+
+    def _run_startup_phase(self, name, func, on_done=None):
+        """Runs a timed startup phase on a daemon thread and hands its result to the UI thread."""
+        def worker():
+            result = None
+            try:
+                with self.startup.phase(name):
+                    result = func()
+            except Exception as e:
+                logging.error(f"Startup phase '{name}' failed: {e}")
+            if on_done:
+                self.root.after(0, on_done, result)
+        threading.Thread(target=worker, daemon=True).start()
+
+    def create_event_bus(self):
+        """Wires the side effects of recognition events to their sinks and starts the bus."""
+        bus = EventBus()
+        scans = ('time_in', 'time_out', 'late')
+        bus.subscribe('metrics', self._count_event)
+        bus.subscribe('ui', lambda event: self.root.after(0, self._show_event, event), scans, queue_size=20)
+        bus.subscribe('sound', self._play_event_sound, scans, queue_size=3, blocking=True)
+        # Scan log, rollups and sync queue are records, not notifications: never dropped.
+        bus.subscribe('storage', self._store_event, scans, blocking=True, lossless=True)
+        bus.subscribe('api', lambda event: self.api.publish('scan', action=event['type'], id=event['id'], name=event['name'],
+                                                           date=event['date'], time=event['time']), scans)
+        if self.WEBHOOK_URL:
+            bus.subscribe('webhook', self._post_webhook, queue_size=200, blocking=True)
+        bus.start()
+        return bus
+
+    def _count_event(self, event):
+        self.event_counts[event['type']] = self.event_counts.get(event['type'], 0) + 1
+
+    def _show_event(self, event):
+        """UI sink (runs on the Tk thread): toast and live log refresh."""
+        name, time_str = event['name'], event['time']
+        if event['type'] == 'late':
+            self.show_toast("Late", f"{name} clocked in LATE at {time_str}.", "warning")
+        elif event['type'] == 'time_in':
+            self.show_toast("Time In", f"{name} clocked in at {time_str}.", "success")
+        else:
+            self.show_toast("Scan Recorded", f"{name}'s new scan time is {time_str}.", "info")
+        self.load_attendance()
+
+    def _play_event_sound(self, event):
+        self.play_sound({'time_in': 'in', 'late': 'late', 'time_out': 'out'}[event['type']])
+
+    def _store_event(self, event):
+        """Storage sink: detailed scan log, analytics rollups and the fleet sync queue."""
+        self.scan_log_store.append_row({'ID': event['id'], 'Name': event['name'], 'Date': event['date'], 'Time': event['time']})
+        self.analytics.record(event['date'], event['id'], event['name'], event['time_in'], event['time_out'], event['late'],
+                              event.get('partition_version'))
+        if self.sync:
+            self.sync.enqueue('scan', id=event['id'], name=event['name'], date=event['date'], time=event['time'])
+
+    def _post_webhook(self, event):
+        request = urllib.request.Request(self.WEBHOOK_URL, data=json.dumps(event, default=str).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        with urllib.request.urlopen(request, timeout=5) as response:
+            response.read()
+
+    def start_api(self):
+        """Starts the local JSON API on the configured port."""
+        try:
+            host, port = self.api.start(self.API_PORT)
+            print(f"Attendance API listening on http://{host}:{port}")
+        except OSError as e:
+            logging.error(f"Could not start the attendance API on port {self.API_PORT}: {e}")
+            self.root.after(0, self.show_toast, "API Error", f"Port {self.API_PORT} is not available.", "warning")
+
+    def _startup_phase_done(self, name):
+        """Auto-starts the scanner once the phases it depends on have finished."""
+        self.startup_pending.discard(name)
+        if not self.startup_pending:
+            self.auto_start_scanning()
+
+    def _preload_models(self):
+        """
+        Imports OpenCV and face_recognition (which loads the dlib models) ahead of the
+        first frame. In remote mode the worker encodes faces, so dlib is not loaded.
+        """
+        cv2.load()
+        if self.RECOGNITION_MODE != 'remote':
+            face_recognition.load()
+
+    def rollover_archives(self):
+        """Moves closed date partitions into the columnar archive, if enabled."""
+        if not self.COLUMNAR_ARCHIVE:
+            return
+        if ColumnarArchive.is_available():
+            rolled = self.attendance_store.rollover() + self.scan_log_store.rollover()
+            if rolled:
+                print(f"Archived {rolled} closed partitions to Parquet.")
+        else:
+            print("Warning: pyarrow is not installed. Closed periods stay in CSV.")
+
     def load_initial_data(self):
-        """Loads all necessary data at startup and then auto-starts the scanner."""
+        """Fills the attendance log and user list once pandas is available."""
         try:
-            self.load_known_faces()
+            self.reload_roster()
             self.load_attendance()
             self.load_users()
-            self.root.after(500, self.auto_start_scanning)
         except Exception as e:
             logging.error(f"Error during initial data load: {e}")
             messagebox.showerror("Startup Error", "Failed to load initial data. Check error_log.txt for details.")
         finally:
             self.hide_loading_screen()
             self.notebook.pack(fill=tk.BOTH, expand=True, pady=10)
+            self.startup.mark('data_loaded')
 
     def auto_start_scanning(self):
         """Automatically starts the scanning process if a camera is available."""
@@ -261,47 +4243,109 @@ class FacialRecognitionAttendanceSystem:
             print("No camera found. Scanner will not auto-start.")
 
     def backup_data_files(self):
-        """Creates a timestamped backup of critical data files."""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_dir = os.path.join('data_backups', timestamp)
-        try:
-            os.makedirs(backup_dir, exist_ok=True)
-            for file in [self.students_file, self.attendance_file, self.encodings_file, self.scan_log_file]:
-                if os.path.exists(file):
-                    shutil.copy(file, backup_dir)
-        except OSError as e:
-            logging.error(f"Error creating backup directory: {e}")
+        """Takes an incremental backup snapshot of critical data files on a background thread."""
+        files = [self.students_file, self.attendance_file, self.encodings_file, self.scan_log_file]
+        # Partition files are read under their store's lock; rollover may delete them concurrently.
+        file_locks = {}
+        for store in (self.attendance_store, self.scan_log_store):
+            store_files = store.files()
+            files += store_files
+            file_locks.update({os.path.normpath(path): store.lock for path in store_files})
+
+        def run_backup():
+            try:
+                with self.startup.phase('backup'):
+                    self.backups.create_snapshot(files, file_locks)
+                    removed = self.backups.prune(self.BACKUP_KEEP_LAST, self.BACKUP_KEEP_DAYS)
+                if removed:
+                    print(f"Pruned {removed} old backup snapshots.")
+            except (OSError, ValueError) as e:
+                logging.error(f"Error creating backup snapshot: {e}")
+
+        threading.Thread(target=run_backup, daemon=True).start()
 
     def initialize_files(self):
         """Ensures that necessary CSV and pickle files exist."""
         if not os.path.exists(self.students_file):
             with open(self.students_file, 'w', newline='') as f:
                 csv.writer(f).writerow(['ID', 'Name', 'ScheduleDays', 'ScheduleTimeIn', 'ScheduleTimeOut'])
-        if not os.path.exists(self.attendance_file):
-            with open(self.attendance_file, 'w', newline='') as f:
-                csv.writer(f).writerow(['ID', 'Name', 'Date', 'TimeIn', 'TimeOut'])
-        if not os.path.exists(self.scan_log_file):
-            with open(self.scan_log_file, 'w', newline='') as f:
-                csv.writer(f).writerow(['ID', 'Name', 'Date', 'Time'])
+        # Legacy single-file logs are split into date partitions on first launch.
+        self.attendance_store.migrate_from(self.attendance_file)
+        self.scan_log_store.migrate_from(self.scan_log_file)
         if not os.path.exists(self.encodings_file):
             with open(self.encodings_file, 'wb') as f:
                 pickle.dump(([], []), f)
 
     def load_known_faces(self):
-        """Loads face encodings and corresponding IDs from a pickle file."""
+        """
+        Loads face templates and corresponding IDs from a pickle file. If the file
+        cannot be read, the gallery in memory is kept (and not overwritten on disk).
+        """
         if os.path.exists(self.encodings_file):
+            self.gallery_watcher.mark_seen()
             try:
                 with open(self.encodings_file, 'rb') as f:
-                    self.known_face_encodings, self.known_face_ids = pickle.load(f)
+                    data = f.read()
+                if not verify_checksum(self.encodings_file, data):
+                    logging.error(f"Checksum mismatch in {self.encodings_file}. Attempting to restore from backup.")
+                    if not self.restore_from_backup(self.encodings_file):
+                        raise ValueError("corrupted and no valid backup found")
+                    with open(self.encodings_file, 'rb') as f:
+                        data = f.read()
+                # (encodings, ids) from older versions, (encodings, ids, sources) since templates.
+                loaded = FaceGallery(*pickle.loads(data))
             except Exception as e:
-                logging.error(f"Failed to load encodings file: {e}")
-                self.known_face_encodings, self.known_face_ids = [], []
+                logging.error(f"Failed to load encodings file, keeping the {len(self.gallery.person_ids)} users in memory: {e}")
+                self.root.after(0, self.show_toast, "Face Data Error", "Could not reload the face encodings; the current ones are kept.", "danger")
+                return
+            self.update_gallery(lambda _: loaded)
+
+    def reload_roster(self):
+        """Re-reads students.csv and applies the differences to the running roster. Returns True if anything changed."""
+        self.roster_watcher.mark_seen()
+        df = self.read_students()
+        names = {}
+        if df is not None:
+            names = {str(i): str(name) for i, name in zip(df['ID'], df['Name'])}
+        upserts = {user_id: name for user_id, name in names.items() if self.student_names.get(user_id) != name}
+        deletes = [user_id for user_id in self.student_names if user_id not in names]
+        if upserts or deletes:
+            self.apply_roster_delta(upserts, deletes)
+        return bool(upserts or deletes)
+
+    def apply_roster_delta(self, upserts=None, deletes=()):
+        """
+        Applies roster changes made by this process to the running pipeline in place,
+        without restarting the scan. Call after students.csv has been written.
+        """
+        for user_id, name in (upserts or {}).items():
+            self.student_names[str(user_id)] = name
+            self.identity_cache.forget(user_id)
+        for user_id in deletes:
+            self.student_names.pop(str(user_id), None)
+            self.identity_cache.forget(user_id)
+        self.roster_version += 1
+        self.roster_watcher.mark_seen()
+
+    def update_gallery(self, change):
+        """
+        Replaces the gallery with change(current gallery). Galleries are immutable, so
+        readers keep using the snapshot they took; writers are serialized so that
+        concurrent changes are never lost. Returns the new gallery.
+        """
+        with self.gallery_lock:
+            updated = change(self.gallery)
+            if updated is not self.gallery:
+                self.gallery = updated
+                self.gallery_version += 1
+            return updated
 
     def save_known_faces(self):
-        """Saves the current face encodings and IDs to a pickle file."""
+        """Saves the current face templates and IDs to a pickle file."""
         try:
-            with open(self.encodings_file, 'wb') as f:
-                pickle.dump((self.known_face_encodings, self.known_face_ids), f)
+            gallery = self.gallery
+            atomic_write(self.encodings_file, pickle.dumps((list(gallery.encodings), gallery.ids, gallery.sources)))
+            self.gallery_watcher.mark_seen()
         except Exception as e:
             logging.error(f"Failed to save encodings file: {e}")
             self.show_toast("Error", "Could not save face data.", "danger")
@@ -318,16 +4362,48 @@ class FacialRecognitionAttendanceSystem:
 
     def get_available_cameras(self):
         """Detects and returns a list of available camera indices using a more stable backend."""
-        index, arr = 0, []
-        while index < 10: # Check first 10 indices
-            cap = cv2.VideoCapture(index + cv2.CAP_DSHOW)
-            if cap.isOpened():
-                arr.append(index)
-                cap.release()
-            index += 1
+        arr = [device['index'] for device in self.camera_discovery.scan()]
         print(f"Available cameras found at indices: {arr}" if arr else "No valid cameras found.")
         return arr
-            
+
+    def _busy_camera_indices(self):
+        """
+        Returns the camera indices held by the scanner or the registration window,
+        which must not be re-probed. Called from the discovery thread, so it only
+        reads plain attributes set on the Tk thread.
+        """
+        return {index for index in (self.active_camera_index, self.registration_camera_index) if index is not None}
+
+    def _on_cameras_found(self, camera_indices):
+        """Populates the camera selector with the result of the background probe and starts hot-plug rescans."""
+        self.update_camera_selector(camera_indices)
+        self.camera_discovery.start(lambda devices: self.root.after(0, self.update_camera_selector, [d['index'] for d in devices]))
+        self._startup_phase_done('probe_cameras')
+
+    def update_camera_selector(self, camera_indices):
+        """Refreshes the camera selector after cameras were plugged in or removed."""
+        previous = list(self.camera_options)
+        self.camera_options = camera_indices or []
+        self.camera_selector.config(values=self.camera_options)
+        if previous and previous != self.camera_options:
+            print(f"Camera list changed: {previous} -> {self.camera_options}")
+        if self.camera_options:
+            current = self.camera_selection_var.get()
+            if not current or int(current) not in self.camera_options:
+                if not self.scanning:
+                    self.camera_selection_var.set(self.camera_options[0])
+            if not self.scanning:
+                self.camera_selector.config(state="readonly")
+                self.start_scan_button.config(state=tk.NORMAL)
+                if not previous:
+                    self.camera_label.config(text="")
+        else:
+            self.camera_selection_var.set("")
+            self.camera_selector.config(state=tk.DISABLED)
+            self.start_scan_button.config(state=tk.DISABLED)
+            if not self.scanning:
+                self.camera_label.config(text="\n\nNo Camera Found", font=('Inter', 12))
+
     def create_widgets(self):
         """Creates and arranges all the GUI widgets."""
         self.camera_icon = self.load_icon('camera.png')
@@ -356,6 +4432,7 @@ class FacialRecognitionAttendanceSystem:
         self.create_user_management_tab(self.notebook)
         self.create_history_tab(self.notebook)
         self.create_export_tab(self.notebook)
+        self.create_analytics_tab(self.notebook)
         self.create_settings_tab(self.notebook)
 
     def create_attendance_tab(self, notebook):
@@ -367,13 +4444,15 @@ class FacialRecognitionAttendanceSystem:
         controls_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 20))
 
         bstrap.Label(controls_frame, text="Select Camera:").pack(pady=5, anchor='w')
-        self.camera_options = self.get_available_cameras()
-        self.camera_selection_var = tk.StringVar(value=self.camera_options[0] if self.camera_options else "")
+        # Cameras are probed in the background; see _on_cameras_found.
+        self.camera_options = []
+        self.camera_selection_var = tk.StringVar(value="")
         self.camera_selector = bstrap.Combobox(controls_frame, textvariable=self.camera_selection_var, values=self.camera_options, state="readonly")
         self.camera_selector.pack(pady=(0,15), fill=tk.X)
         
         self.camera_label = bstrap.Label(controls_frame, relief=tk.SOLID, borderwidth=1, background="#E5E7EB")
         self.camera_label.pack(pady=10, fill=tk.BOTH, expand=True)
+        self.preview_renderer = PreviewRenderer(self.camera_label, max_fps=self.PREVIEW_FPS)
 
         self.start_scan_button = bstrap.Button(controls_frame, text=" Start Scanning", image=self.camera_icon, compound=tk.LEFT, command=self.start_scanning)
         self.start_scan_button.pack(pady=(15, 5), fill=tk.X)
@@ -381,10 +4460,9 @@ class FacialRecognitionAttendanceSystem:
         self.stop_scan_button = bstrap.Button(controls_frame, text=" Stop Scanning", image=self.stop_icon, compound=tk.LEFT, command=self.stop_scanning, bootstyle="danger", state=tk.DISABLED)
         self.stop_scan_button.pack(pady=5, fill=tk.X)
         
-        if not self.camera_options:
-            self.camera_selector.config(state=tk.DISABLED)
-            self.start_scan_button.config(state=tk.DISABLED)
-            self.camera_label.config(text="\n\nNo Camera Found", font=('Inter', 12))
+        self.camera_selector.config(state=tk.DISABLED)
+        self.start_scan_button.config(state=tk.DISABLED)
+        self.camera_label.config(text="\n\nSearching for Cameras...", font=('Inter', 12))
 
         self.scan_status_label = bstrap.Label(controls_frame, text="Status: Not Scanning")
         self.scan_status_label.pack(pady=10, side=tk.BOTTOM)
@@ -475,6 +4553,8 @@ class FacialRecognitionAttendanceSystem:
         bstrap.Button(details_frame, text=" Edit User", image=self.edit_user_icon, compound=tk.LEFT, command=self.edit_user).pack(pady=5, fill=tk.X)
         bstrap.Button(details_frame, text=" Delete User", image=self.delete_user_icon, compound=tk.LEFT, command=self.delete_user, bootstyle="danger").pack(pady=5, fill=tk.X)
         bstrap.Button(details_frame, text=" Refresh List", image=self.refresh_icon, compound=tk.LEFT, command=self.load_users, bootstyle="info-outline").pack(pady=(15, 5), fill=tk.X)
+        bstrap.Button(details_frame, text=" Bulk Import...", image=self.add_user_icon, compound=tk.LEFT, command=self.bulk_import_users, bootstyle="info-outline").pack(pady=5, fill=tk.X)
+        bstrap.Button(details_frame, text=" Review Unknown Faces...", image=self.add_user_icon, compound=tk.LEFT, command=self.review_unknown_faces, bootstyle="info-outline").pack(pady=5, fill=tk.X)
 
     def create_history_tab(self, notebook):
         """Creates the 'Attendance History' tab for viewing and filtering past records."""
@@ -546,6 +4626,98 @@ class FacialRecognitionAttendanceSystem:
         bstrap.Button(range_export_frame, text="Export Range Summary (CSV)", image=self.export_icon, compound=tk.LEFT, command=self.export_attendance_range).pack(pady=5, anchor='w')
         bstrap.Button(range_export_frame, text="Export Range Detailed Log (CSV)", image=self.export_icon, compound=tk.LEFT, command=self.export_scan_log_range, bootstyle="info").pack(pady=10, anchor='w')
 
+        # --- NEW: Absentee report from the compiled schedules ---
+        absentee_frame = bstrap.LabelFrame(export_frame, text="Absentee Report", padding=15)
+        absentee_frame.pack(fill=tk.X, pady=10)
+
+        bstrap.Label(absentee_frame, text="Scheduled users with no scan. Today covers schedules whose time in has already passed.").pack(pady=(0, 10), anchor='w')
+        bstrap.Button(absentee_frame, text="Export Today's Absentees (CSV)", image=self.export_icon, compound=tk.LEFT, command=lambda: self.export_absentee_report(today_only=True), bootstyle="warning").pack(pady=5, anchor='w')
+        bstrap.Button(absentee_frame, text="Export Range Absentees (CSV)", image=self.export_icon, compound=tk.LEFT, command=self.export_absentee_report, bootstyle="warning-outline").pack(pady=10, anchor='w')
+
+
+    def create_analytics_tab(self, notebook):
+        """Creates the 'Analytics' tab with per-student and per-day attendance reports."""
+        analytics_frame = bstrap.Frame(notebook, padding=15)
+        notebook.add(analytics_frame, text='   Analytics   ')
+
+        filter_frame = bstrap.LabelFrame(analytics_frame, text="Report Period", padding=15)
+        filter_frame.pack(fill=tk.X, pady=(0, 10))
+
+        bstrap.Label(filter_frame, text="Start Date:").pack(side=tk.LEFT, padx=(0, 5))
+        self.analytics_start_date_entry = bstrap.DateEntry(filter_frame, bootstyle="primary", dateformat="%Y-%m-%d")
+        self.analytics_start_date_entry.entry.config(font=('Inter', 10))
+        self.analytics_start_date_entry.set_date(datetime.now() - timedelta(days=120)) # Roughly one semester
+        self.analytics_start_date_entry.pack(side=tk.LEFT, padx=5)
+
+        bstrap.Label(filter_frame, text="End Date:").pack(side=tk.LEFT, padx=(15, 5))
+        self.analytics_end_date_entry = bstrap.DateEntry(filter_frame, bootstyle="primary", dateformat="%Y-%m-%d")
+        self.analytics_end_date_entry.entry.config(font=('Inter', 10))
+        self.analytics_end_date_entry.pack(side=tk.LEFT, padx=5)
+
+        self.analytics_view_var = tk.StringVar(value="Per Student")
+        bstrap.Combobox(filter_frame, textvariable=self.analytics_view_var, values=["Per Student", "Per Day"],
+                        state="readonly", width=12).pack(side=tk.LEFT, padx=(15, 5))
+
+        bstrap.Button(filter_frame, text="Generate", command=self.load_analytics_report).pack(side=tk.LEFT, padx=15)
+        bstrap.Button(filter_frame, text="Export Report", image=self.export_icon, compound=tk.LEFT, command=self.export_analytics_report, bootstyle="info-outline").pack(side=tk.RIGHT, padx=5)
+
+        report_frame = bstrap.Frame(analytics_frame)
+        report_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        self.analytics_tree = bstrap.Treeview(report_frame, show='headings')
+        self.analytics_tree.pack(fill=tk.BOTH, expand=True)
+        self.analytics_report = None
+
+    def build_analytics_report(self):
+        """Returns the report selected on the Analytics tab, or None if the dates are invalid."""
+        start_date, end_date = self._get_and_validate_dates(self.analytics_start_date_entry, self.analytics_end_date_entry)
+        if not start_date:
+            return None
+        schedules = self.get_schedule_engine()
+        # Partitions changed outside log_attendance (edits, restores, replays) are recomputed first.
+        self.analytics.sync(schedules)
+        if self.analytics_view_var.get() == "Per Day":
+            return self.analytics.daily_report(start_date, end_date, schedules)
+        return self.analytics.student_report(start_date, end_date, schedules)
+
+    def load_analytics_report(self):
+        """Computes the selected report from the daily rollups and shows it."""
+        for i in self.analytics_tree.get_children(): self.analytics_tree.delete(i)
+        try:
+            report = self.build_analytics_report()
+        except Exception as e:
+            self.show_toast("Error", f"Could not build the report: {e}", "danger")
+            logging.error(f"Error building analytics report: {e}")
+            return
+        if report is None:
+            return
+        self.analytics_report = report
+
+        columns = list(report.columns)
+        self.analytics_tree.config(columns=columns)
+        for col in columns:
+            self.analytics_tree.heading(col, text=re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', col))
+            self.analytics_tree.column(col, anchor='center', width=100)
+        if 'Name' in columns:
+            self.analytics_tree.column('Name', anchor='w', width=150)
+
+        for row in report.fillna('---').itertuples(index=False):
+            self.analytics_tree.insert("", tk.END, values=list(row))
+        if report.empty:
+            self.show_toast("No Data", "No attendance or schedules found for the selected period.", "info")
+
+    def export_analytics_report(self):
+        """Exports the report currently shown on the Analytics tab to CSV."""
+        if self.analytics_report is None or self.analytics_report.empty:
+            self.show_toast("Export Error", "Generate a report first.", "warning")
+            return
+        view = "per_day" if 'Expected' in self.analytics_report.columns else "per_student"
+        save_path = filedialog.asksaveasfilename(
+            defaultextension=".csv", filetypes=[("CSV files", "*.csv")],
+            title="Save Analytics Report As", initialfile=f"attendance_analytics_{view}_{datetime.now().strftime('%Y-%m-%d')}.csv"
+        )
+        if save_path:
+            self.safe_save_csv(self.analytics_report, save_path, checksum=False)
+            self.show_toast("Export Successful", f"Report saved to {os.path.basename(save_path)}", "success")
 
     def create_settings_tab(self, notebook):
         """Creates the 'Settings' tab for application configuration."""
@@ -563,6 +4735,134 @@ class FacialRecognitionAttendanceSystem:
         
         bstrap.Label(settings_panel, text="Note: Changes will be applied after restarting the application.", font=('Inter', 9, 'italic')).grid(row=3, column=0, columnspan=2)
 
+        maintenance_panel = bstrap.LabelFrame(settings_frame, text="Face Data Maintenance", padding=15)
+        maintenance_panel.pack(fill=tk.X, pady=10)
+        bstrap.Label(maintenance_panel, text="Regenerate all face encodings from the photos in 'registered_faces'. Unchanged photos are taken from the cache.").pack(anchor='w')
+        self.rebuild_progress = bstrap.Progressbar(maintenance_panel, mode='determinate')
+        self.rebuild_progress.pack(fill=tk.X, pady=10)
+        self.rebuild_button = bstrap.Button(maintenance_panel, text=" Rebuild Face Data", image=self.refresh_icon, compound=tk.LEFT, command=self.rebuild_gallery)
+        self.rebuild_button.pack(anchor='w')
+
+        # --- NEW: Match quality report and tolerance calibration ---
+        match_panel = bstrap.LabelFrame(settings_frame, text="Match Quality", padding=15)
+        match_panel.pack(fill=tk.X, pady=10)
+        bstrap.Label(match_panel, text="Export per-user match distances, or calibrate tolerances from them (used when ToleranceMode is 'global' or 'per_user').").pack(anchor='w')
+        match_buttons = bstrap.Frame(match_panel)
+        match_buttons.pack(anchor='w', pady=(10, 0))
+        bstrap.Button(match_buttons, text=" Export Match Report", image=self.export_icon, compound=tk.LEFT, command=self.export_match_report, bootstyle="info-outline").pack(side=tk.LEFT, padx=(0, 10))
+        bstrap.Button(match_buttons, text=" Calibrate Tolerances", image=self.refresh_icon, compound=tk.LEFT, command=self.calibrate_tolerances).pack(side=tk.LEFT)
+
+        # --- NEW: Diagnostics panel (startup timings and runtime counters) ---
+        diagnostics_panel = bstrap.LabelFrame(settings_frame, text="Diagnostics", padding=15)
+        diagnostics_panel.pack(fill=tk.BOTH, expand=True, pady=10)
+        self.diagnostics_label = bstrap.Label(diagnostics_panel, text="", font=('Consolas', 9), justify=tk.LEFT, anchor='nw')
+        self.diagnostics_label.pack(fill=tk.BOTH, expand=True)
+        bstrap.Button(diagnostics_panel, text=" Refresh", image=self.refresh_icon, compound=tk.LEFT, command=self.refresh_diagnostics, bootstyle="info-outline").pack(pady=(10, 0), anchor='e')
+
+    def rebuild_gallery(self):
+        """Rebuilds encodings.pkl from the registered photos on a background thread."""
+        if not messagebox.askyesno("Rebuild Face Data", "Regenerate the photo-based face encodings from the registered photos? Live and multi-sample templates are kept."):
+            return
+        self.rebuild_button.config(state=tk.DISABLED)
+        self.rebuild_progress.config(value=0)
+
+        def progress(done, total):
+            self.root.after(0, self.rebuild_progress.config, {'maximum': max(total, 1), 'value': done})
+
+        def worker():
+            try:
+                cache = EncodingCache(os.path.join('data', 'encoding_cache.pkl'))
+                result = rebuild_gallery_from_photos('registered_faces', self.encodings_file, cache, progress=progress)
+                self.root.after(0, self._on_gallery_rebuilt, result)
+            except Exception as e:
+                logging.error(f"Gallery rebuild failed: {e}")
+                self.root.after(0, self.show_toast, "Rebuild Error", f"Could not rebuild face data: {e}", "danger")
+                self.root.after(0, self.rebuild_button.config, {'state': tk.NORMAL})
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _on_gallery_rebuilt(self, result):
+        """Loads the rebuilt gallery and reports the outcome."""
+        self.load_known_faces()
+        self.queue_gallery_change(*result['rebuilt'])
+        self.rebuild_button.config(state=tk.NORMAL)
+        message = (f"{len(result['rebuilt'])} of {result['persons']} users re-encoded in {result['seconds']:.1f}s "
+                   f"({result['hits']} cached, {result['misses']} encoded).")
+        if result['failures']:
+            message += (f" {len(result['failures'])} photos had no usable face; their current templates were kept: "
+                        + ", ".join(uid for uid, _ in result['failures'][:10]))
+        self.show_toast("Face Data Rebuilt", message, "warning" if result['failures'] else "success", duration=8000)
+
+    def export_match_report(self):
+        """Exports the per-user match distance report to CSV."""
+        report = self.match_telemetry.report(self.student_names)
+        if report.empty:
+            self.show_toast("Match Report", "No matches have been recorded yet.", "info")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")],
+                                                 title="Save Match Report", initialfile="match_report.csv")
+        if not file_path:
+            return
+        try:
+            report.to_csv(file_path, index=False)
+            self.show_toast("Export Successful", f"Match report saved to {os.path.basename(file_path)}", "success")
+        except Exception as e:
+            logging.error(f"Failed to export match report: {e}")
+            self.show_toast("Export Error", f"Could not save the report: {e}", "danger")
+
+    def calibrate_tolerances(self):
+        """Calibrates tolerances from the recorded matches and stores them next to the gallery."""
+        calibration = self.match_telemetry.calibrate(self.MATCH_TOLERANCE)
+        if not calibration['samples']:
+            self.show_toast("Calibration", "No confirmed scans have been recorded yet.", "info")
+            return
+        try:
+            atomic_write(self.tolerances_file, json.dumps(calibration, indent=2).encode('utf-8'), checksum=False)
+        except Exception as e:
+            logging.error(f"Failed to save tolerances: {e}")
+            self.show_toast("Calibration Error", f"Could not save tolerances: {e}", "danger")
+            return
+        self.match_tolerance, self.user_tolerances = load_match_tolerances(self.tolerances_file, self.TOLERANCE_MODE, self.MATCH_TOLERANCE)
+        message = (f"Global tolerance {calibration['global']:.3f}, {len(calibration['users'])} per-user tolerances "
+                   f"from {calibration['samples']} confirmed visits.")
+        if self.TOLERANCE_MODE == 'fixed':
+            message += " Set ToleranceMode to 'global' or 'per_user' in config.ini to use them."
+        self.show_toast("Calibration", message, "success", duration=8000)
+
+    def get_diagnostics(self):
+        """Returns diagnostic information as {section title: [lines]}."""
+        cameras = [f"#{d['index']}: {d.get('width', '?')}x{d.get('height', '?')} @ {d.get('fps', '?')} fps"
+                   for d in self.camera_discovery.devices]
+        if self.camera_discovery.last_scan_seconds is not None:
+            cameras.append(f"last scan took {self.camera_discovery.last_scan_seconds:.2f}s")
+        preview = [f"frames drawn: {self.preview_renderer.frames_drawn}",
+                   f"redraws skipped: {self.preview_renderer.frames_skipped}",
+                   f"preview FPS cap: {self.PREVIEW_FPS}"]
+        return {'Startup': self.startup.summary(), 'Cameras': cameras, 'Preview': preview,
+                'Liveness': self.liveness_tracker.stats(),
+                'Recognition Cache': self.identity_cache.stats(),
+                'Unknown Faces': self.unknown_clusters.stats(),
+                'Match Quality': [f"tolerance: {self.match_tolerance:.3f} ({self.TOLERANCE_MODE}), per-user overrides: {len(self.user_tolerances)}"]
+                                 + self.match_telemetry.stats(),
+                'API': self.api.stats(),
+                'Storage': self.scan_wal.stats(),
+                'Events': self.events.stats() + [", ".join(f"{k}: {v}" for k, v in self.event_counts.items())],
+                'Recognition': ([f"mode: remote, motion gate passed {self.motion_gate.passed}, skipped {self.motion_gate.skipped}"]
+                                + self.remote_recognizer.stats()) if self.remote_recognizer else ["mode: local"],
+                'Sync': self.sync.stats() if self.sync else ["standalone (set SyncServerURL in config.ini)"],
+                'Gallery': [f"persons: {len(self.gallery.person_ids)}, templates: {len(self.gallery)}, version: {self.gallery_version}",
+                            f"roster: {len(self.student_names)} users, version: {self.roster_version}"]}
+
+    def refresh_diagnostics(self):
+        """Redraws the diagnostics panel."""
+        text = []
+        for section, lines in self.get_diagnostics().items():
+            text.append(f"[{section}]")
+            if lines:
+                text.extend(f"  {line}" for line in lines)
+            else:
+                text.append("  (no data yet)")
+        self.diagnostics_label.config(text="\n".join(text))
+
     def apply_settings(self):
         """Applies and saves the new settings."""
         try:
@@ -602,10 +4902,8 @@ class FacialRecognitionAttendanceSystem:
         
         schedule_text = "Schedule: Not Set"
         try:
-            students_df = self.safe_read_csv(self.students_file)
+            students_df = self.read_students()
             if students_df is not None:
-                # Ensure ID column is integer for correct comparison
-                students_df['ID'] = pd.to_numeric(students_df['ID'], errors='coerce').dropna().astype(int)
                 user_data_row = students_df[students_df['ID'] == int(user_id)]
                 if not user_data_row.empty:
                     user_data = user_data_row.iloc[0]
@@ -633,24 +4931,9 @@ class FacialRecognitionAttendanceSystem:
             self.user_photo_label.config(image='', text="\n\nNo Image\nAvailable", font=('Inter', 12))
             self.user_photo_label.image = None
 
-    def _calculate_head_tilt_angle(self, landmarks):
-        """Calculates the head tilt angle."""
-        nose_bridge = landmarks['nose_bridge'][0]
-        chin = landmarks['chin'][8]
-        dx = chin[0] - nose_bridge[0]
-        dy = chin[1] - nose_bridge[1]
-        return np.degrees(np.arctan2(dx, dy))
-
     def _validate_and_format_time(self, time_str):
         """Validates time is in HH:MM AM/PM format and standardizes it."""
-        if not time_str:
-            return "" 
-        
-        match = re.match(r'^(0?[1-9]|1[0-2]):([0-5]\d)\s*(AM|PM)$', time_str, re.IGNORECASE)
-        if match:
-            hour, minute, period = match.groups()
-            return f"{int(hour):02d}:{minute} {period.upper()}"
-        return None
+        return format_schedule_time(time_str)
 
     def register_user(self):
         """Handles the interactive user registration process with liveness checks."""
@@ -672,11 +4955,9 @@ class FacialRecognitionAttendanceSystem:
             return
             
         try:
-            students_df = self.safe_read_csv(self.students_file)
+            students_df = self.read_students()
             if students_df is not None:
-                 # Ensure ID column is treated correctly for comparison
-                students_df['ID'] = pd.to_numeric(students_df['ID'], errors='coerce')
-                if not students_df[students_df['ID'] == int(user_id)].empty:
+                if (students_df['ID'] == int(user_id)).any():
                     self.show_toast("Registration Error", "This User ID already exists.", "danger")
                     return
         except ValueError:
@@ -689,14 +4970,19 @@ class FacialRecognitionAttendanceSystem:
             self.show_toast("Camera Error", "No camera available for registration.", "danger")
             return
             
-        cap = cv2.VideoCapture(int(self.camera_selection_var.get()) + cv2.CAP_DSHOW)
+        self.registration_camera_index = int(self.camera_selection_var.get())
+        cap = cv2.VideoCapture(self.registration_camera_index + cv2.CAP_DSHOW)
         if not cap.isOpened():
+            self.registration_camera_index = None
             self.show_toast("Camera Error", "Could not open webcam.", "danger")
             return
+        self.apply_capture_settings(cap)
         
         step = "LOOK_STRAIGHT"
         blink_counter = 0
         forward_facing_frame = None
+        # Extra encodings captured during the blink/tilt steps, condensed into templates at the end.
+        samples, last_sample_time = [], 0.0
         instruction = "Position face in oval and Press Spacebar"
         accent_color_bgr = (0, 215, 255)
 
@@ -705,6 +4991,7 @@ class FacialRecognitionAttendanceSystem:
         while True:
             ret, frame = cap.read()
             if not ret: break
+            clean_frame = frame.copy()
             h, w, _ = frame.shape
             
             center_x, center_y = w // 2, h // 2
@@ -715,21 +5002,25 @@ class FacialRecognitionAttendanceSystem:
             (text_w, text_h), _ = cv2.getTextSize(instruction, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)
             cv2.putText(frame, instruction, (center_x - text_w // 2, h - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.8, accent_color_bgr, 2)
 
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            rgb_frame = cv2.cvtColor(clean_frame, cv2.COLOR_BGR2RGB)
             face_locations = face_recognition.face_locations(rgb_frame)
             
             if len(face_locations) == 1:
-                landmarks = face_recognition.face_landmarks(rgb_frame, face_locations)[0]
+                liveness = Liveness.analyze(face_recognition.face_landmarks(rgb_frame, face_locations), self.EYE_AR_THRESH)
+
+                if step in ("BLINK", "TILT_LEFT", "TILT_RIGHT") and not liveness['eyes_closed'][0] \
+                        and len(samples) < self.ENROLMENT_SAMPLES and time.monotonic() - last_sample_time >= 0.3:
+                    samples.append(face_recognition.face_encodings(rgb_frame, face_locations)[0])
+                    last_sample_time = time.monotonic()
                 
                 if step == "LOOK_STRAIGHT":
                     if cv2.waitKey(1) & 0xFF == 32:
-                        forward_facing_frame = frame.copy()
+                        forward_facing_frame = clean_frame
                         step = "BLINK"
                         instruction = "Great! Now blink three times."
                 
                 elif step == "BLINK":
-                    ear = (self.eye_aspect_ratio(landmarks['left_eye']) + self.eye_aspect_ratio(landmarks['right_eye'])) / 2.0
-                    if ear < self.EYE_AR_THRESH: blink_counter += 1
+                    if liveness['eyes_closed'][0]: blink_counter += 1
                     else:
                         if blink_counter >= self.EYE_AR_CONSEC_FRAMES_REGISTER:
                             step = "TILT_LEFT"
@@ -737,7 +5028,7 @@ class FacialRecognitionAttendanceSystem:
                         blink_counter = 0
                 
                 elif "TILT" in step:
-                    angle = self._calculate_head_tilt_angle(landmarks)
+                    angle = liveness['tilt'][0]
                     if step == "TILT_LEFT" and angle > self.HEAD_TILT_THRESH:
                         step = "TILT_RIGHT"
                         instruction = f"Perfect! Now tilt head right > {self.HEAD_TILT_THRESH} degrees"
@@ -750,14 +5041,16 @@ class FacialRecognitionAttendanceSystem:
             if step == "DONE":
                 encodings = face_recognition.face_encodings(cv2.cvtColor(forward_facing_frame, cv2.COLOR_BGR2RGB))
                 if encodings:
-                    self.known_face_encodings.append(encodings[0])
-                    self.known_face_ids.append(user_id)
+                    templates = FaceGallery.build_templates([encodings[0]] + samples, self.ENROLMENT_MEDOIDS)
+                    self.update_gallery(lambda gallery: gallery.with_person(user_id, templates))
                     self.save_known_faces()
                     
                     selected_days = ",".join([day for day, var in self.schedule_day_vars.items() if var.get()])
                     
                     with open(self.students_file, 'a', newline='') as f:
                         csv.writer(f).writerow([user_id, user_name, selected_days, schedule_time_in, schedule_time_out])
+                    self.apply_roster_delta({user_id: user_name})
+                    self.queue_gallery_change(user_id)
                     
                     cv2.imwrite(os.path.join('registered_faces', f"{user_id}.jpg"), forward_facing_frame)
                     
@@ -773,6 +5066,7 @@ class FacialRecognitionAttendanceSystem:
             if cv2.waitKey(1) & 0xFF == 27: break
         
         cap.release()
+        self.registration_camera_index = None
         cv2.destroyAllWindows()
 
     def start_scanning(self):
@@ -782,6 +5076,7 @@ class FacialRecognitionAttendanceSystem:
         
         try:
             camera_index = int(self.camera_selection_var.get())
+            self.active_camera_index = camera_index
             self.scanning = True
             
             self.start_scan_button.config(state=tk.DISABLED)
@@ -805,17 +5100,36 @@ class FacialRecognitionAttendanceSystem:
             self.camera_thread.join(timeout=1.0)
         if self.processing_thread and self.processing_thread.is_alive():
             self.processing_thread.join(timeout=1.0)
+        # A camera thread that has not exited yet may still hold the device.
+        if not (self.camera_thread and self.camera_thread.is_alive()):
+            self.active_camera_index = None
 
         self.start_scan_button.config(state=tk.NORMAL)
         self.stop_scan_button.config(state=tk.DISABLED)
         self.camera_label.config(image='')
+        self.preview_renderer.reset()
         if not self.camera_options:
              self.camera_label.config(text="\n\nNo Camera Found")
         self.update_scan_status(False)
 
+    def apply_capture_settings(self, cap):
+        """Applies the configured pixel format, resolution, FPS and buffer size to an opened camera."""
+        # The pixel format has to be set before the resolution for DirectShow to honour MJPG.
+        if len(self.CAPTURE_FORMAT) == 4:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.CAPTURE_FORMAT))
+        if self.CAPTURE_WIDTH > 0 and self.CAPTURE_HEIGHT > 0:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.CAPTURE_WIDTH)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.CAPTURE_HEIGHT)
+        if self.CAPTURE_FPS > 0:
+            cap.set(cv2.CAP_PROP_FPS, self.CAPTURE_FPS)
+        if self.CAPTURE_BUFFER_SIZE > 0:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, self.CAPTURE_BUFFER_SIZE)
+
     def _camera_thread_loop(self, camera_index):
         """Handles camera initialization and frame grabbing in a separate thread."""
         self.cap = cv2.VideoCapture(camera_index + cv2.CAP_DSHOW)
+        if self.cap.isOpened():
+            self.apply_capture_settings(self.cap)
         if not self.cap.isOpened():
             self.root.after(0, self.show_toast, "Camera Error", f"Could not open camera {camera_index}.", "danger")
             self.root.after(0, self.stop_scanning)
@@ -831,14 +5145,19 @@ class FacialRecognitionAttendanceSystem:
                 self.scanning = False
                 break
             
+            # cap.read() returns a fresh array per frame, so it can be shared without copying.
             with self.frame_lock:
-                self.current_frame = frame.copy()
+                self.current_frame = frame
+                self.frame_seq += 1
+            self.startup.mark('first_frame')
             
             time.sleep(1/60)
 
         if self.cap:
             self.cap.release()
         self.cap = None
+        if not self.scanning:
+            self.active_camera_index = None
 
     def scan_loop(self):
         """The main GUI thread loop for displaying the camera feed."""
@@ -846,87 +5165,174 @@ class FacialRecognitionAttendanceSystem:
             return
 
         with self.frame_lock:
-            frame_to_display = self.current_frame.copy() if self.current_frame is not None else None
+            frame_to_display = self.current_frame
+            frame_seq = self.frame_seq
+        result = self.recognition_result
         
-        if frame_to_display is not None:
-            for i, (top, right, bottom, left) in enumerate(self.last_known_locations):
-                top, right, bottom, left = top * 4, right * 4, bottom * 4, left * 4
-                if i < len(self.last_known_names):
-                    name_info = self.last_known_names[i]
-                    name, face_id = name_info["name"], name_info["id"]
-                    
-                    color = (0, 0, 255) # Red for unknown
-                    if name != "Unknown":
-                        color = (0, 255, 0) if self.live_blink_counters.get(face_id, 0) > 0 else (0, 215, 255)
-
-                    cv2.rectangle(frame_to_display, (left, top), (right, bottom), color, 2)
-                    cv2.rectangle(frame_to_display, (left, bottom - 35), (right, bottom), color, cv2.FILLED)
-                    cv2.putText(frame_to_display, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, 1.0, (27, 27, 27), 1)
+        self.preview_renderer.render(frame_to_display, (frame_seq, result.seq),
+                                     lambda frame, scale: self._draw_face_overlays(frame, scale, result))
+        self.root.after(self.preview_renderer.interval_ms, self.scan_loop)
+
+    def _draw_face_overlays(self, frame, display_scale, result):
+        """Draws the boxes and names of a RecognitionResult onto a preview frame scaled by display_scale."""
+        box_scale = display_scale / self.PROCESSING_SCALE
+        font_scale = max(0.4, display_scale)
+        label_height = max(15, int(35 * display_scale))
+        for (top, right, bottom, left), name, face_id in result.faces:
+            top, right, bottom, left = int(top * box_scale), int(right * box_scale), int(bottom * box_scale), int(left * box_scale)
             
-            img = Image.fromarray(cv2.cvtColor(frame_to_display, cv2.COLOR_BGR2RGB))
-            imgtk = ImageTk.PhotoImage(image=img)
-            self.camera_label.imgtk = imgtk
-            self.camera_label.config(image=imgtk)
-        
-        self.root.after(30, self.scan_loop)
+            color = (0, 0, 255) # Red for unknown
+            if face_id is not None:
+                color = (0, 255, 0) if self.liveness_tracker.is_highlighted(face_id) else (0, 215, 255)
+
+            cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+            cv2.rectangle(frame, (left, bottom - label_height), (right, bottom), color, cv2.FILLED)
+            cv2.putText(frame, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, font_scale, (27, 27, 27), 1)
 
     def _processing_thread_loop(self):
         """The background thread for heavy face recognition processing with frame skipping."""
-        students_df = self.safe_read_csv(self.students_file)
-        if students_df is None:
-            students_df = pd.DataFrame(columns=['ID', 'Name'])
-        else:
-            # Ensure ID column is numeric for later comparisons
-            students_df['ID'] = pd.to_numeric(students_df['ID'], errors='coerce')
+        student_names = self.student_names
+        cache_gallery = self.gallery
+        self.identity_cache.clear()
+        last_cluster_save = time.monotonic()
 
         while self.scanning:
+            # Frames are replaced, never modified in place, so holding a reference is enough.
             with self.frame_lock:
-                frame_to_process = self.current_frame.copy() if self.current_frame is not None else None
+                frame_to_process = self.current_frame
 
             if frame_to_process is None:
                 time.sleep(0.1)
                 continue
             
+            # Pick up users added or edited outside this app while scanning.
+            if self.roster_watcher.changed() and self.reload_roster():
+                self.root.after(0, self.load_users)
+            if self.gallery_watcher.changed():
+                self.load_known_faces()
+
             self.frame_counter += 1
             if self.frame_counter % self.PROCESS_EVERY_N_FRAMES == 0:
-                small_frame = cv2.resize(frame_to_process, (0, 0), fx=0.25, fy=0.25)
-                rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+                if self.PROCESSING_SCALE < 1.0:
+                    small_frame = cv2.resize(frame_to_process, (0, 0), fx=self.PROCESSING_SCALE, fy=self.PROCESSING_SCALE, interpolation=cv2.INTER_AREA)
+                else:
+                    small_frame = frame_to_process
+                frame_time = time.monotonic()
+                if self.remote_recognizer and not self.motion_gate.should_process(small_frame, bool(self.recognition_result.faces), frame_time):
+                    time.sleep(0.01)
+                    continue
                 
-                face_locations = face_recognition.face_locations(rgb_small_frame, model='hog')
-                face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-                landmarks = face_recognition.face_landmarks(rgb_small_frame, face_locations)
+                gallery = self.gallery
+                if gallery is not cache_gallery:
+                    # Enrolments changed; cached identities may be stale.
+                    self.identity_cache.clear()
+                    cache_gallery = gallery
+
+                if self.remote_recognizer:
+                    face_locations = self._detect_faces_fast(small_frame)
+                else:
+                    rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+                    face_locations = face_recognition.face_locations(rgb_small_frame, model='hog')
+                # Faces of people logged within the cooldown skip encoding and matching.
+                cached = self.identity_cache.lookup(face_locations, frame_time)
+                pending = [i for i, hit in enumerate(cached) if hit is None]
+                pending_locations = [face_locations[i] for i in pending]
+                track_ids = self.liveness_tracker.assign(pending_locations, frame_time)
+
+                face_encodings, eyes_closed, matches = [], [], []
+                if pending_locations and self.remote_recognizer:
+                    matches, eyes_closed = self._recognize_remote(frame_to_process, pending_locations, track_ids)
+                elif pending_locations:
+                    if self.HIGH_RES_ENCODING and self.PROCESSING_SCALE < 1.0:
+                        face_encodings = self._encode_high_res_crops(frame_to_process, pending_locations)
+                    else:
+                        face_encodings = face_recognition.face_encodings(rgb_small_frame, pending_locations)
+                    eyes_closed = Liveness.analyze(face_recognition.face_landmarks(rgb_small_frame, pending_locations), self.EYE_AR_THRESH)['eyes_closed']
+                    ranked = gallery.rank(face_encodings)
+                    matches = gallery.accept(ranked, self.match_tolerance, self.user_tolerances)
+                    self.match_telemetry.record(ranked, matches, track_ids)
                 
-                current_names = []
-                for i, enc in enumerate(face_encodings):
-                    matches = face_recognition.compare_faces(self.known_face_encodings, enc, tolerance=0.5)
-                    name, face_id = "Unknown", None
+                current_names = [None if hit is None else {"name": hit[1], "id": hit[0]} for hit in cached]
+                now = datetime.now()
+                for j, (face_id, best_distance, _) in enumerate(matches):
+                    i = pending[j]
+                    name = "Unknown"
                     
-                    if any(matches):
-                        face_distances = face_recognition.face_distance(self.known_face_encodings, enc)
-                        best_match_idx = np.argmin(face_distances)
-                        if matches[best_match_idx]:
-                            face_id = self.known_face_ids[best_match_idx]
-                            
-                            ear = (self.eye_aspect_ratio(landmarks[i]['left_eye']) + self.eye_aspect_ratio(landmarks[i]['right_eye'])) / 2.0
-                            if ear < self.EYE_AR_THRESH:
-                                self.live_blink_counters[face_id] = self.live_blink_counters.get(face_id, 0) + 1
-                            else:
-                                if self.live_blink_counters.get(face_id, 0) >= self.EYE_AR_CONSEC_FRAMES_ATTENDANCE:
-                                    self.root.after(0, self.log_attendance, face_id)
-                                self.live_blink_counters[face_id] = 0
+                    if face_id is not None:
+                        self.startup.mark('first_recognition')
+                        name = student_names.get(face_id, name)
+
+                        last_logged = self.last_recognition_times.get(face_id)
+                        remaining = self.RECOGNITION_COOLDOWN_SECONDS - (now - last_logged).total_seconds() if last_logged else 0
+                        if remaining > 0:
+                            self.identity_cache.remember(face_locations[i], face_id, name, frame_time + remaining, frame_time)
+                        elif self.liveness_tracker.update(track_ids[j], face_id, bool(eyes_closed[j]), frame_time):
+                            self.root.after(0, self.log_attendance, face_id)
+                            self.match_telemetry.confirm(track_ids[j], face_id)
+                            if self.ADAPTIVE_TEMPLATES and face_encodings and best_distance <= self.ADAPTIVE_TEMPLATE_DISTANCE:
+                                self.root.after(0, self.add_live_template, face_id, face_encodings[j])
+                    elif face_encodings:
+                        # Remote workers only return matches, so unknown faces are clustered in local mode.
+                        crop, _ = self._full_res_crops(frame_to_process, [face_locations[i]])[0]
+                        self.unknown_clusters.add(face_encodings[j], crop, now)
                             
-                            try:
-                                # face_id is a string, students_df['ID'] is numeric
-                                user_info = students_df[students_df['ID'] == int(face_id)]
-                                if not user_info.empty: name = user_info.iloc[0]['Name']
-                            except (ValueError, KeyError): pass
-                                
-                    current_names.append({"name": name, "id": face_id})
+                    current_names[i] = {"name": name, "id": face_id}
                 
-                self.last_known_locations = face_locations
-                self.last_known_names = current_names
+                # Published in one assignment: readers see the whole previous or the whole new result.
+                self.recognition_result = RecognitionResult(
+                    self.recognition_result.seq + 1, frame_time,
+                    tuple((tuple(location), info["name"], info["id"]) for location, info in zip(face_locations, current_names)))
+
+                unknown = sum(1 for face_id, _, _ in matches if face_id is None)
+                if unknown and frame_time - self.last_unknown_event >= 5.0:
+                    self.events.publish('unknown_face', count=unknown)
+                    self.last_unknown_event = frame_time
+                for face_id in self.liveness_tracker.expire(frame_time):
+                    self.events.publish('liveness_failure', id=int(face_id), name=student_names.get(face_id, ''))
+                if frame_time - last_cluster_save >= 60.0:
+                    self.unknown_clusters.save()
+                    last_cluster_save = frame_time
             
             time.sleep(0.01)
+        self.unknown_clusters.save()
+        self.match_telemetry.save(self.telemetry_file)
+
+    def _encode_high_res_crops(self, frame, small_locations, margin=0.25):
+        """
+        Computes encodings from full-resolution crops around faces detected on the
+        downscaled frame. Only the crops are colour-converted, not the whole frame.
+        """
+        encodings = []
+        for crop, location in self._full_res_crops(frame, small_locations, margin):
+            encodings.append(face_recognition.face_encodings(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB), [location])[0])
+        return encodings
+
+    def _full_res_crops(self, frame, small_locations, margin=0.25):
+        """Crops faces found on the downscaled frame out of the full-resolution frame."""
+        inv_scale = 1.0 / self.PROCESSING_SCALE
+        return [crop_face(frame, tuple(int(v * inv_scale) for v in location), margin) for location in small_locations]
+
+    def _detect_faces_fast(self, small_frame):
+        """OpenCV Haar cascade detection for thin kiosks in remote mode (much cheaper than dlib HOG)."""
+        if self.face_cascade is None:
+            self.face_cascade = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml'))
+        gray = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
+        faces = self.face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(20, 20))
+        return [(int(y), int(x + w), int(y + h), int(x)) for x, y, w, h in faces]
+
+    def _recognize_remote(self, frame, small_locations, track_ids=None):
+        """Sends full-resolution face crops to the recognition worker. Returns (matches, eyes_closed)."""
+        try:
+            results = self.remote_recognizer.recognize(self._full_res_crops(frame, small_locations))
+        except OSError as e:
+            logging.error(f"Recognition worker unavailable: {e}")
+            time.sleep(0.5)
+            return [(None, float('inf'), float('inf'))] * len(small_locations), [False] * len(small_locations)
+        matches = [(r['id'], r['distance'] if r['distance'] is not None else float('inf'),
+                    r['second'] if r['second'] is not None else float('inf')) for r in results]
+        self.match_telemetry.record([(r.get('candidate'), r['distance'], r.get('runner_up'), r['second']) for r in results],
+                                    [(r['id'], None, None) for r in results], track_ids)
+        return matches, [r['eyes_closed'] for r in results]
 
     def _get_and_validate_dates(self, start_date_entry, end_date_entry):
         """Helper function to get and validate date range from DateEntry widgets."""
@@ -955,14 +5361,11 @@ class FacialRecognitionAttendanceSystem:
             return
         
         try:
-            df = self.safe_read_csv(self.attendance_file)
+            df = self.attendance_store.read_range(start_date, end_date, typed=True)
             if df is None:
-                self.show_toast("No Data", "Attendance file is empty or missing.", "info")
+                self.show_toast("No Data", f"No records found for the selected date range.", "info")
                 return
 
-            df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-            df.dropna(subset=['Date'], inplace=True)
-            
             # Filter based on the selected date range (inclusive)
             mask = (df['Date'] >= start_date) & (df['Date'] <= end_date)
             filtered_df = df.loc[mask]
@@ -971,8 +5374,7 @@ class FacialRecognitionAttendanceSystem:
                 self.show_toast("No Data", f"No records found for the selected date range.", "info")
                 return
             
-            filtered_df['Date'] = filtered_df['Date'].dt.strftime('%Y-%m-%d')
-            filtered_df = filtered_df.fillna('---')
+            filtered_df = AttendanceSchema.to_text(filtered_df).replace('', '---')
             for _, row in filtered_df.iloc[::-1].iterrows():
                 self.history_tree.insert("", tk.END, values=list(row))
         except Exception as e:
@@ -986,14 +5388,11 @@ class FacialRecognitionAttendanceSystem:
             return
             
         try:
-            df = self.safe_read_csv(self.attendance_file)
+            df = self.attendance_store.read_range(start_date, end_date, typed=True)
             if df is None:
-                self.show_toast("Export Error", "Attendance file is empty or missing.", "warning")
+                self.show_toast("Export Error", "No data in the current view to export.", "warning")
                 return
 
-            df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-            df.dropna(subset=['Date'], inplace=True)
-
             mask = (df['Date'] >= start_date) & (df['Date'] <= end_date)
             filtered_df = df.loc[mask]
             
@@ -1010,7 +5409,7 @@ class FacialRecognitionAttendanceSystem:
             )
             
             if save_path:
-                self.safe_save_csv(filtered_df, save_path)
+                self.safe_save_csv(AttendanceSchema.to_text(filtered_df), save_path, checksum=False)
                 self.show_toast("Export Successful", f"Data saved to {os.path.basename(save_path)}", "success")
         except Exception as e:
             self.show_toast("Export Error", f"Failed to export data: {e}", "danger")
@@ -1022,13 +5421,6 @@ class FacialRecognitionAttendanceSystem:
         ToastNotification(title=title, message=message, duration=duration, bootstyle=bootstyle,
                           position=(20, 20, 'ne'), icon=icon, alert=True).show_toast()
 
-    def eye_aspect_ratio(self, eye):
-        """Calculates the Eye Aspect Ratio (EAR) for blink detection."""
-        A = dist.euclidean(eye[1], eye[5])
-        B = dist.euclidean(eye[2], eye[4])
-        C = dist.euclidean(eye[0], eye[3])
-        return (A + B) / (2.0 * C)
-
     def edit_user(self):
         """Enables 'edit mode' by populating the registration form with the selected user's data."""
         selected_item = self.user_tree.selection()
@@ -1039,10 +5431,9 @@ class FacialRecognitionAttendanceSystem:
         self.editing_user_id, old_name = self.user_tree.item(selected_item, 'values')
         
         try:
-            students_df = self.safe_read_csv(self.students_file)
+            students_df = self.read_students()
             if students_df is None: return
             
-            students_df['ID'] = pd.to_numeric(students_df['ID'], errors='coerce').dropna().astype(int)
             user_data = students_df[students_df['ID'] == int(self.editing_user_id)].iloc[0]
 
             self.user_id_entry.delete(0, tk.END)
@@ -1098,19 +5489,22 @@ class FacialRecognitionAttendanceSystem:
             user_id_int = int(self.editing_user_id)
             selected_days = ",".join([day for day, var in self.schedule_day_vars.items() if var.get()])
             
-            s_df = self.safe_read_csv(self.students_file)
+            s_df = self.read_students()
             if s_df is not None:
-                s_df['ID'] = pd.to_numeric(s_df['ID'], errors='coerce')
                 idx = s_df.index[s_df['ID'] == user_id_int].tolist()
                 if idx:
-                    s_df.loc[idx[0], ['Name', 'ScheduleDays', 'ScheduleTimeIn', 'ScheduleTimeOut']] = [new_name, selected_days, schedule_time_in, schedule_time_out]
-                    self.safe_save_csv(s_df, self.students_file)
+                    AttendanceSchema.set_name(s_df, idx[0], new_name)
+                    s_df.loc[idx[0], ['ScheduleDays', 'ScheduleTimeIn', 'ScheduleTimeOut']] = [selected_days, schedule_time_in, schedule_time_out]
+                    self.save_students(s_df)
+                    self.apply_roster_delta({str(user_id_int): new_name})
+                    self.queue_gallery_change(user_id_int)
             
-            a_df = self.safe_read_csv(self.attendance_file)
-            if a_df is not None and not a_df.empty:
-                a_df['ID'] = pd.to_numeric(a_df['ID'], errors='coerce')
-                a_df.loc[a_df['ID'] == user_id_int, 'Name'] = new_name
-                self.safe_save_csv(a_df, self.attendance_file)
+            for key in self.attendance_store.keys():
+                a_df = self.attendance_store.read_partition(key, typed=True)
+                user_rows = (a_df['ID'] == user_id_int) & (a_df['Name'] != new_name)
+                if user_rows.any():
+                    AttendanceSchema.set_name(a_df, user_rows, new_name)
+                    self.attendance_store.write_partition(key, a_df)
                     
             self.show_toast("Success", f"User {new_name}'s details updated.", "success")
             self.load_users()
@@ -1136,6 +5530,294 @@ class FacialRecognitionAttendanceSystem:
         self.cancel_edit_button.grid_remove()
         self.register_button.grid(row=3, column=0, columnspan=2, pady=20)
 
+    def bulk_import_users(self):
+        """Imports a roster CSV plus a folder of ID-named photos in the background."""
+        roster_path = filedialog.askopenfilename(title="Select Roster CSV (ID, Name, ScheduleDays, ScheduleTimeIn, ScheduleTimeOut)",
+                                                 filetypes=[("CSV files", "*.csv")])
+        if not roster_path:
+            return
+        photo_dir = filedialog.askdirectory(title="Select Folder of Photos Named by User ID")
+        if not photo_dir:
+            return
+
+        importer = BulkEnrolmentImporter(self.students_file, self.encodings_file)
+        self.show_toast("Bulk Import", "Encoding photos in the background...", "info")
+
+        def worker():
+            try:
+                prepared = importer.prepare(roster_path, photo_dir)
+                staged = importer.stage_photos(prepared['accepted'])
+                # Committed on the Tk thread, where the roster is edited, against the data as it is then.
+                self.root.after(0, self._on_bulk_import_done, importer, prepared, staged)
+            except Exception as e:
+                logging.error(f"Bulk import failed: {e}")
+                self.root.after(0, self.show_toast, "Import Error", f"Bulk import failed: {e}", "danger")
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _on_bulk_import_done(self, importer, prepared, staged):
+        """Commits an encoded bulk import, refreshes the user list and reports failures."""
+        result = {'failures': prepared['failures']}
+        try:
+            result['imported'] = self.commit_bulk_import(importer, prepared['accepted'], staged, result['failures'])
+        except Exception as e:
+            logging.error(f"Bulk import failed: {e}")
+            self.show_toast("Import Error", f"Bulk import failed: {e}", "danger")
+            return
+        result['seconds'] = time.perf_counter() - prepared['started']
+        self.reload_roster()
+        self.load_users()
+        self.queue_gallery_change(*result['imported'])
+        summary = f"Imported {len(result['imported'])} users in {result['seconds']:.1f}s."
+        if result['failures']:
+            report_path = os.path.join('data', f"import_failures_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+            BulkEnrolmentImporter.write_failure_report(result['failures'], report_path)
+            summary += f" {len(result['failures'])} rows failed; see {report_path}."
+        self.show_toast("Bulk Import", summary, "warning" if result['failures'] else "success", duration=8000)
+
+    def commit_bulk_import(self, importer, accepted, staged, failures):
+        """
+        Merges encoded import rows into the current roster and gallery under the
+        gallery lock and writes students.csv and the encodings store with
+        atomic_write. IDs registered since the import started are refused (added
+        to 'failures'). If students.csv cannot be written, the previous encodings
+        are put back and nothing changes. Returns the imported IDs.
+        """
+        students = self.read_students()
+        existing_ids = set(students['ID'].astype(str)) if students is not None else set()
+        if self.student_raw_rows is not None:
+            existing_ids |= set(self.student_raw_rows['ID'].astype(str).str.strip())
+        imported = []
+
+        def merge(gallery):
+            merged, rows, refused = importer.merge(accepted, existing_ids, gallery)
+            failures.extend(refused)
+            if not rows:
+                return gallery
+            atomic_write(self.encodings_file, pickle.dumps((list(merged.encodings), merged.ids, merged.sources)))
+            try:
+                new_rows = AttendanceSchema.typed(pd.DataFrame(rows))
+                roster = new_rows if students is None else pd.concat([students, new_rows], ignore_index=True)
+                atomic_write(self.students_file, AttendanceSchema.to_text(roster, self.student_raw_rows).to_csv(index=False).encode('utf-8'))
+            except Exception:
+                atomic_write(self.encodings_file, pickle.dumps((list(gallery.encodings), gallery.ids, gallery.sources)))
+                raise
+            imported.extend(row['ID'] for row in rows)
+            return merged
+
+        try:
+            self.update_gallery(merge)
+        except Exception:
+            importer.install_photos(staged, ())
+            raise
+        self.gallery_watcher.mark_seen()
+        importer.install_photos(staged, imported)
+        return imported
+
+    def review_unknown_faces(self):
+        """Opens a window listing clusters of unknown faces to enrol, merge into a user, or discard."""
+        self.unknown_clusters.save()
+        window = bstrap.Toplevel(self.root)
+        window.title("Unknown Faces")
+        window.geometry("900x500")
+
+        list_frame = bstrap.Frame(window, padding=10)
+        list_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        columns = ('Cluster', 'Visits', 'Sightings', 'First Seen', 'Last Seen', 'Closest User')
+        tree = bstrap.Treeview(list_frame, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, anchor='center', width=90 if col in ('Cluster', 'Visits', 'Sightings') else 140)
+        tree.pack(fill=tk.BOTH, expand=True)
+
+        side = bstrap.Frame(window, padding=10)
+        side.pack(side=tk.RIGHT, fill=tk.Y)
+        photo_label = bstrap.Label(side, background="#E5E7EB", width=28, text="\n\nNo Cluster\nSelected", font=('Inter', 12))
+        photo_label.pack(pady=10)
+        bstrap.Label(side, text="Merge into existing user:").pack(anchor='w', pady=(10, 0))
+        user_var = tk.StringVar()
+        user_combo = bstrap.Combobox(side, textvariable=user_var, state='readonly',
+                                     values=[f"{uid} - {name}" for uid, name in sorted(self.student_names.items(), key=lambda kv: kv[1])])
+        user_combo.pack(fill=tk.X, pady=5)
+
+        summaries = {}
+
+        def refresh():
+            summaries.clear()
+            for i in tree.get_children(): tree.delete(i)
+            clusters = self.unknown_clusters.summaries()
+            gallery = self.gallery
+            distances = gallery.distances([c['centroid'] for c in clusters]) if clusters else None
+            for n, cluster in enumerate(clusters):
+                closest = "---"
+                if distances is not None and distances.shape[1]:
+                    best = int(np.argmin(distances[n]))
+                    person_id = gallery.person_ids[best]
+                    closest = f"{self.student_names.get(person_id, person_id)} ({distances[n][best]:.2f})"
+                summaries[str(cluster['id'])] = cluster
+                tree.insert("", tk.END, iid=str(cluster['id']), values=(
+                    cluster['id'], cluster['visits'], cluster['count'],
+                    cluster['first_seen'].strftime('%Y-%m-%d %I:%M %p'), cluster['last_seen'].strftime('%Y-%m-%d %I:%M %p'), closest))
+            show_selected()
+
+        def selected_cluster():
+            selection = tree.selection()
+            return summaries.get(selection[0]) if selection else None
+
+        def show_selected(event=None):
+            cluster = selected_cluster()
+            photo_label.config(image='', text="\n\nNo Cluster\nSelected" if cluster is None else "\n\nNo Image\nYet")
+            photo_label.image = None
+            if cluster is None or not cluster['crop'] or not os.path.exists(cluster['crop']):
+                return
+            try:
+                with Image.open(cluster['crop']) as img:
+                    img.thumbnail((200, 200))
+                    photo = ImageTk.PhotoImage(img)
+                    photo_label.config(image=photo, text="")
+                    photo_label.image = photo
+            except Exception as e:
+                logging.error(f"Error loading image {cluster['crop']}: {e}")
+
+        def enrol():
+            cluster = selected_cluster()
+            if cluster is None:
+                self.show_toast("Unknown Faces", "Please select a cluster.", "warning")
+                return
+            user_id = simpledialog.askstring("Enrol Cluster", "New User ID:", parent=window)
+            if not user_id:
+                return
+            user_id = user_id.strip()
+            if not user_id.isdigit():
+                self.show_toast("Invalid ID", "User ID must be a number.", "warning")
+                return
+            user_id = str(int(user_id))
+            if user_id in self.student_names:
+                self.show_toast("Registration Error", "This User ID already exists.", "danger")
+                return
+            user_name = (simpledialog.askstring("Enrol Cluster", "Name:", parent=window) or "").strip()
+            if not user_name:
+                return
+            try:
+                templates = FaceGallery.build_templates(self.unknown_clusters.samples(cluster['id']), self.ENROLMENT_MEDOIDS)
+                self.update_gallery(lambda gallery: gallery.with_person(user_id, templates))
+                self.save_known_faces()
+                # The schedule can be set afterwards with Edit User.
+                with open(self.students_file, 'a', newline='') as f:
+                    csv.writer(f).writerow([user_id, user_name, '', '', ''])
+                self.apply_roster_delta({user_id: user_name})
+                self.queue_gallery_change(user_id)
+                if cluster['crop'] and os.path.exists(cluster['crop']):
+                    shutil.copyfile(cluster['crop'], os.path.join('registered_faces', f"{user_id}.jpg"))
+                self.unknown_clusters.remove(cluster['id'])
+                self.unknown_clusters.save()
+                self.show_toast("Success", f"User {user_name} registered from unknown faces.", "success")
+                self.load_users()
+                refresh()
+            except Exception as e:
+                self.show_toast("Registration Error", f"An error occurred: {e}", "danger")
+                logging.error(f"Error enrolling unknown face cluster: {e}")
+
+        def merge():
+            cluster = selected_cluster()
+            if cluster is None or not user_var.get():
+                self.show_toast("Unknown Faces", "Please select a cluster and a user.", "warning")
+                return
+            user_id = user_var.get().split(' - ', 1)[0]
+            if user_id not in self.gallery.person_ids:
+                self.show_toast("Merge Error", "The selected user has no face data to merge into.", "warning")
+                return
+            if not messagebox.askyesno("Confirm Merge", f"Add the faces of cluster {cluster['id']} to {user_var.get()}?", parent=window):
+                return
+            added = FaceGallery.build_templates(self.unknown_clusters.samples(cluster['id']), self.ENROLMENT_MEDOIDS)
+
+            def with_cluster(gallery):
+                # Enrolment templates first, then the cluster's, then live captures; trimmed to the per-person limit.
+                own = [(template, source) for template, pid, source in zip(gallery.encodings, gallery.ids, gallery.sources) if pid == user_id]
+                merged = ([item for item in own if item[1] != 'live'] + [(template, 'enrol') for template in added]
+                          + [item for item in own if item[1] == 'live'])[:self.MAX_TEMPLATES_PER_PERSON]
+                return gallery.with_person(user_id, [t for t, _ in merged], [s for _, s in merged])
+            try:
+                self.update_gallery(with_cluster)
+                self.save_known_faces()
+                self.identity_cache.forget(user_id)
+                self.queue_gallery_change(user_id)
+                self.unknown_clusters.remove(cluster['id'])
+                self.unknown_clusters.save()
+                self.show_toast("Success", f"Cluster {cluster['id']} merged into {user_var.get()}.", "success")
+                refresh()
+            except Exception as e:
+                self.show_toast("Merge Error", f"An error occurred: {e}", "danger")
+                logging.error(f"Error merging unknown face cluster: {e}")
+
+        def discard():
+            cluster = selected_cluster()
+            if cluster is None:
+                return
+            self.unknown_clusters.remove(cluster['id'])
+            self.unknown_clusters.save()
+            refresh()
+
+        tree.bind('<<TreeviewSelect>>', show_selected)
+        bstrap.Button(side, text=" Merge into User", image=self.edit_user_icon, compound=tk.LEFT, command=merge).pack(pady=5, fill=tk.X)
+        bstrap.Button(side, text=" Enrol as New User", image=self.add_user_icon, compound=tk.LEFT, command=enrol, bootstyle="success").pack(pady=5, fill=tk.X)
+        bstrap.Button(side, text=" Discard", image=self.delete_user_icon, compound=tk.LEFT, command=discard, bootstyle="danger").pack(pady=5, fill=tk.X)
+        bstrap.Button(side, text=" Refresh List", image=self.refresh_icon, compound=tk.LEFT, command=refresh, bootstyle="info-outline").pack(pady=(15, 5), fill=tk.X)
+        refresh()
+
+    def add_live_template(self, face_id, encoding):
+        """Adds a high-confidence, liveness-verified capture to a person's templates."""
+        if face_id not in self.gallery.person_ids:
+            return
+        version = self.gallery_version
+        self.update_gallery(lambda gallery: gallery.with_live_template(face_id, encoding, self.MAX_TEMPLATES_PER_PERSON))
+        if self.gallery_version != version:
+            self.save_known_faces()
+            self.queue_gallery_change(face_id)
+
+    def queue_gallery_change(self, *user_ids):
+        """Queues users' current templates and roster rows for the fleet (a deletion for users who are gone)."""
+        if not self.sync or not user_ids:
+            return
+        df = self.safe_read_csv(self.students_file)
+        gallery = self.gallery
+        for user_id in map(str, user_ids):
+            student = None
+            if df is not None:
+                rows = df[df['ID'].astype(str) == user_id]
+                if not rows.empty:
+                    student = rows.iloc[0].astype(object).where(rows.iloc[0].notna(), '').to_dict()
+            if student is None or user_id not in gallery.person_ids:
+                self.sync.enqueue('gallery', person_id=user_id, templates=None, sources=None, student=None)
+                continue
+            indices = [i for i, pid in enumerate(gallery.ids) if pid == user_id]
+            self.sync.enqueue('gallery', person_id=user_id, templates=gallery.encodings[indices].tolist(),
+                              sources=[gallery.sources[i] for i in indices], student=student)
+
+    def apply_gallery_changes(self, changes):
+        """Applies gallery deltas pulled from the aggregation service to the local gallery and roster."""
+        def apply(gallery):
+            for person_id, change in changes.items():
+                if change.get('templates'):
+                    gallery = gallery.with_person(person_id, change['templates'], change.get('sources') or 'enrol')
+                else:
+                    gallery = gallery.without_person(person_id)
+            return gallery
+
+        self.update_gallery(apply)
+        self.save_known_faces()
+        df = self.safe_read_csv(self.students_file)
+        if df is None:
+            df = pd.DataFrame(columns=['ID', 'Name', 'ScheduleDays', 'ScheduleTimeIn', 'ScheduleTimeOut'])
+        for person_id, change in changes.items():
+            df = df[df['ID'].astype(str) != str(person_id)]
+            if change.get('templates') and change.get('student'):
+                df = pd.concat([df, pd.DataFrame([change['student']])], ignore_index=True)
+        self.safe_save_csv(df[['ID', 'Name', 'ScheduleDays', 'ScheduleTimeIn', 'ScheduleTimeOut']], self.students_file)
+        self.apply_roster_delta({str(pid): (c.get('student') or {}).get('Name', '') for pid, c in changes.items() if c.get('templates')},
+                                [str(pid) for pid, c in changes.items() if not c.get('templates')])
+        self.load_users()
+        print(f"Applied {len(changes)} gallery changes from the aggregation service.")
+
     def delete_user(self):
         """Deletes a selected user from the system."""
         selected_item = self.user_tree.selection()
@@ -1150,20 +5832,19 @@ class FacialRecognitionAttendanceSystem:
             
         try:
             user_id_int = int(user_id_str)
-            df = self.safe_read_csv(self.students_file)
+            df = self.read_students()
             if df is not None:
-                df['ID'] = pd.to_numeric(df['ID'], errors='coerce')
                 df = df[df['ID'] != user_id_int]
-                self.safe_save_csv(df, self.students_file)
+                self.save_students(df)
+                self.apply_roster_delta(deletes=[user_id_str])
             
-            if self.known_face_ids:
-                indices_to_keep = [i for i, fid in enumerate(self.known_face_ids) if fid != user_id_str]
-                self.known_face_encodings = [self.known_face_encodings[i] for i in indices_to_keep]
-                self.known_face_ids = [self.known_face_ids[i] for i in indices_to_keep]
+            if user_id_str in self.gallery.person_ids:
+                self.update_gallery(lambda gallery: gallery.without_person(user_id_str))
                 self.save_known_faces()
             
             img_path = os.path.join('registered_faces', f"{user_id_str}.jpg")
             if os.path.exists(img_path): os.remove(img_path)
+            self.queue_gallery_change(user_id_str)
                 
             self.show_toast("Success", f"User {user_name} has been removed.", "success")
             self.load_users()
@@ -1178,71 +5859,60 @@ class FacialRecognitionAttendanceSystem:
             return
 
         try:
-            s_df = self.safe_read_csv(self.students_file)
-            if s_df is None: return
-            
-            s_df['ID'] = pd.to_numeric(s_df['ID'], errors='coerce')
-            user_info_row = s_df[s_df['ID'] == int(face_id)]
-            if user_info_row.empty: return
+            schedules = self.get_schedule_engine()
+            user_name = schedules.name_of(face_id)
+            if user_name is None: return
             
-            user_info = user_info_row.iloc[0]
-            user_name = user_info['Name']
             date = now.strftime('%Y-%m-%d')
             time_str = now.strftime('%I:%M:%S %p')
-            
-            with open(self.scan_log_file, 'a', newline='') as f:
-                csv.writer(f).writerow([face_id, user_name, date, time_str])
 
-            a_df = self.safe_read_csv(self.attendance_file)
-            if a_df is None:
-                a_df = pd.DataFrame(columns=['ID', 'Name', 'Date', 'TimeIn', 'TimeOut'])
+            # Only today's partition is read and rewritten.
+            partition_key = self.attendance_store.partition_key(date)
+            a_df = self.attendance_store.read_partition(partition_key, typed=True)
 
-            a_df['ID'] = pd.to_numeric(a_df['ID'], errors='coerce')
-            today_record = a_df[(a_df['ID'] == int(face_id)) & (a_df['Date'] == date)]
+            today = pd.Timestamp(now.date())
+            today_record = a_df[(a_df['ID'] == int(face_id)) & (a_df['Date'] == today)]
             
             if today_record.empty:
-                is_late = False
-                schedule_days = user_info.get('ScheduleDays')
-                schedule_time_in_str = user_info.get('ScheduleTimeIn')
-
-                if pd.notna(schedule_days) and now.strftime('%a') in schedule_days and pd.notna(schedule_time_in_str) and schedule_time_in_str:
-                    try:
-                        schedule_time = datetime.strptime(schedule_time_in_str, '%I:%M %p').time()
-                        if now.time() > schedule_time:
-                            is_late = True
-                    except ValueError:
-                        logging.error(f"Could not parse schedule time '{schedule_time_in_str}' for user {face_id}")
+                is_late = schedules.is_late(face_id, now)
 
-                new_entry = pd.DataFrame([{'ID': int(face_id), 'Name': user_name, 'Date': date, 'TimeIn': time_str, 'TimeOut': ''}])
+                new_entry = AttendanceSchema.typed(pd.DataFrame({'ID': [int(face_id)], 'Name': [user_name], 'Date': [today],
+                                                                 'TimeIn': [AttendanceSchema.seconds(now)], 'TimeOut': [AttendanceSchema.NO_TIME]}))
                 a_df = pd.concat([a_df, new_entry], ignore_index=True)
-                
-                toast_msg = f"{user_name} clocked in at {time_str}."
-                sound_type = 'in'
-                if is_late:
-                    toast_msg = f"{user_name} clocked in LATE at {time_str}."
-                    sound_type = 'late'
-                
-                self.show_toast("Time In" if not is_late else "Late", toast_msg, "success" if not is_late else "warning")
-                self.play_sound(sound_type)
+                event = dict(type='late' if is_late else 'time_in', time_in=time_str, time_out='', late=is_late)
             else:
-                a_df.loc[today_record.index[0], 'TimeOut'] = time_str
-                self.show_toast("Scan Recorded", f"{user_name}'s new scan time is {time_str}.", "info")
-                self.play_sound('out')
+                a_df.loc[today_record.index[0], 'TimeOut'] = AttendanceSchema.seconds(now)
+                event = dict(type='time_out', time_in=AttendanceSchema.format_time(today_record.iloc[0]['TimeIn']), time_out=time_str, late=None)
                 
-            self.safe_save_csv(a_df, self.attendance_file)
-            self.load_attendance()
+            self.scan_wal.append({'type': event['type'], 'id': int(face_id), 'name': user_name, 'date': date, 'time': time_str})
+            version = self.attendance_store.write_partition(partition_key, a_df)
             self.last_recognition_times[face_id] = now
+            # Toasts, sounds, the scan log and integrations are handled by the event sinks.
+            self.events.publish(event.pop('type'), id=int(face_id), name=user_name, date=date, time=time_str,
+                                partition_version=version, **event)
         
         except Exception as e:
             self.show_toast("Logging Error", f"An error occurred: {e}", "danger")
             logging.error(f"Error logging attendance: {e}")
 
+    def get_schedule_engine(self):
+        """Returns the compiled schedules, recompiling only when students.csv has changed."""
+        try:
+            stat = os.stat(self.students_file)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        if self.schedule_engine is None or signature != self.schedule_signature:
+            self.schedule_engine = ScheduleEngine(self.read_students())
+            self.schedule_signature = signature
+        return self.schedule_engine
+
     def load_attendance(self):
         """Loads and displays the attendance summary in the live log."""
         for i in self.tree.get_children(): self.tree.delete(i)
-        df = self.safe_read_csv(self.attendance_file)
+        df = self.attendance_store.read_range(typed=True)
         if df is not None and not df.empty:
-            df = df.fillna('---')
+            df = AttendanceSchema.to_text(df).replace('', '---')
             for _, row in df.iloc[::-1].iterrows():
                 self.tree.insert("", tk.END, values=list(row))
 
@@ -1272,7 +5942,7 @@ class FacialRecognitionAttendanceSystem:
                 return
         
         try:
-            df = self.safe_read_csv(self.attendance_file)
+            df = self.attendance_store.read_range(start_date, end_date, typed=True)
             if df is None or df.empty:
                 self.show_toast("Export Error", "No attendance summary data to export.", "warning")
                 return
@@ -1281,8 +5951,6 @@ class FacialRecognitionAttendanceSystem:
                 filtered_df = df
                 initial_file = f"full_attendance_summary_{datetime.now().strftime('%Y-%m-%d')}.csv"
             else:
-                df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-                df.dropna(subset=['Date'], inplace=True)
                 mask = (df['Date'] >= start_date) & (df['Date'] <= end_date)
                 filtered_df = df.loc[mask]
                 start_str, end_str = start_date.strftime('%Y%m%d'), end_date.strftime('%Y%m%d')
@@ -1298,12 +5966,62 @@ class FacialRecognitionAttendanceSystem:
             )
             
             if save_path:
-                self.safe_save_csv(filtered_df, save_path)
+                self.safe_save_csv(AttendanceSchema.to_text(filtered_df), save_path, checksum=False)
                 self.show_toast("Export Successful", f"Summary saved to {os.path.basename(save_path)}", "success")
         except Exception as e:
             self.show_toast("Export Error", f"Failed to export data: {e}", "danger")
             logging.error(f"Error exporting attendance summary: {e}")
 
+    def build_absentee_report(self, start_date, end_date, as_of=None):
+        """
+        Lists scheduled users without an attendance record for each day of the range.
+        Past days are judged at end of day; the day of 'as_of' only up to that time.
+        """
+        schedules = self.get_schedule_engine()
+        as_of = as_of or datetime.now()
+        attendance = self.attendance_store.read_range(start_date, end_date, columns=['ID', 'Date'], typed=True)
+        present_by_date = {}
+        if attendance is not None:
+            present_by_date = attendance.groupby('Date')['ID'].agg(lambda ids: set(ids.astype(int))).to_dict()
+
+        reports = []
+        for day in pd.date_range(start_date.date(), end_date.date(), freq='D'):
+            if day.date() > as_of.date():
+                break
+            when = as_of if day.date() == as_of.date() else day.to_pydatetime().replace(hour=23, minute=59, second=59)
+            reports.append(schedules.absentees(when, present_by_date.get(day, set())))
+        if not reports:
+            return pd.DataFrame(columns=['Date', 'ID', 'Name', 'ScheduleTimeIn', 'ScheduleTimeOut'])
+        return pd.concat(reports, ignore_index=True)
+
+    def export_absentee_report(self, today_only=False):
+        """Exports the absentee report for today or for the selected export date range."""
+        if today_only:
+            start_date = end_date = datetime.now()
+            initial_file = f"absentees_{start_date.strftime('%Y%m%d')}.csv"
+        else:
+            start_date, end_date = self._get_and_validate_dates(self.export_start_date_entry, self.export_end_date_entry)
+            if not start_date:
+                return
+            initial_file = f"absentees_{start_date.strftime('%Y%m%d')}_to_{end_date.strftime('%Y%m%d')}.csv"
+
+        try:
+            report = self.build_absentee_report(start_date, end_date)
+            if report.empty:
+                self.show_toast("No Absentees", "Every scheduled user has scanned in for the selected days.", "info")
+                return
+
+            save_path = filedialog.asksaveasfilename(
+                defaultextension=".csv", filetypes=[("CSV files", "*.csv")],
+                title="Save Absentee Report As", initialfile=initial_file
+            )
+            if save_path:
+                self.safe_save_csv(report, save_path, checksum=False)
+                self.show_toast("Export Successful", f"{len(report)} absences saved to {os.path.basename(save_path)}", "success")
+        except Exception as e:
+            self.show_toast("Export Error", f"Failed to export absentee report: {e}", "danger")
+            logging.error(f"Error exporting absentee report: {e}")
+
     def export_scan_log_range(self, is_full_export=False):
         """Exports the detailed scan log for a date range, or all data if is_full_export is True."""
         start_date, end_date = None, None
@@ -1313,17 +6031,11 @@ class FacialRecognitionAttendanceSystem:
                 return
 
         try:
-            df = self.safe_read_csv(self.scan_log_file)
+            df = self.scan_log_store.read_range(start_date, end_date, typed=True)
             if df is None or df.empty:
                 self.show_toast("Export Error", "No detailed scan data to export.", "warning")
                 return
             
-            # --- Data Cleaning and Preparation ---
-            df['ID'] = pd.to_numeric(df['ID'], errors='coerce')
-            df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-            df.dropna(subset=['ID', 'Date'], inplace=True)
-            df['ID'] = df['ID'].astype(int)
-            
             if is_full_export:
                 filtered_df = df
                 start_str = "full_log"
@@ -1339,10 +6051,8 @@ class FacialRecognitionAttendanceSystem:
                 return
             
             # Continue with processing on the 'filtered_df'
-            time_str = filtered_df['Time'].astype(str)
-            date_str = filtered_df['Date'].dt.strftime('%Y-%m-%d')
-            filtered_df['timestamp'] = pd.to_datetime(date_str + ' ' + time_str, errors='coerce')
-            filtered_df.dropna(subset=['timestamp'], inplace=True)
+            filtered_df = filtered_df[filtered_df['Time'] != AttendanceSchema.NO_TIME].copy()
+            filtered_df['timestamp'] = filtered_df['Date'] + pd.to_timedelta(filtered_df['Time'], unit='s')
             
             if filtered_df.empty:
                 self.show_toast("No Data", "No valid time entries found in the selected range.", "info")
@@ -1393,7 +6103,7 @@ class FacialRecognitionAttendanceSystem:
             
             if save_path:
                 reshaped_df.fillna('---', inplace=True)
-                self.safe_save_csv(reshaped_df, save_path)
+                self.safe_save_csv(reshaped_df, save_path, checksum=False)
                 self.show_toast("Export Successful", f"Formatted log saved to {os.path.basename(save_path)}", "success")
                 
         except Exception as e:
@@ -1401,10 +6111,21 @@ class FacialRecognitionAttendanceSystem:
             logging.error(f"Error exporting detailed scan log: {e}")
             
     def safe_read_csv(self, file_path):
-        """Reads a CSV file, falling back to the most recent backup on failure."""
+        """
+        Reads a CSV file, falling back to the most recent backup on failure. An
+        empty file whose sidecar records content (a write lost in a power cut
+        before it was fsynced) counts as corrupt.
+        """
         try:
+            if os.path.exists(file_path) and os.path.getsize(file_path) == 0 \
+                    and any(entry.get('size') for entry in _read_checksums(file_path)):
+                raise pd.errors.EmptyDataError("file is empty but was written with content")
             if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-                return pd.read_csv(file_path, dtype={'ID': str})
+                with open(file_path, 'rb') as f:
+                    data = f.read()
+                if not verify_checksum(file_path, data):
+                    raise pd.errors.ParserError("checksum mismatch")
+                return pd.read_csv(io.BytesIO(data), dtype={'ID': str})
             else:
                 return None
         except (pd.errors.EmptyDataError, pd.errors.ParserError) as e:
@@ -1416,17 +6137,113 @@ class FacialRecognitionAttendanceSystem:
                 self.show_toast("Data Corruption", f"{os.path.basename(file_path)} is corrupted. No valid backup found.", "danger")
                 return None
 
-    def safe_save_csv(self, dataframe, file_path):
-        """Saves a DataFrame to a CSV file safely."""
+    def _save_partition_csv(self, dataframe, file_path):
+        """
+        Partition writer: atomic but not fsynced, so log_attendance never waits for
+        the disk. The WAL sync thread fsyncs the partitions shortly after, and scans
+        stay in the WAL until checkpoint_scan_wal. Failed writes are counted so the
+        WAL is then kept for replay.
+        """
+        try:
+            atomic_write(file_path, dataframe.to_csv(index=False).encode('utf-8'), durable=False)
+        except Exception as e:
+            self.partition_write_failures += 1
+            logging.error(f"Failed to save to {file_path}: {e}")
+            self.show_toast("Save Error", f"Could not save data to {os.path.basename(file_path)}.", "danger")
+
+    def replay_scan_wal(self):
+        """
+        Re-applies scans from the write-ahead log that did not reach the attendance
+        or scan log partitions before an unclean shutdown, then checkpoints the log.
+        Re-applying is idempotent: existing rows and later TimeOuts are kept.
+        """
+        records = self.scan_wal.read()
+        if not records:
+            return
+        restored = 0
+        by_key, logged_by_key = {}, {}
+        for record in records:
+            by_key.setdefault(self.attendance_store.partition_key(record['date']), []).append(record)
+        for key, batch in by_key.items():
+            a_df = self.attendance_store.read_partition(key, typed=True)
+            changed = False
+            for record in batch:
+                user_id, day = int(record['id']), pd.Timestamp(record['date'])
+                seconds = int(AttendanceSchema.parse_times([record['time']]).iloc[0])
+                rows = a_df.index[(a_df['ID'] == user_id) & (a_df['Date'] == day)]
+                if record['type'] == 'time_out':
+                    if len(rows) and a_df.at[rows[0], 'TimeOut'] < seconds:
+                        a_df.loc[rows[0], 'TimeOut'] = seconds
+                        changed = True
+                elif not len(rows):
+                    new_entry = AttendanceSchema.typed(pd.DataFrame({'ID': [user_id], 'Name': [record['name']], 'Date': [day],
+                                                                     'TimeIn': [seconds], 'TimeOut': [AttendanceSchema.NO_TIME]}))
+                    a_df = pd.concat([a_df, new_entry], ignore_index=True)
+                    changed = True
+                scan_key = self.scan_log_store.partition_key(record['date'])
+                if scan_key not in logged_by_key:
+                    scans = self.scan_log_store.read_partition(scan_key, typed=True)
+                    logged_by_key[scan_key] = set(zip(scans['ID'].tolist(), scans['Date'].tolist(), scans['Time'].tolist()))
+                logged = logged_by_key[scan_key]
+                if (user_id, day, seconds) not in logged:
+                    self.scan_log_store.append_row({'ID': user_id, 'Name': record['name'], 'Date': record['date'], 'Time': record['time']})
+                    if self.sync:
+                        self.sync.enqueue('scan', id=user_id, name=record['name'], date=record['date'], time=record['time'])
+                    logged.add((user_id, day, seconds))
+                    restored += 1
+            if changed:
+                self.attendance_store.write_partition(key, a_df)
+        self.checkpoint_scan_wal()
+        print(f"Replayed the scan log after an unclean shutdown: {restored} of {len(records)} scans were missing.")
+
+    def checkpoint_scan_wal(self):
+        """
+        Flushes the partitions written since the last checkpoint to disk and empties
+        the scan WAL, but only if every logged scan was stored: the storage sink
+        handled one event per WAL append and no sink or partition write failed.
+        Otherwise the WAL is kept and replayed on the next start.
+        """
+        self.attendance_store.flush_to_disk()
+        self.scan_log_store.flush_to_disk()
+        storage = self.events.subscriber('storage')
+        if storage.handled != self.scan_wal.appended or storage.failed or storage.dropped or self.partition_write_failures:
+            logging.error(f"Keeping the scan WAL for replay: {self.scan_wal.appended} scans logged, {storage.handled} stored, "
+                          f"{storage.failed} failed, {self.partition_write_failures} partition writes failed.")
+            return False
+        self.scan_wal.truncate()
+        return True
+
+    def read_students(self):
+        """
+        Loads students.csv with the AttendanceSchema types (None if missing or
+        unreadable). Rows that cannot be typed are kept for save_students.
+        """
+        df, self.student_raw_rows = AttendanceSchema.split(self.safe_read_csv(self.students_file))
+        return df
+
+    def save_students(self, df):
+        """Writes a typed roster back to students.csv, including the rows read_students could not type."""
+        self.safe_save_csv(AttendanceSchema.to_text(df, self.student_raw_rows), self.students_file)
+
+    def safe_save_csv(self, dataframe, file_path, durable=True, checksum=True):
+        """
+        Saves a DataFrame to a CSV file atomically (see atomic_write). Exports pass
+        checksum=False so no sidecar is left next to the user's file.
+        """
         try:
-            dataframe.to_csv(file_path, index=False)
+            atomic_write(file_path, dataframe.to_csv(index=False).encode('utf-8'), durable, checksum)
         except Exception as e:
             logging.error(f"Failed to save to {file_path}: {e}")
             self.show_toast("Save Error", f"Could not save data to {os.path.basename(file_path)}.", "danger")
             
     def restore_from_backup(self, file_to_restore):
-        """Finds the latest backup and restores the specified file."""
-        backup_dirs = sorted([d for d in os.listdir('data_backups') if os.path.isdir(os.path.join('data_backups', d))], reverse=True)
+        """Restores the specified file from the latest snapshot, then from legacy backup folders."""
+        if self.backups.restore(file_to_restore):
+            return True
+
+        # Full-copy folders written by older versions (data_backups/YYYYmmdd_HHMMSS/).
+        backup_dirs = sorted([d for d in os.listdir('data_backups')
+                              if re.match(r'^\d{8}_\d{6}$', d) and os.path.isdir(os.path.join('data_backups', d))], reverse=True)
         filename = os.path.basename(file_to_restore)
         
         for backup in backup_dirs:
@@ -1441,7 +6258,90 @@ class FacialRecognitionAttendanceSystem:
         return False
 
 
+def run_bulk_import_cli(roster_path, photo_dir, workers=None):
+    """Runs a bulk enrolment from the command line, without starting the GUI."""
+    for folder in ['data', 'registered_faces']:
+        os.makedirs(folder, exist_ok=True)
+    importer = BulkEnrolmentImporter('data/students.csv', 'data/encodings.pkl', workers=workers)
+    result = importer.run(roster_path, photo_dir, progress=lambda done, total: print(f"\rEncoded {done}/{total}", end="", flush=True))
+    print(f"\nImported {len(result['imported'])} users in {result['seconds']:.1f}s.")
+    if result['failures']:
+        report_path = os.path.join('data', f"import_failures_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+        BulkEnrolmentImporter.write_failure_report(result['failures'], report_path)
+        print(f"{len(result['failures'])} rows failed (see {report_path}):")
+        for user_id, name, reason in result['failures']:
+            print(f"  {user_id} {name}: {reason}")
+
+
+def run_rebuild_gallery_cli(workers=None):
+    """Rebuilds the encodings store from registered photos from the command line."""
+    os.makedirs('data', exist_ok=True)
+    cache = EncodingCache(os.path.join('data', 'encoding_cache.pkl'))
+    result = rebuild_gallery_from_photos('registered_faces', 'data/encodings.pkl', cache, workers,
+                                         progress=lambda done, total: print(f"\rEncoded {done}/{total}", end="", flush=True))
+    print(f"\nRe-encoded {len(result['rebuilt'])} of {result['persons']} users in {result['seconds']:.1f}s "
+          f"({result['hits']} from cache, {result['misses']} encoded).")
+    for user_id, status in result['failures']:
+        print(f"  {user_id}: {status} (current templates kept)")
+
+
+def run_recognition_worker_cli(port, host='127.0.0.1'):
+    """Serves encoding and matching for remote-mode kiosks until interrupted."""
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    settings = config['Settings'] if config.has_section('Settings') else {}
+    worker = RecognitionWorker(os.path.join('data', 'encodings.pkl'),
+                               tolerance=float(settings.get('MatchTolerance', 0.5)),
+                               ear_thresh=float(settings.get('EyeAspectRatioThreshold', 0.25)),
+                               tolerance_mode=settings.get('ToleranceMode', 'fixed').strip().lower())
+    face_recognition.load()
+    address = worker.start(port, host)
+    print(f"Recognition worker listening on {address[0]}:{address[1]}")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"  {worker.batches} batches, {worker.crops_done} crops")
+    except KeyboardInterrupt:
+        worker.stop()
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Facial Recognition Attendance System")
+    parser.add_argument('--import-roster', metavar='CSV', help="bulk-enrol users from a roster CSV and exit")
+    parser.add_argument('--photos', metavar='DIR', help="folder of photos named <ID>.jpg/.png for --import-roster")
+    parser.add_argument('--rebuild-gallery', action='store_true', help="regenerate encodings.pkl from registered_faces/ and exit")
+    parser.add_argument('--workers', type=int, default=None, help="encoding processes (default: CPU count)")
+    parser.add_argument('--aggregation-server', type=int, metavar='PORT', help="run the central aggregation service for kiosk sync")
+    parser.add_argument('--aggregation-host', default='127.0.0.1', help="interface for --aggregation-server (default: 127.0.0.1)")
+    parser.add_argument('--aggregation-dir', default='aggregation_data', help="state directory for --aggregation-server")
+    parser.add_argument('--recognition-worker', type=int, metavar='PORT', help="run a recognition worker for kiosks in remote mode")
+    parser.add_argument('--worker-host', default='127.0.0.1', help="interface for --recognition-worker (default: 127.0.0.1)")
+    args = parser.parse_args()
+
+    if args.recognition_worker is not None:
+        run_recognition_worker_cli(args.recognition_worker, args.worker_host)
+        sys.exit(0)
+
+    if args.aggregation_server is not None:
+        try:
+            config = configparser.ConfigParser()
+            config.read('config.ini')
+            secret = config.get('Settings', 'SyncSecret', fallback='').strip()
+            AggregationService(args.aggregation_dir, secret=secret).serve(args.aggregation_server, args.aggregation_host)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.rebuild_gallery:
+        run_rebuild_gallery_cli(args.workers)
+        sys.exit(0)
+
+    if args.import_roster:
+        if not args.photos:
+            parser.error("--import-roster requires --photos")
+        run_bulk_import_cli(args.import_roster, args.photos, args.workers)
+        sys.exit(0)
+
     root = bstrap.Window()
     app = FacialRecognitionAttendanceSystem(root)
 
@@ -1449,6 +6349,16 @@ if __name__ == "__main__":
         """Gracefully handle window closing by stopping the camera scan."""
         if app.scanning:
             app.stop_scanning()
+        app.camera_discovery.stop()
+        app.api.stop()
+        if app.sync:
+            app.sync.stop()
+        app.events.stop()
+        # The WAL is only emptied if the drained storage sink stored every logged scan.
+        app.checkpoint_scan_wal()
+        app.scan_wal.close()
+        app.unknown_clusters.save()
+        app.match_telemetry.save(app.telemetry_file)
         root.destroy()
 
     root.protocol("WM_DELETE_WINDOW", on_closing)
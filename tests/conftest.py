@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The application is a single module at the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from FacialRecognitionAttendance_system import PartitionedCSVStore  # noqa: E402
+
+ATTENDANCE_COLUMNS = ['ID', 'Name', 'Date', 'TimeIn', 'TimeOut']
+
+
+def read_csv(path):
+    """Stands in for the app's safe_read_csv: None for missing or empty files."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    return pd.read_csv(path, dtype={'ID': str})
+
+
+def write_csv(df, path):
+    df.to_csv(path, index=False)
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    """Returns a factory for partitioned stores under tmp_path."""
+    def make(name='attendance', columns=ATTENDANCE_COLUMNS, granularity='month', archive=None):
+        return PartitionedCSVStore(str(tmp_path / name), name, columns, read_csv, write_csv, granularity, archive)
+    return make
@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from FacialRecognitionAttendance_system import AttendanceAnalytics, AttendanceSchema, ScheduleEngine
+
+DATE = '2026-03-02'  # A Monday.
+
+
+@pytest.fixture
+def schedules():
+    return ScheduleEngine(pd.DataFrame([{'ID': '1', 'Name': 'Ann', 'ScheduleDays': 'Mon,Wed',
+                                         'ScheduleTimeIn': '08:00 AM', 'ScheduleTimeOut': '05:00 PM'}]))
+
+
+@pytest.fixture
+def store(make_store):
+    return make_store()
+
+
+def log_scan(store, analytics, time_in, time_out=''):
+    """Does what log_attendance and the storage sink do for one scan of student 1."""
+    key = store.partition_key(DATE)
+    frame = pd.DataFrame([{'ID': '1', 'Name': 'Ann', 'Date': DATE, 'TimeIn': time_in, 'TimeOut': time_out}])
+    version = store.write_partition(key, AttendanceSchema.typed(frame))
+    analytics.record(DATE, 1, 'Ann', time_in, time_out, late=None if time_out else time_in > '08:00:00 AM', version=version)
+
+
+def test_recorded_scans_keep_partition_in_sync(tmp_path, store, schedules):
+    analytics = AttendanceAnalytics(str(tmp_path / 'rollups.csv'), store)
+    log_scan(store, analytics, '08:30:00 AM')
+    log_scan(store, analytics, '08:30:00 AM', '04:30:00 PM')
+    assert analytics.sync(schedules) == []
+    report = analytics.student_report(datetime(2026, 3, 2), datetime(2026, 3, 2), schedules)
+    assert report.loc[0, 'LateCount'] == 1
+    assert report.loc[0, 'TotalHours'] == 8.0
+
+
+def test_partition_changed_elsewhere_is_recomputed(tmp_path, store, schedules):
+    analytics = AttendanceAnalytics(str(tmp_path / 'rollups.csv'), store)
+    log_scan(store, analytics, '08:30:00 AM')
+    # Rewritten outside log_attendance (e.g. a name edit), then scanned again.
+    key = store.partition_key(DATE)
+    edited = store.read_partition(key, typed=True)
+    AttendanceSchema.set_name(edited, edited.index, 'Anne')
+    store.write_partition(key, edited)
+    log_scan(store, analytics, '08:30:00 AM', '09:30:00 AM')
+    assert analytics.sync(schedules) == [key]
+    assert analytics.sync(schedules) == []
+
+
+def test_failed_record_leaves_partition_stale(tmp_path, store, schedules):
+    analytics = AttendanceAnalytics(str(tmp_path / 'rollups.csv'), store)
+    key = store.partition_key(DATE)
+    frame = AttendanceSchema.typed(pd.DataFrame([{'ID': '1', 'Name': 'Ann', 'Date': DATE, 'TimeIn': '08:30:00 AM', 'TimeOut': ''}]))
+    store.write_partition(key, frame)  # The storage sink failed before record().
+    log_scan(store, analytics, '08:30:00 AM', '10:00:00 AM')
+    assert analytics.sync(schedules) == [key]
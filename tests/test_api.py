@@ -0,0 +1,72 @@
+import http.client
+import json
+
+import pandas as pd
+import pytest
+
+from FacialRecognitionAttendance_system import AttendanceAPI, AttendanceSchema
+
+
+@pytest.fixture
+def api(make_store):
+    attendance = make_store()
+    attendance.write_partition('2026-03', AttendanceSchema.typed(pd.DataFrame([
+        {'ID': '1', 'Name': 'Ann', 'Date': '2026-03-02', 'TimeIn': '08:00:00 AM', 'TimeOut': ''},
+        {'ID': '2', 'Name': 'Bob', 'Date': '2026-03-03', 'TimeIn': '09:00:00 AM', 'TimeOut': '05:00:00 PM'}])))
+    return AttendanceAPI(attendance, make_store('scan_log', ['ID', 'Name', 'Date', 'Time']), cache_partitions=1)
+
+
+def get(api, target, headers=None, method='GET'):
+    status, response_headers, body = api.handle_request(method, target, headers)
+    return status, response_headers, json.loads(body) if body else None
+
+
+def test_attendance_filters_by_range_and_id(api):
+    status, _, body = get(api, '/attendance?start=2026-03-03&end=2026-03-31')
+    assert status == 200 and [r['ID'] for r in body['records']] == [2]
+    assert get(api, '/attendance?id=1')[2]['records'][0]['TimeOut'] is None
+
+
+def test_bad_requests(api):
+    assert get(api, '/attendance?start=03/02/2026')[0] == 400
+    assert get(api, '/attendance?start=2026-03-05&end=2026-03-01')[0] == 400
+    assert get(api, '/nowhere')[0] == 404
+    assert get(api, '/attendance', method='POST')[0] == 405
+
+
+def test_etag_changes_only_with_the_data(api):
+    _, headers, _ = get(api, '/attendance')
+    assert get(api, '/attendance', {'If-None-Match': headers['ETag']})[0] == 304
+    frame = api.stores['attendance'].read_partition('2026-03', typed=True)
+    api.stores['attendance'].write_partition('2026-03', frame.iloc[:1])
+    status, new_headers, body = get(api, '/attendance', {'If-None-Match': headers['ETag']})
+    assert status == 200 and new_headers['ETag'] != headers['ETag'] and body['count'] == 1
+
+
+def test_partition_cache_is_bounded(api):
+    get(api, '/attendance')
+    get(api, '/attendance')
+    assert (api.cache_hits, api.cache_misses) == (1, 1)
+    api._records('attendance', '2026-04')
+    assert len(api.cache) == 1
+
+
+def test_events_since(api):
+    api.publish('scan', id=1)
+    api.publish('scan', id=2)
+    body = get(api, '/events?since=1')[2]
+    assert body['last_seq'] == 2 and [e['id'] for e in body['events']] == [2]
+
+
+def test_head_has_headers_but_no_body(api):
+    host, port = api.start(0)
+    try:
+        connection = http.client.HTTPConnection(host, port, timeout=5)
+        connection.request('HEAD', '/attendance')
+        response = connection.getresponse()
+        assert response.status == 200
+        assert response.getheader('ETag') and int(response.getheader('Content-Length')) > 0
+        assert response.read() == b''
+        connection.close()
+    finally:
+        api.stop()
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from FacialRecognitionAttendance_system import AttendanceSchema, ColumnarArchive
+
+pytest.importorskip('pyarrow')
+
+COLUMNS = ['ID', 'Name', 'Date', 'TimeIn', 'TimeOut']
+
+
+def partition():
+    return pd.DataFrame({'ID': ['3000000000', '7'], 'Name': ['Ann', 'Bob'], 'Date': ['2026-01-05', '2026-01-20'],
+                         'TimeIn': ['08:00:00 AM', '09:15:30 AM'], 'TimeOut': ['05:00:00 PM', '']})
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return ColumnarArchive(str(tmp_path), 'attendance', COLUMNS, ['TimeIn', 'TimeOut'])
+
+
+def test_round_trip_as_text_and_typed(archive):
+    assert archive.write('2026-01', partition())
+    pd.testing.assert_frame_equal(archive.read('2026-01')[COLUMNS].fillna('').astype(str), partition(), check_dtype=False)
+    typed = archive.read('2026-01', typed=True)
+    assert typed['ID'].tolist() == [3000000000, 7]
+    assert typed['TimeOut'].tolist() == [17 * 3600, AttendanceSchema.NO_TIME]
+
+
+def test_date_range_and_column_projection(archive):
+    archive.write('2026-01', partition())
+    df = archive.read('2026-01', start_date=datetime(2026, 1, 10), end_date=datetime(2026, 1, 31), columns=['ID', 'Date'])
+    assert list(df.columns) == ['ID', 'Date']
+    assert df['ID'].tolist() == ['7']
+
+
+def test_values_that_would_not_round_trip_keep_the_csv(archive):
+    df = partition()
+    df.loc[1, 'TimeIn'] = '9:15 AM'
+    assert archive.to_table(df) is None
+    df = partition()
+    df.loc[0, 'ID'] = '0012'
+    assert archive.to_table(df) is None
+
+
+def test_rollover_archives_closed_months_only(make_store, tmp_path):
+    store = make_store(archive=ColumnarArchive(str(tmp_path / 'attendance'), 'attendance', COLUMNS, ['TimeIn', 'TimeOut']))
+    store.write_partition('2026-01', partition())
+    store.write_partition('2026-02', partition().assign(Date='2026-02-02'))
+    assert store.rollover(now=pd.Timestamp('2026-02-10')) == 1
+    assert store.is_archived('2026-01') and not store.is_archived('2026-02')
+    assert store.read_partition('2026-01')['Name'].tolist() == ['Ann', 'Bob']
@@ -0,0 +1,58 @@
+import os
+import threading
+
+from FacialRecognitionAttendance_system import IncrementalBackup
+
+
+def test_unchanged_chunks_are_stored_once_and_restored(tmp_path):
+    backup = IncrementalBackup(str(tmp_path / 'backups'), chunk_size=4)
+    log = tmp_path / 'log.csv'
+    log.write_bytes(b'aaaabbbb')
+    first = backup.create_snapshot([str(log)])
+    log.write_bytes(b'aaaabbbbcc')
+    backup.create_snapshot([str(log)])
+    objects = [f for _, _, files in os.walk(tmp_path / 'backups' / 'objects') for f in files]
+    assert len(objects) == 3
+
+    log.write_bytes(b'garbage')
+    assert backup.restore(str(log))
+    assert log.read_bytes() == b'aaaabbbbcc'
+    assert backup.restore(str(log), snapshot=first)
+    assert log.read_bytes() == b'aaaabbbb'
+
+
+def test_missing_files_are_skipped(tmp_path):
+    backup = IncrementalBackup(str(tmp_path / 'backups'))
+    present = tmp_path / 'present.csv'
+    present.write_text('x')
+    name = backup.create_snapshot([str(present), str(tmp_path / 'missing.csv')])
+    assert list(backup.load_snapshot(name)['files']) == [os.path.normpath(str(present))]
+
+
+def test_snapshot_waits_for_the_writers_lock(tmp_path):
+    backup = IncrementalBackup(str(tmp_path / 'backups'))
+    partition = tmp_path / 'partition.csv'
+    partition.write_text('old')
+    lock = threading.Lock()
+    with lock:
+        thread = threading.Thread(target=backup.create_snapshot, args=([str(partition)], {os.path.normpath(str(partition)): lock}))
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+        partition.write_text('new')
+    thread.join()
+    partition.write_text('broken')
+    backup.restore(str(partition))
+    assert partition.read_text() == 'new'
+
+
+def test_prune_removes_old_snapshots_and_orphaned_chunks(tmp_path):
+    backup = IncrementalBackup(str(tmp_path / 'backups'), chunk_size=4)
+    data = tmp_path / 'data.csv'
+    for content in (b'1111', b'2222', b'3333'):
+        data.write_bytes(content)
+        os.utime(data, ns=(len(backup.list_snapshots()), len(backup.list_snapshots())))
+        backup.create_snapshot([str(data)])
+    assert backup.prune(keep_last=1, keep_days=-1) == 2
+    objects = [f for _, _, files in os.walk(tmp_path / 'backups' / 'objects') for f in files]
+    assert len(backup.list_snapshots()) == 1 and len(objects) == 1
@@ -0,0 +1,51 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from FacialRecognitionAttendance_system import BulkEnrolmentImporter, FaceGallery, atomic_write
+
+
+def row(user_id, name='Student'):
+    return {'ID': user_id, 'Name': name, 'ScheduleDays': 'Mon', 'ScheduleTimeIn': '08:00 AM', 'ScheduleTimeOut': '05:00 PM'}
+
+
+def accepted_rows(tmp_path, *ids):
+    items = []
+    for n, user_id in enumerate(ids):
+        photo = tmp_path / f"{user_id}.jpg"
+        photo.write_bytes(b'jpeg')
+        items.append((row(user_id), str(photo), np.full(FaceGallery.ENCODING_SIZE, float(n))))
+    return items
+
+
+def test_merge_refuses_ids_registered_meanwhile(tmp_path):
+    gallery = FaceGallery(np.zeros((1, FaceGallery.ENCODING_SIZE)), ['5'])
+    merged, rows, refused = BulkEnrolmentImporter.merge(accepted_rows(tmp_path, '1', '2', '5'), {'2'}, gallery)
+    assert [r['ID'] for r in rows] == ['1']
+    assert sorted(user_id for user_id, _, _ in refused) == ['2', '5']
+    assert merged.person_ids == ['5', '1']
+
+
+def test_commit_keeps_changes_made_while_encoding(tmp_path):
+    students, encodings, faces = tmp_path / 'students.csv', tmp_path / 'encodings.pkl', tmp_path / 'faces'
+    faces.mkdir()
+    importer = BulkEnrolmentImporter(str(students), str(encodings), str(faces), cache=object())
+    accepted = accepted_rows(tmp_path, '1', '2')
+
+    # Registered in the app after the import started.
+    pd.DataFrame([row('2', 'Registered'), row('3', 'Other')]).to_csv(students, index=False)
+    atomic_write(str(encodings), pickle.dumps(([np.ones(FaceGallery.ENCODING_SIZE)], ['3'], ['live'])))
+
+    failures = []
+    assert importer._commit(accepted, failures) == ['1']
+    assert failures == [('2', 'Student', 'duplicate_id')]
+    roster = pd.read_csv(students, dtype=str)
+    assert roster['ID'].tolist() == ['2', '3', '1']
+    assert roster.loc[0, 'Name'] == 'Registered'
+    with open(encodings, 'rb') as f:
+        gallery = FaceGallery(*pickle.load(f))
+    assert gallery.person_ids == ['3', '1'] and gallery.sources == ['live', 'photo']
+    assert os.path.exists(str(encodings) + '.sha256')
+    assert sorted(os.listdir(faces)) == ['1.jpg']
@@ -0,0 +1,47 @@
+import threading
+import time
+
+from FacialRecognitionAttendance_system import CameraDiscovery
+
+
+class FakeCameras(CameraDiscovery):
+    """Camera discovery over a fixed set of devices; 'hang' indices block until released."""
+    def __init__(self, cache_file, present, hang=(), **kwargs):
+        super().__init__(cache_file, max_index=4, probe_timeout=0.3, **kwargs)
+        self.present, self.hang = set(present), set(hang)
+        self.release = threading.Event()
+        self.probed = []
+
+    def probe(self, index):
+        self.probed.append(index)
+        if index in self.hang:
+            self.release.wait(5)
+        return {'index': index, 'width': 640, 'height': 480, 'fps': 30.0} if index in self.present else None
+
+
+def test_scan_finds_devices_and_caches_them(tmp_path):
+    cache = str(tmp_path / 'cameras.json')
+    assert [d['index'] for d in FakeCameras(cache, {0, 2}).scan()] == [0, 2]
+    assert FakeCameras(cache, set()).cached_indices() == [0, 2]
+
+
+def test_busy_cameras_are_not_probed_and_stay_listed(tmp_path):
+    discovery = FakeCameras(str(tmp_path / 'cameras.json'), {0, 1}, busy_indices=lambda: {1})
+    assert [d['index'] for d in discovery.scan()] == [0, 1]
+    assert 1 not in discovery.probed
+
+
+def test_hung_probe_is_missing_then_skipped_until_it_returns(tmp_path):
+    discovery = FakeCameras(str(tmp_path / 'cameras.json'), {0, 3}, hang={3})
+    assert [d['index'] for d in discovery.scan()] == [0]
+    discovery.probed.clear()
+    assert [d['index'] for d in discovery.scan()] == [0]
+    assert 3 not in discovery.probed
+
+    discovery.release.set()
+    discovery.hang.clear()
+    for _ in range(50):
+        if not discovery.in_flight:
+            break
+        time.sleep(0.01)
+    assert [d['index'] for d in discovery.scan()] == [0, 3]
@@ -0,0 +1,57 @@
+import types
+
+import cv2
+import numpy as np
+
+from FacialRecognitionAttendance_system import FacialRecognitionAttendanceSystem, crop_face
+
+App = FacialRecognitionAttendanceSystem
+
+
+class FakeCapture:
+    def __init__(self):
+        self.calls = []
+
+    def set(self, prop, value):
+        self.calls.append((prop, value))
+        return True
+
+
+def capture_settings(fmt='MJPG', width=1280, height=720, fps=30, buffer_size=1):
+    app = types.SimpleNamespace(CAPTURE_FORMAT=fmt, CAPTURE_WIDTH=width, CAPTURE_HEIGHT=height,
+                                CAPTURE_FPS=fps, CAPTURE_BUFFER_SIZE=buffer_size, PROCESSING_SCALE=0.25)
+    cap = FakeCapture()
+    App.apply_capture_settings(app, cap)
+    return app, cap.calls
+
+
+def test_pixel_format_is_set_before_resolution():
+    _, calls = capture_settings()
+    props = [prop for prop, _ in calls]
+    assert props == [cv2.CAP_PROP_FOURCC, cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT,
+                     cv2.CAP_PROP_FPS, cv2.CAP_PROP_BUFFERSIZE]
+    assert calls[0][1] == cv2.VideoWriter_fourcc(*'MJPG')
+    assert calls[1:3] == [(cv2.CAP_PROP_FRAME_WIDTH, 1280), (cv2.CAP_PROP_FRAME_HEIGHT, 720)]
+
+
+def test_unset_options_leave_the_camera_defaults():
+    _, calls = capture_settings(fmt='', width=0, height=720, fps=0, buffer_size=0)
+    assert calls == []
+
+
+def test_crop_face_clips_the_margin_at_frame_edges():
+    frame = np.arange(100 * 200).reshape(100, 200)
+    crop, (top, right, bottom, left) = crop_face(frame, (0, 40, 20, 0), margin=0.5)
+    assert crop.shape == (30, 60)
+    assert (top, right, bottom, left) == (0, 40, 20, 0)
+    assert crop[top, left] == frame[0, 0]
+
+
+def test_full_res_crops_scale_locations_back_up():
+    app, _ = capture_settings()
+    frame = np.zeros((400, 400, 3), dtype=np.uint8)
+    frame[100:200, 120:220] = 255
+    crops = App._full_res_crops(app, frame, [(25, 55, 50, 30)], margin=0.0)
+    crop, location = crops[0]
+    assert crop.shape == (100, 100, 3) and location == (0, 100, 100, 0)
+    assert crop.min() == 255
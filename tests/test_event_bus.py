@@ -0,0 +1,49 @@
+import threading
+import time
+
+from FacialRecognitionAttendance_system import EventBus
+
+
+def test_events_reach_matching_sinks_in_order():
+    bus = EventBus()
+    received, done = [], threading.Event()
+
+    def store(event):
+        received.append(event['n'])
+        if event['n'] == 49:
+            done.set()
+
+    bus.subscribe('storage', store, ('time_in',), blocking=True, lossless=True)
+    bus.start()
+    for n in range(50):
+        bus.publish('time_in', n=n)
+        bus.publish('unknown_face', n=-1)
+    assert done.wait(5)
+    bus.stop()
+    assert received == list(range(50))
+
+
+def test_slow_lossy_sink_drops_but_lossless_sink_is_drained_on_stop():
+    bus = EventBus()
+    release = threading.Event()
+    bus.subscribe('slow', lambda event: release.wait(5), queue_size=2, blocking=True)
+    stored = []
+    bus.subscribe('storage', lambda event: (time.sleep(0.001), stored.append(event['n'])), blocking=True, lossless=True)
+    bus.start()
+    for n in range(200):
+        bus.publish('time_in', n=n)
+    release.set()
+    bus.stop(timeout=1.0)
+    slow, storage = bus.subscriber('slow'), bus.subscriber('storage')
+    assert slow.dropped > 0
+    assert stored == list(range(200))
+    assert (storage.handled, storage.dropped) == (200, 0)
+
+
+def test_failures_are_counted_and_lossless_sinks_run_without_the_loop():
+    bus = EventBus()
+    bus.subscribe('broken', lambda event: 1 / 0, lossless=True)
+    bus.subscribe('ui', lambda event: None)
+    bus.publish('time_in', n=1)
+    assert bus.subscriber('broken').failed == 1
+    assert bus.subscriber('ui').handled == 0
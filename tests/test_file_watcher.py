@@ -0,0 +1,29 @@
+import os
+
+from FacialRecognitionAttendance_system import FileWatcher
+
+
+def touch(path, content, mtime_ns):
+    path.write_text(content)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_reports_external_changes_once(tmp_path):
+    path = tmp_path / 'students.csv'
+    touch(path, 'ID\n', 1_000_000_000)
+    watcher = FileWatcher(str(path), interval=2.0)
+    assert not watcher.changed(now=10)
+    touch(path, 'ID\n1\n', 2_000_000_000)
+    assert not watcher.changed(now=11)  # Within the polling interval.
+    assert watcher.changed(now=13)
+    assert not watcher.changed(now=16)
+
+
+def test_own_writes_are_not_reported(tmp_path):
+    path = tmp_path / 'students.csv'
+    watcher = FileWatcher(str(path))
+    touch(path, 'ID\n', 1_000_000_000)
+    watcher.mark_seen()
+    assert not watcher.changed(now=10)
+    path.unlink()
+    assert watcher.changed(now=20)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from FacialRecognitionAttendance_system import FaceGallery
+
+
+def encodings(n, seed=0):
+    return np.random.default_rng(seed).normal(scale=0.1, size=(n, FaceGallery.ENCODING_SIZE))
+
+
+def test_distances_match_brute_force_minimum_per_person():
+    templates = encodings(7)
+    ids = ['a', 'b', 'a', 'c', 'b', 'a', 'c']
+    gallery = FaceGallery(templates, ids)
+    faces = encodings(4, seed=1)
+    expected = np.array([[min(np.linalg.norm(face - templates[i]) for i in range(len(ids)) if ids[i] == pid)
+                          for pid in gallery.person_ids] for face in faces])
+    np.testing.assert_allclose(gallery.distances(faces), expected, atol=1e-9)
+
+
+def test_identical_face_has_zero_distance():
+    templates = encodings(3)
+    gallery = FaceGallery(templates, ['1', '2', '3'])
+    distances = gallery.distances(templates[1])
+    assert distances[0, 1] == 0.0
+    assert (distances >= 0).all()
+
+
+def test_empty_gallery_and_no_faces():
+    assert FaceGallery().distances(encodings(2)).shape == (2, 0)
+    assert FaceGallery(encodings(2), ['1', '2']).distances(np.zeros((0, 128))).shape == (0, 2)
+
+
+def test_match_applies_per_person_tolerance():
+    templates = encodings(2)
+    gallery = FaceGallery(templates, ['1', '2'])
+    face = templates[0] + 0.01
+    assert gallery.match([face], tolerance=0.2)[0][0] == '1'
+    assert gallery.match([face], tolerance=0.2, tolerances={'1': 0.05})[0][0] is None
+
+
+def test_live_templates_are_capped_and_enrolment_kept():
+    gallery = FaceGallery(encodings(2), ['1', '1'])
+    for n in range(3):
+        gallery = gallery.with_live_template('1', encodings(1, seed=10 + n)[0], max_templates=3)
+    assert gallery.sources == ['enrol', 'enrol', 'live']
+    np.testing.assert_allclose(gallery.templates_of('1')[2], encodings(1, seed=12)[0])
+
+
+def test_photo_template_keeps_multi_sample_enrolment():
+    gallery = FaceGallery(encodings(2), ['1', '1'])
+    assert gallery.with_photo_template('1', encodings(1, seed=5)[0]) is gallery
+    single = FaceGallery(encodings(1), ['2']).with_photo_template('2', encodings(1, seed=5)[0])
+    assert single.sources == ['photo'] and len(single) == 1
+
+
+def test_build_templates_returns_mean_and_medoids():
+    templates = FaceGallery.build_templates(encodings(6), n_medoids=3)
+    assert templates.shape == (4, FaceGallery.ENCODING_SIZE)
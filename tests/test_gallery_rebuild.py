@@ -0,0 +1,38 @@
+import os
+import pickle
+
+import numpy as np
+
+from FacialRecognitionAttendance_system import FaceGallery, atomic_write, rebuild_gallery_from_photos
+
+
+class PresetEncodings:
+    """An encoding cache that answers from a fixed table instead of running the encoder."""
+    def __init__(self, results):
+        self.results = results
+        self.hits = self.misses = 0
+
+    def encode_many(self, paths, workers=None, progress=None):
+        self.hits += len(paths)
+        return {path: self.results[os.path.basename(path)] for path in paths}
+
+
+def test_rebuild_replaces_photo_templates_and_keeps_the_rest(tmp_path):
+    faces, encodings_file = tmp_path / 'faces', str(tmp_path / 'encodings.pkl')
+    faces.mkdir()
+    for name in ('1.jpg', '2.jpg', '3.jpg', 'notes.jpg'):
+        (faces / name).write_bytes(b'jpeg')
+    old = FaceGallery(np.vstack([np.zeros((1, 128)), np.ones((2, 128)), np.full((2, 128), 2.0)]),
+                      ['1', '2', '2', '3', '3'], ['enrol', 'enrol', 'enrol', 'photo', 'live'])
+    atomic_write(encodings_file, pickle.dumps((list(old.encodings), old.ids, old.sources)))
+
+    cache = PresetEncodings({'1.jpg': ('ok', np.full(128, 0.5)), '2.jpg': ('ok', np.full(128, 0.5)),
+                             '3.jpg': ('no_face', None)})
+    result = rebuild_gallery_from_photos(str(faces), encodings_file, cache)
+    assert result['rebuilt'] == ['1'] and result['failures'] == [('3', 'no_face')]
+
+    with open(encodings_file, 'rb') as f:
+        gallery = FaceGallery(*pickle.load(f))
+    np.testing.assert_allclose(gallery.templates_of('1'), np.full((1, 128), 0.5))
+    assert len(gallery.templates_of('2')) == 2  # A multi-sample enrolment is kept.
+    assert sorted(s for i, s in zip(gallery.ids, gallery.sources) if i == '3') == ['live', 'photo']
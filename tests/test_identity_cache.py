@@ -0,0 +1,42 @@
+from FacialRecognitionAttendance_system import IdentityCache
+
+BOX = (0, 100, 100, 0)
+MOVED = (5, 105, 105, 5)
+ELSEWHERE = (0, 400, 100, 300)
+
+
+def test_remembered_face_is_reused_at_the_same_place():
+    cache = IdentityCache()
+    cache.remember(BOX, '1', 'Ann', expires_at=60, now=0)
+    assert cache.lookup([MOVED, ELSEWHERE], now=0.1) == [('1', 'Ann'), None]
+
+
+def test_entry_without_a_face_at_its_place_is_dropped():
+    cache = IdentityCache()
+    cache.remember(BOX, '1', 'Ann', expires_at=60, now=0)
+    assert cache.lookup([ELSEWHERE], now=0.1) == [None]
+    assert cache.lookup([BOX], now=0.2) == [None]
+
+
+def test_entries_are_reverified_after_hits_or_age():
+    cache = IdentityCache(verify_hits=2, verify_age=1.0)
+    cache.remember(BOX, '1', 'Ann', expires_at=60, now=0)
+    assert cache.lookup([BOX], now=0.1) == [('1', 'Ann')]
+    assert cache.lookup([BOX], now=0.2) == [('1', 'Ann')]
+    assert cache.lookup([BOX], now=0.3) == [None]
+    assert cache.verifications == 1
+
+    cache.remember(BOX, '1', 'Ann', expires_at=60, now=1.0)
+    assert cache.lookup([BOX], now=2.1) == [None]
+
+
+def test_expiry_forget_and_disabled_cache():
+    cache = IdentityCache()
+    cache.remember(BOX, '1', 'Ann', expires_at=1.0, now=0)
+    assert cache.lookup([BOX], now=1.0) == [None]
+    cache.remember(BOX, '2', 'Bob', expires_at=60, now=2.0)
+    cache.forget(2)
+    assert cache.lookup([BOX], now=2.1) == [None]
+    disabled = IdentityCache(idle_ttl=0)
+    disabled.remember(BOX, '1', 'Ann', expires_at=60, now=0)
+    assert disabled.lookup([BOX], now=0.1) == [None]
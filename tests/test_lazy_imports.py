@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+import FacialRecognitionAttendance_system
+from FacialRecognitionAttendance_system import LazyModule
+
+
+def test_module_is_imported_on_first_attribute_access():
+    lazy = LazyModule('json')
+    assert lazy._module is None
+    assert lazy.dumps([1]) == '[1]'
+    assert lazy._module is sys.modules['json']
+
+
+def test_is_available_does_not_import():
+    lazy = LazyModule('xml.dom.minidom')
+    assert lazy.is_available() and lazy._module is None
+    assert not LazyModule('no_such_module_here').is_available()
+
+
+def test_importing_the_app_does_not_load_heavy_modules():
+    code = ("import sys, FacialRecognitionAttendance_system; "
+            "print(sorted(m for m in ('pandas', 'cv2', 'face_recognition', 'pyarrow') if m in sys.modules))")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(FacialRecognitionAttendance_system.__file__)).stdout.strip()
+    assert output == '[]'
@@ -0,0 +1,46 @@
+from FacialRecognitionAttendance_system import LivenessTracker
+
+BOX = (0, 100, 100, 0)
+
+
+def observe(tracker, samples, identity='1', box=BOX):
+    """Feeds (time, eyes_closed) samples of one face and returns the update results."""
+    results = []
+    for now, closed in samples:
+        track_id = tracker.assign([box], now)[0]
+        results.append(tracker.update(track_id, identity, closed, now))
+    return results
+
+
+def test_single_closed_frame_is_not_a_blink():
+    assert observe(LivenessTracker(), [(0, False), (0.18, True), (0.36, False)]) == [False, False, False]
+
+
+def test_two_closed_samples_and_reopen_is_a_blink():
+    tracker = LivenessTracker()
+    assert observe(tracker, [(0, False), (0.18, True), (0.36, True), (0.54, False)])[-1] is True
+    assert tracker.verified_count == 1
+
+
+def test_eyes_closed_too_long_is_not_a_blink():
+    assert not any(observe(LivenessTracker(), [(0, False), (0.2, True), (0.8, True), (1.4, False)]))
+
+
+def test_blink_resets_when_identity_changes():
+    tracker = LivenessTracker()
+    observe(tracker, [(0, True), (0.2, True)], identity='1')
+    assert observe(tracker, [(0.4, False)], identity='2') == [False]
+
+
+def test_faces_far_apart_get_separate_tracks():
+    tracker = LivenessTracker()
+    near, far = tracker.assign([BOX, (0, 400, 100, 300)], 0)
+    assert near != far
+    assert tracker.assign([(5, 105, 105, 5)], 0.1) == [near]
+
+
+def test_expire_reports_unverified_identities():
+    tracker = LivenessTracker(track_ttl=1.0)
+    observe(tracker, [(0, False)], identity='7')
+    assert tracker.expire(now=5.0) == ['7']
+    assert tracker.expired_unverified == 1
@@ -0,0 +1,57 @@
+import numpy as np
+
+from FacialRecognitionAttendance_system import Liveness
+
+
+def landmarks(eye_height=2.0, chin=(50.0, 100.0)):
+    """Builds a face_recognition landmark dict with 6-point eyes of the given opening."""
+    def eye(x0):
+        return [(x0, 40.0), (x0 + 3, 40.0 - eye_height), (x0 + 7, 40.0 - eye_height),
+                (x0 + 10, 40.0), (x0 + 7, 40.0 + eye_height), (x0 + 3, 40.0 + eye_height)]
+    chin_points = [(float(i), 90.0) for i in range(17)]
+    chin_points[8] = chin
+    return {
+        'chin': chin_points,
+        'left_eyebrow': [(0.0, 30.0)] * 5,
+        'right_eyebrow': [(0.0, 30.0)] * 5,
+        'nose_bridge': [(50.0, 40.0)] + [(50.0, 50.0)] * 3,
+        'nose_tip': [(50.0, 60.0)] * 5,
+        'left_eye': eye(20.0),
+        'right_eye': eye(60.0),
+        'top_lip': [(50.0, 80.0)] * 12,
+        'bottom_lip': [(50.0, 85.0)] * 12,
+    }
+
+
+def reference_ear(points):
+    """The textbook per-eye EAR formula from Soukupova and Cech."""
+    p = np.asarray(points)
+    return (np.linalg.norm(p[1] - p[5]) + np.linalg.norm(p[2] - p[4])) / (2.0 * np.linalg.norm(p[0] - p[3]))
+
+
+def test_to_tensor_places_features_in_ibug_order():
+    face = landmarks()
+    tensor = Liveness.to_tensor([face])
+    assert tensor.shape == (1, 68, 2)
+    np.testing.assert_array_equal(tensor[0, 36:42], face['left_eye'])
+    np.testing.assert_array_equal(tensor[0, 42:48], face['right_eye'])
+    np.testing.assert_array_equal(tensor[0, 27], face['nose_bridge'][0])
+
+
+def test_vectorized_ear_matches_per_face_formula():
+    faces = [landmarks(eye_height=h) for h in (0.5, 2.0, 4.0)]
+    expected = [(reference_ear(f['left_eye']) + reference_ear(f['right_eye'])) / 2 for f in faces]
+    np.testing.assert_allclose(Liveness.eye_aspect_ratios(Liveness.to_tensor(faces)), expected, rtol=1e-6)
+
+
+def test_analyze_flags_closed_eyes_and_tilt():
+    result = Liveness.analyze([landmarks(eye_height=0.5), landmarks(eye_height=4.0, chin=(110.0, 100.0))], 0.2)
+    assert result['eyes_closed'].tolist() == [True, False]
+    np.testing.assert_allclose(result['tilt'], [0.0, 45.0], atol=1e-4)
+
+
+def test_no_faces_and_degenerate_eyes():
+    assert Liveness.analyze([], 0.2)['ear'].shape == (0,)
+    flat = landmarks()
+    flat['left_eye'] = flat['right_eye'] = [(10.0, 10.0)] * 6
+    assert Liveness.eye_aspect_ratios(Liveness.to_tensor([flat]))[0] == 0.0
@@ -0,0 +1,66 @@
+import os
+
+import pandas as pd
+
+from FacialRecognitionAttendance_system import AttendanceSchema
+
+
+def scan(user_id, date, time='08:00:00 AM'):
+    return {'ID': str(user_id), 'Name': f"User {user_id}", 'Date': date, 'Time': time}
+
+
+def test_rows_go_to_the_partition_of_their_date(make_store):
+    store = make_store('scan_log', ['ID', 'Name', 'Date', 'Time'])
+    store.append_row(scan(1, '2026-01-31'))
+    store.append_row(scan(2, '2026-02-01'))
+    store.append_row(scan(3, '2026-02-15'))
+    assert store.keys() == ['2026-01', '2026-02']
+    assert store.read_partition('2026-02')['ID'].tolist() == ['2', '3']
+    assert store.key_versions() == {'2026-01': 1, '2026-02': 2}
+
+
+def test_range_reads_only_overlapping_partitions(make_store):
+    store = make_store('scan_log', ['ID', 'Name', 'Date', 'Time'], granularity='day')
+    for day in ('2026-02-01', '2026-02-02', '2026-02-03'):
+        store.append_row(scan(1, day))
+    assert store.keys_in_range('2026-02-02', '2026-02-03') == ['2026-02-02', '2026-02-03']
+    assert store.read_range('2026-02-02', '2026-02-02')['Date'].tolist() == ['2026-02-02']
+    assert store.read_range('2025-01-01', '2025-01-31') is None
+
+
+def test_write_partition_keeps_rows_that_could_not_be_typed(make_store):
+    store = make_store()
+    pd.DataFrame([{'ID': '1', 'Name': 'A', 'Date': '2026-02-01', 'TimeIn': '8:05 AM', 'TimeOut': ''},
+                  {'ID': 'x', 'Name': 'B', 'Date': '2026-02-01', 'TimeIn': 'late', 'TimeOut': ''}]).to_csv(
+        store.partition_path('2026-02'), index=False)
+    store._touch('2026-02', 2)
+    typed = store.read_partition('2026-02', typed=True)
+    assert typed['ID'].tolist() == [1]
+    assert typed['TimeIn'].tolist() == [8 * 3600 + 5 * 60]
+    store.write_partition('2026-02', typed)
+    assert store.read_partition('2026-02')['ID'].tolist() == ['1', 'x']
+
+
+def test_migration_splits_a_legacy_log_once(make_store, tmp_path):
+    legacy = tmp_path / 'attendance.csv'
+    pd.DataFrame([{'ID': '1', 'Name': 'A', 'Date': '2026-01-05', 'TimeIn': '08:00:00 AM', 'TimeOut': ''},
+                  {'ID': '2', 'Name': 'B', 'Date': '2026-02-05', 'TimeIn': '08:00:00 AM', 'TimeOut': ''},
+                  {'ID': '3', 'Name': 'C', 'Date': 'garbage', 'TimeIn': '', 'TimeOut': ''}]).to_csv(legacy, index=False)
+    store = make_store()
+    store.migrate_from(str(legacy))
+    assert store.keys() == ['2026-01', '2026-02']
+    assert not legacy.exists() and (tmp_path / 'attendance.csv.migrated').exists()
+    store.migrate_from(str(legacy))
+    assert store.key_versions() == {'2026-01': 1, '2026-02': 1}
+
+
+def test_manifest_is_rebuilt_from_partition_files(make_store):
+    store = make_store()
+    store.write_partition('2026-03', AttendanceSchema.typed(pd.DataFrame(
+        [{'ID': '1', 'Name': 'A', 'Date': '2026-03-02', 'TimeIn': '08:00:00 AM', 'TimeOut': ''}])))
+    with open(store.manifest_file, 'w') as f:
+        f.write('{broken')
+    reopened = make_store()
+    assert reopened.keys() == ['2026-03']
+    assert reopened.read_partition('2026-03')['ID'].tolist() == ['1']
+    assert os.path.basename(store.files()[0]) == 'attendance_manifest.json'
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import FacialRecognitionAttendance_system as attendance
+from FacialRecognitionAttendance_system import PreviewRenderer
+
+
+class FakeLabel:
+    """Just enough of a Tk label for the renderer: a size and an image slot."""
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.image = None
+
+    def cget(self, option):
+        return 0
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def config(self, image=None, **kwargs):
+        self.image = image
+
+
+class FakePhotoImage:
+    created = 0
+
+    def __init__(self, image):
+        FakePhotoImage.created += 1
+        self.size = image.size
+        self.pastes = 0
+
+    def paste(self, image):
+        assert image.size == self.size
+        self.pastes += 1
+
+
+@pytest.fixture(autouse=True)
+def photo_image(monkeypatch):
+    # ImageTk.PhotoImage needs a Tk interpreter, which headless test runs do not have.
+    FakePhotoImage.created = 0
+    monkeypatch.setattr(attendance.ImageTk, 'PhotoImage', FakePhotoImage)
+
+
+def frame(width=1280, height=720):
+    return np.zeros((height, width, 3), dtype=np.uint8)
+
+
+def test_frames_are_downscaled_to_the_label_before_overlays():
+    renderer = PreviewRenderer(FakeLabel(640, 480))
+    seen = []
+    assert renderer.render(frame(), 1, lambda display, scale: seen.append((display.shape, scale)))
+    assert seen == [((360, 640, 3), 0.5)]
+    assert renderer.label.image.size == (640, 360)
+
+
+def test_small_frames_are_never_upscaled():
+    renderer = PreviewRenderer(FakeLabel(1920, 1080))
+    assert renderer._target_size(640, 480) == (640, 480, 1.0)
+
+
+def test_unsized_label_falls_back_to_the_default_width():
+    renderer = PreviewRenderer(FakeLabel(1, 1), default_width=320)
+    assert renderer._target_size(1280, 720) == (320, 180, 0.25)
+
+
+def test_unchanged_key_skips_and_same_size_reuses_the_photo():
+    renderer = PreviewRenderer(FakeLabel(640, 480))
+    assert renderer.render(frame(), 1)
+    assert not renderer.render(frame(), 1)
+    assert not renderer.render(None, 2)
+    assert renderer.render(frame(), 3)
+    assert (renderer.frames_drawn, renderer.frames_skipped) == (2, 2)
+    assert FakePhotoImage.created == 1 and renderer.photo.pastes == 1
+    renderer.reset()
+    assert renderer.render(frame(), 3)
+    assert FakePhotoImage.created == 2
@@ -0,0 +1,91 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from FacialRecognitionAttendance_system import MotionGate, RecognitionWorker, RemoteRecognizer, recv_frame, send_frame
+
+
+class EchoWorker(RecognitionWorker):
+    """Skips encoding: every crop is 'recognized' as the top coordinate of its location."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_sizes = []
+
+    def recognize(self, crops):
+        self.batch_sizes.append(len(crops))
+        return [{'id': None if rgb is None else str(location[0]), 'distance': 0.1, 'second': None,
+                 'eyes_closed': False} for rgb, location in crops]
+
+
+def test_frames_round_trip_and_end_cleanly():
+    a, b = socket.socketpair()
+    with a, b:
+        send_frame(a, b'hello')
+        send_frame(a, b'')
+        a.shutdown(socket.SHUT_WR)
+        assert recv_frame(b) == b'hello'
+        assert recv_frame(b) == b''
+        assert recv_frame(b) is None
+
+
+def test_oversized_and_truncated_frames_are_errors():
+    a, b = socket.socketpair()
+    with a, b:
+        send_frame(a, b'x' * 100)
+        with pytest.raises(ValueError):
+            recv_frame(b, max_size=10)
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(b'\x00\x00\x00\x10abc')
+        a.shutdown(socket.SHUT_WR)
+        with pytest.raises(ConnectionError):
+            recv_frame(b)
+
+
+def test_kiosks_get_their_own_results_from_shared_batches(tmp_path):
+    worker = EchoWorker(str(tmp_path / 'encodings.pkl'), max_wait=0.2)
+    host, port = worker.start(0)
+    try:
+        crop = np.zeros((40, 40, 3), dtype=np.uint8)
+        results = {}
+
+        def kiosk(name, tops):
+            client = RemoteRecognizer(f"{host}:{port}")
+            results[name] = [r['id'] for r in client.recognize([(crop, (top, 30, 30, 0)) for top in tops])]
+            client.close()
+
+        threads = [threading.Thread(target=kiosk, args=('a', [1, 2])), threading.Thread(target=kiosk, args=('b', [3]))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        assert results == {'a': ['1', '2'], 'b': ['3']}
+        assert sum(worker.batch_sizes) == 3 and worker.batches == len(worker.batch_sizes)
+    finally:
+        worker.stop()
+
+
+def test_unreachable_worker_raises_oserror():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    client = RemoteRecognizer(f"127.0.0.1:{port}", timeout=1.0)
+    with pytest.raises(OSError):
+        client.recognize([(np.zeros((8, 8, 3), dtype=np.uint8), (0, 8, 8, 0))])
+    assert client.sock is None and client.last_error
+
+
+def test_motion_gate_skips_static_frames_until_idle():
+    gate = MotionGate(threshold=4.0, max_idle=2.0)
+    still = np.zeros((120, 160, 3), dtype=np.uint8)
+    moved = still.copy()
+    moved[:, :80] = 200
+    assert gate.should_process(still, False, 0.0)
+    assert not gate.should_process(still, False, 0.5)
+    assert gate.should_process(still, True, 0.6)
+    assert gate.should_process(moved, False, 0.7)
+    assert not gate.should_process(moved, False, 1.0)
+    assert gate.should_process(moved, False, 3.0)
+    assert (gate.passed, gate.skipped) == (4, 2)
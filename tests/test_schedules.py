@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from FacialRecognitionAttendance_system import ScheduleEngine
+
+
+@pytest.fixture
+def schedules():
+    return ScheduleEngine(pd.DataFrame([
+        {'ID': '1', 'Name': 'Ann', 'ScheduleDays': 'Mon,Wed,Fri', 'ScheduleTimeIn': '08:00 AM', 'ScheduleTimeOut': '12:00 PM'},
+        {'ID': '2', 'Name': 'Bob', 'ScheduleDays': 'Mon', 'ScheduleTimeIn': '', 'ScheduleTimeOut': ''},
+        {'ID': '3', 'Name': 'Cid', 'ScheduleDays': 'Tue', 'ScheduleTimeIn': '1:30 pm', 'ScheduleTimeOut': '03:00 PM'},
+        {'ID': 'x', 'Name': 'Bad', 'ScheduleDays': 'Mon', 'ScheduleTimeIn': '', 'ScheduleTimeOut': ''}]))
+
+
+MONDAY_9 = datetime(2026, 3, 2, 9, 0)
+
+
+def test_parsing(schedules):
+    assert len(schedules) == 3
+    assert ScheduleEngine.parse_days('Mon, fri, Someday') == 0b10001
+    assert ScheduleEngine.parse_days(float('nan')) == 0
+    assert ScheduleEngine.parse_minutes('1:30 pm') == 13 * 60 + 30
+    assert ScheduleEngine.parse_minutes('25:00') == ScheduleEngine.NO_TIME
+    assert schedules.name_of('3') == 'Cid' and schedules.name_of('x') is None
+
+
+def test_single_student_questions(schedules):
+    assert schedules.is_scheduled(1, MONDAY_9) and not schedules.is_scheduled(3, MONDAY_9)
+    assert schedules.is_late(1, MONDAY_9)
+    assert not schedules.is_late(1, datetime(2026, 3, 2, 8, 0))
+    assert not schedules.is_late(2, MONDAY_9)
+    assert schedules.is_expected_now(1, MONDAY_9) and not schedules.is_expected_now(1, datetime(2026, 3, 2, 12, 0))
+    assert schedules.is_absent(1, MONDAY_9, set()) and not schedules.is_absent(1, MONDAY_9, {1})
+
+
+def test_roster_masks(schedules):
+    assert schedules.scheduled_mask(MONDAY_9).tolist() == [True, True, False]
+    assert schedules.due_mask(datetime(2026, 3, 2, 7, 0)).tolist() == [False, True, False]
+    assert schedules.late_mask(MONDAY_9, np.array([8 * 60 + 5, 9 * 60, -1])).tolist() == [True, False, False]
+    absent = schedules.absentees(MONDAY_9, {2})
+    assert absent['ID'].tolist() == [1] and absent['ScheduleTimeIn'].tolist() == ['08:00 AM']
+
+
+def test_empty_roster():
+    empty = ScheduleEngine(None)
+    assert len(empty) == 0 and empty.absentees(MONDAY_9, set()).empty
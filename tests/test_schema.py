@@ -0,0 +1,40 @@
+import pandas as pd
+
+from FacialRecognitionAttendance_system import AttendanceSchema
+
+
+def frame(*rows):
+    return pd.DataFrame([dict(zip(['ID', 'Name', 'Date', 'TimeIn', 'TimeOut'], row)) for row in rows])
+
+
+def test_typed_columns_and_text_round_trip():
+    df = frame(('1', 'Ann', '2026-03-02', '08:00:00 AM', ''), ('3000000000', 'Bob', '2026-03-02', '01:30:15 PM', '05:00:00 PM'))
+    typed = AttendanceSchema.typed(df)
+    assert typed['ID'].dtype == 'int64' and typed['ID'].tolist() == [1, 3000000000]
+    assert isinstance(typed['Name'].dtype, pd.CategoricalDtype)
+    assert typed['TimeIn'].tolist() == [8 * 3600, 13 * 3600 + 30 * 60 + 15]
+    assert typed['TimeOut'].tolist()[0] == AttendanceSchema.NO_TIME
+    pd.testing.assert_frame_equal(AttendanceSchema.to_text(typed).astype(str), df)
+
+
+def test_lenient_times_are_read_and_written_back_canonically():
+    typed = AttendanceSchema.typed(frame(('1', 'Ann', '2026-03-02', '8:05 AM', '17:30')))
+    assert typed.loc[0, 'TimeIn'] == 8 * 3600 + 5 * 60
+    assert AttendanceSchema.to_text(typed).loc[0, 'TimeOut'] == '05:30:00 PM'
+
+
+def test_rows_that_cannot_be_typed_are_split_off_unchanged():
+    df = frame(('1', 'Ann', '2026-03-02', '08:00:00 AM', ''), ('12345678901234567890', 'Big', '2026-03-02', '', ''),
+               ('2', 'Bad date', '02/03/2026', '', ''), ('3', 'Bad time', '2026-03-02', 'noon', ''))
+    typed, raw = AttendanceSchema.split(df)
+    assert typed['ID'].tolist() == [1]
+    assert raw['Name'].tolist() == ['Big', 'Bad date', 'Bad time']
+    text = AttendanceSchema.to_text(typed, raw)
+    assert text['ID'].tolist() == ['1', '12345678901234567890', '2', '3']
+    assert text.loc[3, 'TimeIn'] == 'noon'
+
+
+def test_format_time():
+    assert AttendanceSchema.format_time(0) == '12:00:00 AM'
+    assert AttendanceSchema.format_time(AttendanceSchema.NO_TIME) == ''
+    assert AttendanceSchema.format_times(pd.Series([3600, -1])).tolist() == ['01:00:00 AM', '']
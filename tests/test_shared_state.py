@@ -0,0 +1,50 @@
+import threading
+import types
+
+import numpy as np
+import pytest
+
+from FacialRecognitionAttendance_system import FaceGallery, FacialRecognitionAttendanceSystem, RecognitionResult
+
+App = FacialRecognitionAttendanceSystem
+
+
+def make_app():
+    app = types.SimpleNamespace(gallery=FaceGallery(), gallery_version=0, gallery_lock=threading.Lock())
+    app.update_gallery = types.MethodType(App.update_gallery, app)
+    return app
+
+
+def test_concurrent_gallery_changes_are_not_lost():
+    app = make_app()
+    template = np.zeros((1, FaceGallery.ENCODING_SIZE))
+
+    def enrol(start):
+        for n in range(start, start + 25):
+            app.update_gallery(lambda gallery, n=n: gallery.with_person(str(n), template))
+
+    threads = [threading.Thread(target=enrol, args=(k * 25,)) for k in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(app.gallery.person_ids, key=int) == [str(n) for n in range(100)]
+    assert app.gallery_version == 100
+
+
+def test_readers_keep_their_snapshot_and_no_op_changes_keep_the_version():
+    app = make_app()
+    snapshot = app.gallery
+    updated = app.update_gallery(lambda gallery: gallery.with_person('1', np.ones((1, FaceGallery.ENCODING_SIZE))))
+    assert len(snapshot) == 0 and len(updated) == 1 and app.gallery is updated
+    assert app.update_gallery(lambda gallery: gallery) is updated
+    assert app.gallery_version == 1
+
+
+def test_recognition_results_are_immutable():
+    result = RecognitionResult(1, 0.5, (((0, 10, 10, 0), 'Ann', '1'),))
+    with pytest.raises(AttributeError):
+        result.faces = ()
+    with pytest.raises(AttributeError):
+        result.extra = 1
+    assert RecognitionResult.EMPTY.faces == ()
@@ -0,0 +1,56 @@
+import gzip
+import json
+
+from FacialRecognitionAttendance_system import AggregationService, LocalSyncTransport, SyncClient
+
+
+def batch(*events):
+    return gzip.compress(json.dumps(list(events)).encode('utf-8'))
+
+
+def scan(event_id, time, user_id=1, date='2026-03-02'):
+    return {'event_id': event_id, 'kiosk': 'k1', 'type': 'scan', 'id': user_id, 'name': 'Ann', 'date': date, 'time': time}
+
+
+def test_scans_merge_order_independently_and_dedupe(tmp_path):
+    service = AggregationService(str(tmp_path))
+    assert service.ingest(batch(scan('a', '04:00:00 PM'), scan('b', '08:00:00 AM')))['accepted'] == 2
+    result = service.ingest(batch(scan('a', '04:00:00 PM'), scan('c', '09:00:00 AM')))
+    assert (result['accepted'], result['duplicates'], result['rejected']) == (1, 1, [])
+    [row] = service.attendance_rows()
+    assert (row['TimeIn'], row['TimeOut']) == ('08:00:00 AM', '04:00:00 PM')
+
+
+def test_malformed_events_are_acked_but_reported_as_rejected(tmp_path):
+    service = AggregationService(str(tmp_path))
+    bad_date, no_time = scan('x', '08:00:00 AM', date='02/03/2026'), scan('y', None)
+    del no_time['time']
+    result = service.ingest(batch(bad_date, no_time, {'event_id': 'z', 'type': 'bogus'}, scan('ok', '08:00:00 AM')))
+    assert result['acked'] == ['x', 'y', 'z', 'ok']
+    assert result['accepted'] == 1
+    assert result['rejected'] == ['x', 'y', 'z']
+
+
+def test_days_survive_a_restart(tmp_path):
+    AggregationService(str(tmp_path)).ingest(batch(scan('a', '08:00:00 AM')))
+    service = AggregationService(str(tmp_path))
+    assert service.ingest(batch(scan('a', '08:00:00 AM')))['duplicates'] == 1
+    assert len(service.attendance_rows()) == 1
+
+
+def test_client_counts_rejected_events_and_clears_queue(tmp_path):
+    service = AggregationService(str(tmp_path / 'server'))
+    client = SyncClient('k1', str(tmp_path / 'queue.jsonl'), str(tmp_path / 'state.json'), LocalSyncTransport(service))
+    client.enqueue('scan', id=1, name='Ann', date='2026-03-02', time='08:00:00 AM')
+    client.enqueue('scan', id=1, name='Ann', date='not a date', time='08:00:00 AM')
+    assert client.push() == 2
+    assert client.rejected == 1
+    assert client.pending() == []
+
+
+def test_gallery_delta_since_version(tmp_path):
+    service = AggregationService(str(tmp_path))
+    service.ingest(batch({'event_id': 'g1', 'type': 'gallery', 'person_id': 1, 'templates': [[0.0]]},
+                         {'event_id': 'g2', 'type': 'gallery', 'person_id': 2, 'templates': [[1.0]]}))
+    delta = service.gallery_delta(1)
+    assert delta['version'] == 2 and list(delta['changes']) == ['2']
@@ -0,0 +1,66 @@
+import json
+import os
+
+import numpy as np
+
+from FacialRecognitionAttendance_system import MatchTelemetry, load_match_tolerances
+
+
+def visit(telemetry, track, person, distances, rival=9, rival_distance=0.8, tolerance=0.5):
+    """Records one face track with the given per-frame distances to 'person'."""
+    ranked = [(str(person), d, str(rival), rival_distance) for d in distances]
+    matches = [(str(person) if d <= tolerance else None, d, rival_distance) for d in distances]
+    telemetry.record(ranked, matches, [track] * len(distances))
+
+
+def test_visit_distance_includes_near_misses():
+    telemetry = MatchTelemetry(capacity=100)
+    visit(telemetry, 0, 1, [0.45, 0.55, 0.58])
+    telemetry.confirm(0, 1)
+    person, distance, rival, rival_distance = telemetry._visits()
+    assert person.tolist() == [1] and rival.tolist() == [9]
+    assert distance[0] == np.float32(0.55)
+
+
+def test_unconfirmed_and_mostly_other_tracks_are_ignored():
+    telemetry = MatchTelemetry(capacity=100)
+    visit(telemetry, 0, 1, [0.4, 0.4])
+    visit(telemetry, 1, 2, [0.4, 0.4, 0.4])
+    visit(telemetry, 1, 3, [0.4])
+    telemetry.confirm(1, 3)
+    assert len(telemetry._visits()[0]) == 0
+
+
+def test_calibrate_counts_visits_not_frames():
+    telemetry = MatchTelemetry(capacity=1000)
+    for track in range(40):
+        visit(telemetry, track, 1, [0.40 + 0.001 * track] * 5)
+        telemetry.confirm(track, 1)
+    calibration = telemetry.calibrate(0.6, min_samples=30)
+    assert calibration['samples'] == 40
+    assert 0.35 <= calibration['global'] <= 0.65
+    assert '1' in calibration['users']
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'telemetry.npz')
+    telemetry = MatchTelemetry(capacity=10)
+    visit(telemetry, 0, 1, [0.4, 0.5])
+    telemetry.confirm(0, 1)
+    telemetry.save(path)
+    assert os.listdir(tmp_path) == ['telemetry.npz']
+
+    restored = MatchTelemetry(capacity=10)
+    restored.load(path)
+    assert restored.size == 2
+    assert restored.confirmed == {0: 1}
+    assert restored.track_base == 1
+
+
+def test_load_match_tolerances_modes(tmp_path):
+    path = tmp_path / 'tolerances.json'
+    path.write_text(json.dumps({'global': 0.5, 'users': {'1': 0.45}}))
+    assert load_match_tolerances(str(path), 'fixed', 0.6) == (0.6, {})
+    assert load_match_tolerances(str(path), 'global', 0.6) == (0.5, {})
+    assert load_match_tolerances(str(path), 'per_user', 0.6) == (0.5, {'1': 0.45})
+    assert load_match_tolerances(str(tmp_path / 'missing.json'), 'per_user', 0.6) == (0.6, {})
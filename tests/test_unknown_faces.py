@@ -0,0 +1,51 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from FacialRecognitionAttendance_system import UnknownFaceClusters
+
+
+def face(value):
+    return np.full(128, value)
+
+
+def test_near_faces_share_a_cluster_and_visits_are_split_by_gap(tmp_path):
+    clusters = UnknownFaceClusters(str(tmp_path / 'clusters.pkl'), str(tmp_path / 'crops'), threshold=0.5, visit_gap=60)
+    start = datetime(2026, 3, 2, 8, 0)
+    first = clusters.add(face(0.0), now=start)
+    assert clusters.add(face(0.01), now=start + timedelta(seconds=10)) == first
+    clusters.add(face(0.0), now=start + timedelta(minutes=5))
+    other = clusters.add(face(1.0), now=start)
+    assert other != first
+    summary = {c['id']: c for c in clusters.summaries()}
+    assert (summary[first]['count'], summary[first]['visits']) == (3, 2)
+
+
+def test_oldest_cluster_is_evicted(tmp_path):
+    clusters = UnknownFaceClusters(str(tmp_path / 'clusters.pkl'), str(tmp_path / 'crops'), max_clusters=2)
+    ids = [clusters.add(face(float(n))) for n in range(3)]
+    assert [c['id'] for c in clusters.summaries()] == [ids[2], ids[1]]
+    assert clusters.evictions == 1
+
+
+def test_concurrent_saves_leave_a_loadable_file(tmp_path):
+    state_file = str(tmp_path / 'clusters.pkl')
+    clusters = UnknownFaceClusters(state_file, str(tmp_path / 'crops'))
+
+    def work(offset):
+        for n in range(20):
+            clusters.add(face(offset + n))
+            clusters.save()
+
+    threads = [threading.Thread(target=work, args=(offset,)) for offset in (0.0, 100.0)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    clusters.save()
+    assert not os.path.exists(state_file + '.tmp')
+    reloaded = UnknownFaceClusters(state_file, str(tmp_path / 'crops'))
+    assert len(reloaded.clusters) == len(clusters.clusters) == 40
+    assert reloaded.next_id == clusters.next_id
@@ -0,0 +1,100 @@
+import json
+import types
+
+import pandas as pd
+import pytest
+
+from FacialRecognitionAttendance_system import (AttendanceSchema, EventBus, FacialRecognitionAttendanceSystem,
+                                                ScanEventWAL, atomic_write, verify_checksum)
+
+App = FacialRecognitionAttendanceSystem
+
+
+@pytest.fixture
+def app(tmp_path, make_store):
+    """The parts of the app that replay and checkpoint use, without the GUI."""
+    bus = EventBus()
+    bus.subscribe('storage', lambda event: None, lossless=True)
+    app = types.SimpleNamespace(scan_wal=ScanEventWAL(str(tmp_path / 'scan_events.wal')), events=bus, sync=None,
+                                attendance_store=make_store(), scan_log_store=make_store('scan_log', ['ID', 'Name', 'Date', 'Time']),
+                                partition_write_failures=0)
+    app.checkpoint_scan_wal = types.MethodType(App.checkpoint_scan_wal, app)
+    return app
+
+
+def scan(kind, time, user_id=1, date='2026-03-02'):
+    return {'type': kind, 'id': user_id, 'name': 'Ann', 'date': date, 'time': time}
+
+
+def test_wal_skips_a_torn_last_line(tmp_path):
+    wal = ScanEventWAL(str(tmp_path / 'x.wal'))
+    wal.start()
+    wal.append(scan('time_in', '08:00:00 AM'))
+    wal.close()
+    with open(tmp_path / 'x.wal', 'a') as f:
+        f.write('{"type": "time_')
+    assert wal.read() == [scan('time_in', '08:00:00 AM')]
+
+
+def test_replay_restores_missing_scans_idempotently(app):
+    app.scan_wal.start()
+    for record in (scan('time_in', '08:00:00 AM'), scan('time_out', '04:00:00 PM'), scan('time_in', '09:00:00 AM', user_id=2)):
+        app.scan_wal.append(record)
+    # Only the first scan reached the partitions before the crash.
+    key = app.attendance_store.partition_key('2026-03-02')
+    app.attendance_store.write_partition(key, AttendanceSchema.typed(pd.DataFrame(
+        [{'ID': '1', 'Name': 'Ann', 'Date': '2026-03-02', 'TimeIn': '08:00:00 AM', 'TimeOut': ''}])))
+    app.scan_log_store.append_row({'ID': 1, 'Name': 'Ann', 'Date': '2026-03-02', 'Time': '08:00:00 AM'})
+    app.scan_wal.close()
+
+    # Restart: a new log object over the same file.
+    app.scan_wal = ScanEventWAL(app.scan_wal.path)
+    records = app.scan_wal.read()
+    App.replay_scan_wal(app)
+    attendance = app.attendance_store.read_partition(key)
+    assert attendance['ID'].tolist() == ['1', '2']
+    assert attendance['TimeOut'].fillna('').tolist() == ['04:00:00 PM', '']
+    assert len(app.scan_log_store.read_partition(key)) == 3
+    assert app.scan_wal.read() == []
+
+    # Replaying the same events again changes nothing.
+    with open(app.scan_wal.path, 'w') as f:
+        f.writelines(json.dumps(record) + '\n' for record in records)
+    App.replay_scan_wal(app)
+    assert len(app.scan_log_store.read_partition(key)) == 3
+
+
+def test_checkpoint_keeps_the_wal_until_every_scan_is_stored(app):
+    app.scan_wal.start()
+    app.scan_wal.append(scan('time_in', '08:00:00 AM'))
+    app.scan_wal.append(scan('time_in', '08:01:00 AM', user_id=2))
+    app.events.publish('time_in')
+    assert not app.checkpoint_scan_wal()
+    assert len(app.scan_wal.read()) == 2
+    app.events.publish('time_in')
+    app.partition_write_failures = 1
+    assert not app.checkpoint_scan_wal()
+    app.partition_write_failures = 0
+    assert app.checkpoint_scan_wal()
+    assert app.scan_wal.read() == []
+    app.scan_wal.close()
+
+
+def test_atomic_write_checksums_and_empty_file_detection(tmp_path):
+    path = str(tmp_path / 'students.csv')
+    atomic_write(path, b'ID,Name\n1,Ann\n')
+    assert verify_checksum(path, b'ID,Name\n1,Ann\n')
+    assert not verify_checksum(path, b'ID,Name\n1,Bob\n')
+
+    # A write lost before it was fsynced: empty file, sidecar with content.
+    open(path, 'w').close()
+    restored = []
+
+    def restore_from_backup(file_path):
+        atomic_write(file_path, b'ID,Name\n9,Zoe\n')
+        restored.append(file_path)
+        return True
+
+    reader = types.SimpleNamespace(restore_from_backup=restore_from_backup, show_toast=lambda *args: None)
+    df = App.safe_read_csv(reader, path)
+    assert restored == [path] and df['Name'].tolist() == ['Zoe']